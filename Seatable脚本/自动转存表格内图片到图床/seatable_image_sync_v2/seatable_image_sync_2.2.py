@@ -2,7 +2,8 @@ from seatable_api import Base, context
 import requests
 import os
 import time
-from urllib.parse import urlparse
+from urllib.parse import urlparse, unquote
+from uuid import UUID
 import json
 import tempfile
 import logging
@@ -139,25 +140,64 @@ class ImageProcessor:
             return None
 
     def download_with_retry(self, image_url, save_path, max_retries=3):
-        """带重试机制的下载函数"""
+        """带重试机制的下载函数（保留已下载部分，重试时按Range续传）"""
+        dtable_uuid = str(UUID(self.base.dtable_uuid))
+        if dtable_uuid not in image_url:
+            logger.error("[下载] ❌ URL无效，跳过重试: url invalid.")
+            return False
+        path = unquote(image_url.split(dtable_uuid)[-1].strip('/'))
+
+        # 清空临时文件，之后的重试都在其基础上续传
+        open(save_path, 'wb').close()
         for attempt in range(max_retries):
             try:
                 logger.info(f"[下载] 第 {attempt + 1}/{max_retries} 次尝试")
-                self.base.download_file(image_url, save_path)
+                self.download_range(path, save_path)
                 return True
             except Exception as e:
-                if "url invalid" in str(e):
-                    logger.error(f"[下载] ❌ URL无效，跳过重试: {str(e)}")
-                    return False
                 if attempt < max_retries - 1:
                     wait_time = (attempt + 1) * 5  # 递增等待时间
-                    logger.warning(f"[下载] ⚠️ 下载失败，{wait_time}秒后重试: {str(e)}")
+                    logger.warning(f"[下载] ⚠️ 下载失败，{wait_time}秒后从 {os.path.getsize(save_path) / 1024:.2f}KB 处续传: {str(e)}")
                     time.sleep(wait_time)
                 else:
                     logger.error(f"[下载] ❌ 下载失败，已达到最大重试次数: {str(e)}")
                     return False
         return False
 
+    def download_range(self, path, save_path):
+        """从文件已有大小处继续下载，服务端不支持Range或返回的范围对不上时从头下载"""
+        offset = os.path.getsize(save_path)
+        download_link = self.base.get_file_download_link(path)
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        with self.session.get(download_link, headers=headers, stream=True, timeout=60) as response:
+            content_range = response.headers.get('Content-Range', '')
+            total = content_range.rpartition('/')[2]
+            total = int(total) if total.isdigit() else None
+            if response.status_code == 416 and offset:
+                if total == offset:
+                    return  # 已经下载完整
+                logger.warning(f"[下载] ⚠️ 续传范围无效 ({content_range or '无Content-Range'})，从头下载")
+                return self.restart_download(path, save_path)
+            if response.status_code not in (200, 206):
+                raise Exception(f"HTTP状态码 {response.status_code}")
+            if response.status_code == 206 and not content_range.startswith(f'bytes {offset}-'):
+                logger.warning(f"[下载] ⚠️ 续传位置不符 ({content_range or '无Content-Range'})，从头下载")
+                return self.restart_download(path, save_path)
+            if response.status_code == 200:
+                total = int(response.headers.get('Content-Length') or 0) or None
+            mode = 'ab' if response.status_code == 206 else 'wb'
+            with open(save_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+            size = os.path.getsize(save_path)
+            if total and size != total:
+                raise Exception(f"内容不完整: {size}/{total}")
+
+    def restart_download(self, path, save_path):
+        """丢弃已下载部分，不带Range重新下载"""
+        open(save_path, 'wb').close()
+        self.download_range(path, save_path)
+
     def download_image(self, image_url):
         """下载图片"""
         try:
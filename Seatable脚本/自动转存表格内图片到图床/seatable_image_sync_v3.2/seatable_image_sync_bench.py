@@ -0,0 +1,451 @@
+"""SeaTable图片同步的故障注入基准
+
+在进程内启动模拟的SeaTable接口、资源下载和图床，按固定随机种子注入超时、限流、截断、慢速、断连和坏链接，
+用 seatable_image_sync_v3.2.py 的真实流程一轮轮运行直到全部转存，统计吞吐、浪费流量和完成度；
+未按时收敛时退出码非0，可用于CI。
+
+    python3 seatable_image_sync_bench.py --sim-rows 30 --faults 429=0.05,reset=0.03
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+from uuid import uuid5, NAMESPACE_URL
+
+SYNC_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'seatable_image_sync_v3.2.py')
+
+def load_sync_module():
+    """按路径加载同步脚本（文件名含点号，不能直接 import）"""
+    if 'seatable_image_sync' in sys.modules:
+        return sys.modules['seatable_image_sync']
+    spec = importlib.util.spec_from_file_location('seatable_image_sync', SYNC_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+sync = load_sync_module()
+
+FAULT_KINDS = ('timeout', '429', 'truncate', 'drip', 'reset', 'broken')  # broken: 图床返回打不开的链接
+
+class FaultSchedule:
+    """故障注入计划：按固定随机种子为每个请求决定注入哪种故障，结果可复现"""
+    def __init__(self, spec: str = '', seed: int = 0):
+        self.rates: Dict[str, float] = {}
+        for item in filter(None, (part.strip() for part in spec.split(','))):
+            kind, _, rate = item.partition('=')
+            if kind not in FAULT_KINDS:
+                raise ValueError(f"未知的故障类型: {kind}（可选 {', '.join(FAULT_KINDS)}）")
+            self.rates[kind] = float(rate or 0)
+        self.injected = {kind: 0 for kind in self.rates}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def pick(self) -> Optional[str]:
+        """为下一个请求选择故障，None表示正常响应"""
+        with self._lock:
+            roll = self._random.random()
+            for kind, rate in self.rates.items():
+                if roll < rate:
+                    self.injected[kind] += 1
+                    return kind
+                roll -= rate
+        return None
+
+    def describe(self) -> str:
+        return ', '.join(f"{kind}={rate:.0%}" for kind, rate in self.rates.items()) or '无'
+
+class SimulatedServer:
+    """模拟的SeaTable接口、资源文件下载和图床，所有请求都按故障计划注入故障"""
+    def __init__(self, schedule: FaultSchedule, bases: int, tables: int, rows: int, image_bytes: int,
+                 timeout: float):
+        self.schedule = schedule
+        self.image_bytes = image_bytes
+        self.timeout = timeout  # 注入 timeout 故障时比客户端超时多等一会
+        self.data: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}  # dtable_uuid -> 表格 -> 行
+        self.tokens = [f'sim-{index}' for index in range(bases)]
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.uploads = 0
+        self.broken = set()  # 返回了坏链接的上传序号
+        self.version = 0  # 每次写回递增，作为行的 _mtime，供指纹查询
+        self._lock = threading.Lock()
+        for token in self.tokens:
+            dtable_uuid = SimulatedBase.uuid_for(token)
+            self.data[dtable_uuid] = {
+                f'表{table}': [
+                    {'_id': f'r{row}', '_mtime': 0, '名称': f'商品{row}',
+                     '图片': [f"https://cloud.seatable.cn/workspace/0/asset/{dtable_uuid}/images/t{table}-r{row}-{k}.png"
+                            for k in range(1 + row % 2)]}
+                    for row in range(rows)
+                ]
+                for table in range(tables)
+            }
+        server = self
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), type('SimulatedHandler', (SimulatedHandler,), {'sim': server}))
+        self.httpd.daemon_threads = True
+        self.httpd.handle_error = lambda request, client_address: None  # 注入的断连不输出异常堆栈
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def file_content(self, name: str) -> bytes:
+        """按文件名生成固定内容的PNG"""
+        seed = hashlib.sha256(name.encode()).digest()
+        body = seed * (self.image_bytes // len(seed) + 1)
+        return (b'\x89PNG\r\n\x1a\n' + body)[:self.image_bytes]
+
+    def completeness(self) -> Tuple[int, int]:
+        """已转存的图片数 / 图片总数（坏链接不计入）"""
+        done = total = 0
+        with self._lock:
+            broken = {f"{self.url}/bed/{number}.png" for number in self.broken}
+            for tables in self.data.values():
+                for rows in tables.values():
+                    for row in rows:
+                        for image in row['图片']:
+                            total += 1
+                            done += image.startswith(self.url + '/bed/') and image not in broken
+        return done, total
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class SimulatedHandler(BaseHTTPRequestHandler):
+    """模拟服务的请求处理"""
+    protocol_version = 'HTTP/1.1'
+    sim: SimulatedServer = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json',
+              fault: Optional[str] = None, headers: Optional[Dict[str, str]] = None):
+        """发送响应，按注入的故障截断、慢速发送或超时"""
+        if fault == 'timeout':
+            time.sleep(self.sim.timeout + 0.5)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if fault == 'truncate':
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        if fault == 'drip':
+            step = max(1, len(body) // 16)
+            for offset in range(0, len(body), step):
+                self.wfile.write(body[offset:offset + step])
+                self.wfile.flush()
+                time.sleep(0.05)
+        else:
+            self.wfile.write(body)
+        with self.sim._lock:
+            self.sim.bytes_sent += len(body)
+
+    def _json(self, data: Any, fault: Optional[str] = None):
+        self._send(200, json.dumps(data, ensure_ascii=False).encode(), fault=fault)
+
+    def _begin(self) -> Tuple[Optional[str], bool]:
+        """决定本次请求的故障，返回 (故障, 是否已处理完毕)"""
+        fault = self.sim.schedule.pick()
+        if fault == 'reset':
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return fault, True
+        if fault == '429':
+            self._send(429, b'{"error": "too many requests"}', headers={'Retry-After': '1'})
+            return fault, True
+        return fault, False
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        parts = parsed.path.strip('/').split('/')
+        fault, handled = self._begin()
+        if handled:
+            return
+        if parts[0] == 'files':
+            body = self.sim.file_content(parts[-1])
+            start = 0
+            if ranged := self.headers.get('Range'):
+                start = int(ranged.split('=')[1].split('-')[0])
+                headers = {'Content-Range': f'bytes {start}-{len(body) - 1}/{len(body)}'}
+                self._send(206, body[start:], 'image/png', fault, headers)
+            else:
+                self._send(200, body, 'image/png', fault)
+            return
+        if parts[0] == 'bed':
+            with self.sim._lock:
+                broken = int(parts[-1].split('.')[0]) in self.sim.broken
+            if broken:
+                self._send(404, b'{}')
+            else:
+                self._send(206, b'\x89', 'image/png', fault, {'Content-Range': 'bytes 0-0/1'})
+            return
+        tables = self.sim.data.get(parts[1] if len(parts) > 1 else '')
+        if parts[0] != 'api' or tables is None:
+            self._send(404, b'{}')
+            return
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        endpoint = parts[2]
+        if endpoint == 'metadata':
+            self._json({'tables': [{'name': name, '_id': name, 'columns': [
+                {'name': '名称', 'type': 'text'}, {'name': '图片', 'type': 'image'}]} for name in tables]}, fault)
+        elif endpoint == 'rows':
+            start, limit = int(query.get('start', 0)), int(query.get('limit', 1000))
+            with self.sim._lock:
+                rows = copy.deepcopy(tables[query['table']][start:start + limit])
+            self._json({'rows': rows}, fault)
+        elif endpoint == 'row':
+            with self.sim._lock:
+                row = next((copy.deepcopy(r) for r in tables[query['table']] if r['_id'] == query['row_id']), None)
+            self._json(row or {}, fault)
+        elif endpoint == 'download-link':
+            self._json({'download_link': f"{self.sim.url}/files/{parts[1]}/{os.path.basename(query['path'])}"}, fault)
+        else:
+            self._send(404, b'{}')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.sim._lock:
+            self.sim.bytes_received += len(body)
+        fault, handled = self._begin()
+        if handled:
+            return
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if parts[0] == 'upload':
+            with self.sim._lock:
+                self.sim.uploads += 1
+                number = self.sim.uploads
+                if fault == 'broken':
+                    self.sim.broken.add(number)
+            self._json({'url': f"{self.sim.url}/bed/{number}.png"}, fault)
+        elif parts[0] == 'api' and parts[2] == 'update':
+            data = json.loads(body)
+            with self.sim._lock:
+                tables = self.sim.data[parts[1]]
+                self.sim.version += 1
+                for row in tables[data['table']]:
+                    if row['_id'] == data['row_id']:
+                        row.update(data['row'], _mtime=self.sim.version)
+            self._json({'success': True}, fault)
+        elif parts[0] == 'api' and parts[2] == 'query':
+            # 只支持指纹用的 SELECT COUNT(*), MAX(_mtime) FROM `表名`，其它查询返回空结果
+            sql = json.loads(body)['sql']
+            with self.sim._lock:
+                rows = self.sim.data[parts[1]].get(sql.split('`')[1], []) if '`' in sql else []
+                result = ([{'COUNT(*)': len(rows), 'MAX(_mtime)': max((row['_mtime'] for row in rows), default=None)}]
+                          if sql.startswith('SELECT COUNT(*), MAX(_mtime)') else [])
+            self._json({'results': result}, fault)
+        else:
+            self._send(404, b'{}')
+
+class SimulatedBase:
+    """模拟的SeaTable客户端：接口与 seatable_api.Base 中用到的部分一致，请求发往模拟服务"""
+    def __init__(self, token: str, server_url: str, timeout: float):
+        self.token = token
+        self.server_url = server_url.rstrip('/')
+        self.timeout = timeout
+        self.dtable_uuid = self.uuid_for(token)
+
+    @staticmethod
+    def uuid_for(token: str) -> str:
+        return str(uuid5(NAMESPACE_URL, token))
+
+    def auth(self):
+        pass
+
+    def _call(self, method: str, endpoint: str, **kwargs) -> Any:
+        response = sync.http_transport.session.request(method, f"{self.server_url}/api/{self.dtable_uuid}/{endpoint}",
+                                                       timeout=self.timeout, **kwargs)
+        if response.status_code >= 400:
+            raise ConnectionError(response.status_code, response.text)
+        return response.json()
+
+    def get_metadata(self) -> Dict[str, Any]:
+        return self._call('GET', 'metadata')
+
+    def list_rows(self, table_name: str, start: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        return self._call('GET', 'rows', params={'table': table_name, 'start': start, 'limit': limit})['rows']
+
+    def get_row(self, table_name: str, row_id: str) -> Dict[str, Any]:
+        return self._call('GET', 'row', params={'table': table_name, 'row_id': row_id})
+
+    def update_row(self, table_name: str, row_id: str, row: Dict[str, Any]):
+        return self._call('POST', 'update', json={'table': table_name, 'row_id': row_id, 'row': row})
+
+    def get_file_download_link(self, path: str) -> str:
+        return self._call('GET', 'download-link', params={'path': path})['download_link']
+
+    def query(self, sql: str, convert: bool = True, parameters: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        return self._call('POST', 'query', json={'sql': sql, 'parameters': parameters or []})['results']
+
+class SimulatedManager(sync.SeaTableManager):
+    """连接模拟服务的管理器"""
+    def _init_base(self) -> SimulatedBase:
+        return SimulatedBase(self.api_token, self.config.config['seatable']['server_url'], self.http_timeout)
+
+class SimulatedContext(sync.SyncContext):
+    manager_class = SimulatedManager
+    runs_db: Optional[str] = None  # 指纹库路径，由基准指向临时目录，不写入真实运行历史
+
+    @property
+    def fingerprint_store(self) -> 'sync.RunHistoryStore':
+        if self._fingerprint_store is None:
+            self._fingerprint_store = sync.RunHistoryStore(self.runs_db or sync.RUNS_DB)
+        return self._fingerprint_store
+
+def simulated_config(server: SimulatedServer, args: argparse.Namespace) -> 'sync.Config':
+    """指向模拟服务的配置；缓存和近似检测关闭，指纹跳过与正式运行一致"""
+    config = sync.Config(bases=[{'name': f'模拟{index}', 'token': token} for index, token in enumerate(server.tokens)])
+    config.config['http']['timeout'] = args.timeout
+    config.config['seatable']['server_url'] = server.url
+    config.config['image_bed']['upload_api'] = f'{server.url}/upload'
+    config.config['cache']['max_bytes'] = 0
+    config.config['phash']['enabled'] = False
+    config.config['report']['dir'] = tempfile.mkdtemp(prefix='sync_bench_reports_')  # 不挤掉真实运行的报告
+    if args.concurrency > 0:
+        config.config['scheduler']['max_concurrency'] = args.concurrency
+    if args.table_concurrency > 0:
+        config.config['scheduler']['table_concurrency'] = args.table_concurrency
+    return config
+
+def run_pass(config: 'sync.Config', scope: 'sync.SyncScope') -> int:
+    """按 main() 的流程运行一轮：指纹跳过、并发处理表格、重试，失败记录写入 FAILED_FILE，返回跳过的base数"""
+    context = SimulatedContext(config, scope)
+    image_history = context.image_history
+    retry_managers: Dict[str, sync.SeaTableManager] = {}
+    unchanged = 0
+    try:
+        for manager, metadata in context.iter_bases():
+            if scope.is_expired() or context.api_quota.is_exhausted(manager.base_key):
+                manager.close()
+                continue
+            if context.is_base_unchanged(manager, metadata):
+                unchanged += 1
+                manager.close()
+                continue
+            try:
+                manager.process_tables([table['name'] for table in metadata.get('tables', [])
+                                        if scope.match_table(table['name'])],
+                                       config.config['scheduler']['table_concurrency'])
+                context.mark_base_synced(manager, metadata)
+            finally:
+                if manager.base_name in image_history.failed_base_names():
+                    retry_managers[manager.base_name] = manager
+                else:
+                    manager.close()
+        if not scope.is_expired():
+            sync.run_retry(context, image_history.get_failed_records(), retry_managers)
+        failed_details = image_history.get_failed_records()
+        sync.save_failed_records(failed_details, scope)
+        context.save_fingerprints(failed_details)
+        image_history.clear_all_records()
+    finally:
+        for retry_manager in retry_managers.values():
+            retry_manager.close()
+        context.api_quota.save()
+        context.report_writer.close()
+    return unchanged
+
+def run_passes(server: SimulatedServer, config: 'sync.Config', deadline: float,
+               max_passes: int) -> List[Dict[str, Any]]:
+    """按给定配置一轮轮运行，直到全部完成、达到轮数或截止时间，返回每轮的耗时、完成度、遗留失败记录数和跳过的base数"""
+    passes = []
+    while time.monotonic() < deadline and len(passes) < max_passes:
+        pass_start = time.monotonic()
+        unchanged = run_pass(config, sync.SyncScope(time_budget=max(0.1, deadline - pass_start)))
+        done, total = server.completeness()
+        passes.append({'duration': time.monotonic() - pass_start, 'done': done, 'total': total,
+                       'failed': len(sync.load_failed_records()), 'unchanged': unchanged})
+        if done == total:
+            break
+    return passes
+
+def run_fault_bench(args: argparse.Namespace) -> bool:
+    """在模拟服务上注入故障跑完整流程，统计吞吐、浪费流量和最终完成度，返回是否按时收敛"""
+    schedule = FaultSchedule(args.faults, args.seed)
+    server = SimulatedServer(schedule, args.sim_bases, args.sim_tables, args.sim_rows, args.image_kb * 1024,
+                             args.timeout)
+    config = simulated_config(server, args)
+    state_dir = tempfile.mkdtemp(prefix='sync_bench_state_')  # 失败记录和指纹库，不影响真实运行
+    failed_file = sync.FAILED_FILE
+    sync.FAILED_FILE = os.path.join(state_dir, 'failed.json')
+    SimulatedContext.runs_db = os.path.join(state_dir, 'runs.db')
+    level = sync.logger.level
+    if not args.verbose:
+        sync.logger.setLevel(logging.WARNING)
+
+    start = time.monotonic()
+    try:
+        passes = run_passes(server, config, start + args.deadline, args.max_passes)
+    finally:
+        sync.logger.setLevel(level)
+        sync.FAILED_FILE = failed_file
+        SimulatedContext.runs_db = None
+        server.close()
+        sync.cleanup_temp_files()
+        shutil.rmtree(config.config['report']['dir'], ignore_errors=True)
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    elapsed = time.monotonic() - start
+    done, total = server.completeness()
+    useful = done * server.image_bytes
+    converged = done == total
+    transport = sync.http_transport.snapshot()
+    size = sync.ImageProcessor.format_file_size
+    lines = [
+        "=" * 50,
+        "故障注入基准",
+        "=" * 50,
+        f"规模: {args.sim_bases} 个base x {args.sim_tables} 个表格 x {args.sim_rows} 行, 共 {total} 张图片, 每张 {args.image_kb}KB",
+        f"故障: {schedule.describe()} (种子 {args.seed}, 请求超时 {args.timeout}秒)",
+        f"已注入: {', '.join(f'{kind} {count}次' for kind, count in schedule.injected.items()) or '无'}",
+    ]
+    for index, result in enumerate(passes, 1):
+        lines.append(f"第{index}轮: 耗时 {result['duration']:.2f}秒, 完成 {result['done']}/{result['total']}, "
+                     f"遗留失败 {result['failed']}条, 跳过未变化base {result['unchanged']}个")
+    lines.extend([
+        f"总耗时: {elapsed:.2f}秒, 吞吐 {done / elapsed:.2f} 张/秒" if elapsed > 0 else "总耗时: -",
+        f"下载流量: 发送 {size(server.bytes_sent)}, 有效 {size(useful)}, 浪费 {size(max(0, server.bytes_sent - useful))}",
+        f"上传: {server.uploads} 次 (重复 {max(0, server.uploads - done)} 次), 接收 {size(server.bytes_received)}",
+        f"连接: 请求 {transport['requests']}次, 新建 {transport['connections']}个, 复用率 {transport['reuse_rate']:.1%}",
+        f"完成度: {done}/{total} ({done / total:.1%})" if total else "完成度: -",
+        f"收敛: {'✅' if converged else '❌'} {len(passes)} 轮, 截止时间 {args.deadline:.0f}秒"
+    ])
+    print("\n".join(lines))
+    return converged
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """命令行参数"""
+    parser = argparse.ArgumentParser(description='SeaTable图片同步故障注入基准：使用模拟的SeaTable和图床，不访问真实服务')
+    parser.add_argument('--faults', default='timeout=0.02,429=0.05,truncate=0.05,drip=0.05,reset=0.03',
+                        help=f"故障比例，如 429=0.05,reset=0.03（可选 {'/'.join(FAULT_KINDS)}）")
+    parser.add_argument('--seed', type=int, default=1, help='故障计划随机种子')
+    parser.add_argument('--sim-bases', type=int, default=2, help='模拟base数')
+    parser.add_argument('--sim-tables', type=int, default=2, help='每个base的表格数')
+    parser.add_argument('--sim-rows', type=int, default=100, help='每个表格的行数')
+    parser.add_argument('--image-kb', type=int, default=200, help='模拟图片大小（KB）')
+    parser.add_argument('--timeout', type=float, default=2.0, help='请求超时（秒）')
+    parser.add_argument('--deadline', type=float, default=300, help='收敛截止时间（秒）')
+    parser.add_argument('--max-passes', type=int, default=5, help='最多运行几轮')
+    parser.add_argument('--concurrency', type=int, default=0, metavar='N', help='并发上限')
+    parser.add_argument('--table-concurrency', type=int, default=0, metavar='N', help='同一base内并发处理的表格数')
+    parser.add_argument('--verbose', action='store_true', help='输出处理日志')
+    return parser
+
+if __name__ == '__main__':
+    sys.exit(0 if run_fault_bench(build_arg_parser().parse_args()) else 1)
@@ -1,19 +1,50 @@
 import os
+import re
+import sys
+import copy
+import csv
 import json
-import time
 import queue
+import random
+import time
+import shutil
+import heapq
+import hashlib
+import hmac
+import itertools
+import sqlite3
+import statistics
 import logging
+import signal
+import socket
+import fnmatch
+import argparse
 import tempfile
+import tracemalloc
 import threading
+from contextlib import closing, contextmanager
 import requests
-from typing import Dict, List, Optional, Any, Callable
-from urllib.parse import urlparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
-from requests.adapters import HTTPAdapter
+from collections import Counter, deque, OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Any, Callable, Tuple
+from urllib.parse import urlparse, unquote, parse_qs
+from uuid import UUID
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.packages import urllib3
+from requests.packages.urllib3 import PoolManager
+from requests.packages.urllib3.connection import HTTPConnection, HTTPSConnection
+from requests.packages.urllib3.exceptions import ConnectTimeoutError, NewConnectionError
 from requests.packages.urllib3.util.retry import Retry
 from seatable_api import Base
 
+try:
+    from PIL import Image  # 可选：近似重复图片检测
+except ImportError:
+    Image = None
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -24,12 +55,108 @@ logger = logging.getLogger(__name__)
 
 # 常量定义
 TEMP_DIR = '/ql/scripts/.temp'
-STATS_FILE = '/ql/scripts/.stats/seatable_image_sync_stats.json'
+STATS_DIR = '/ql/scripts/.stats'
+RUNS_DB = os.path.join(STATS_DIR, 'seatable_image_sync_runs.db')  # 运行历史数据库
+PROFILE_DIR = os.path.join(STATS_DIR, 'profiles')  # --profile 输出目录
+PROFILE_INTERVAL = 0.005  # 采样间隔（秒）
+MEMORY_TOP_SITES = 10  # 内存报告中列出的分配位置数
+REGRESSION_WINDOW = 10  # 吞吐基线取最近多少次运行
+REGRESSION_THRESHOLD = 0.5  # 吞吐低于基线的该比例时告警
+AUDIT_INTERVAL_HOURS = 24  # 指纹未变化的base每隔多久强制全量检查一次（小时），0表示每次都全量检查
+FAILED_FILE = os.path.join(STATS_DIR, 'seatable_image_sync_failed.json')  # 失败记录，供 retry 命令使用
+CACHE_DIR = '/ql/scripts/.cache/seatable_image_sync'  # 已下载图片缓存目录
+CACHE_MAX_SIZE = 500 * 1024 * 1024  # 缓存容量上限 500MB
+MAPPING_FIELDS = ['original_url', 'new_url', 'content_hash', 'size', 'base_name', 'table_name', 'column_name', 'timestamp']
+PHASH_DB = os.path.join(STATS_DIR, 'seatable_image_sync_phash.db')  # 感知哈希索引
+PHASH_AUDIT_FILE = os.path.join(STATS_DIR, 'seatable_image_sync_phash_audit.jsonl')  # 近似重复复用记录
+PHASH_MAX_DISTANCE = 4  # 64位dHash的汉明距离不超过该值视为同一张图片
+RECLAIM_UNDO_FILE = os.path.join(STATS_DIR, 'seatable_image_sync_reclaim_undo.jsonl')  # 素材回收撤销记录
+RECLAIM_BATCH_SIZE = 20  # 每批删除的素材数
+RECLAIM_BATCH_DELAY = 5.0  # 批次间隔（秒）
+ASSET_DELETE_API = '/api/v2.1/dtable/app-asset/'  # 删除base素材的接口（SDK未提供，与 app-download-link 同一组接口）
+REPORT_DIR = os.path.join(STATS_DIR, 'reports')  # 详细报告目录（JSONL，运行中逐条写入）
+REPORT_KEEP = 20  # 保留最近多少次运行的报告（含按大小拆分的文件）
+REPORT_MAX_BYTES = 50 * 1024 * 1024  # 单个报告文件超过该大小后换新文件
+REPORT_TOP_ERRORS = 5  # 通知中列出的失败原因数
+REPORT_NAME_PATTERN = re.compile(r'^seatable_image_sync_(\d{8}_\d{6})(?:\.\d+)?\.jsonl$')  # 报告文件名，分组为运行时间戳
 IMAGE_BED_URL = 'https://img.shuang.fun/api/tgchannel'
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
-REQUEST_DELAY = 1  # 请求延迟（秒）
-MAX_WORKERS = 3  # 最大工作线程数
-MAX_QUEUE_SIZE = 1000  # 最大队列大小
+API_DAILY_BUDGET = 0  # 每个base每日SeaTable API调用预算，0表示不限制
+API_BUDGET_SLOWDOWN = 0.8  # 当日用量超过预算的该比例后逐步放慢调用
+QUOTA_MAX_DELAY = 1.0  # API预算接近用尽时每次调用的最长等待（秒）
+HTTP_TIMEOUT = 60  # 下载和上传的请求超时（秒）
+DNS_CACHE_TTL = 300  # DNS解析结果缓存时间（秒）
+DNS_CACHE_SIZE = 256  # DNS缓存最多保留的主机数
+# DNS缓存要替换urllib3的建连钩子（_new_conn/_new_pool/_dns_host 均为内部接口），只在验证过的版本范围内启用
+DNS_CACHE_URLLIB3 = ((2, 0), (3, 0))  # 验证过的urllib3版本 [下限, 上限)
+URLLIB3_VERSION = tuple(map(int, re.findall(r'\d+', urllib3.__version__)[:2]))
+DNS_CACHE_SUPPORTED = (DNS_CACHE_URLLIB3[0] <= URLLIB3_VERSION < DNS_CACHE_URLLIB3[1]
+                       and hasattr(HTTPConnection, '_new_conn') and hasattr(PoolManager, '_new_pool'))
+VERIFY_SAMPLE_RATE = 1.0  # 上传后校验图床链接的抽样比例，0表示不校验
+VERIFY_CONCURRENCY = 4  # 图床链接校验并发数
+VERIFY_CACHE_SIZE = 100000  # 最多缓存多少个链接的校验结果
+NOTIFY_URL = 'http://localhost:5700/api/sendNotify'  # 青龙面板通知接口
+INITIAL_CONCURRENCY = 3  # 初始并发数
+MIN_CONCURRENCY = 1  # 自适应并发下限
+MAX_CONCURRENCY = 12  # 自适应并发上限
+TABLE_CONCURRENCY = 2  # 同一base内同时处理的表格数
+DOWNLOAD_LATENCY_TARGET = 5.0  # 下载延迟目标（秒）
+UPLOAD_LATENCY_TARGET = 15.0  # 上传延迟目标（秒）
+ERROR_RATE_TARGET = 0.1  # 错误率目标
+THROTTLE_STATUS_CODES = {429, 500, 502, 503, 504}  # 触发降并发的状态码
+THROTTLE_COOLDOWN = 5.0  # 降并发后的冷却时间（秒），期间再遇到限流不重复减半
+INFLIGHT_BYTES_BUDGET = 128 * 1024 * 1024  # 下载到上传完成之间在途图片的总字节上限
+SKIP_COLUMNS = {'产品图片'}  # 不处理的图片列
+
+# 守护模式
+DAEMON_HOST = '127.0.0.1'  # webhook监听地址
+DAEMON_PORT = 8765  # webhook监听端口
+DAEMON_POLL_INTERVAL = 30  # 轮询_mtime间隔（秒），0表示只接收webhook
+DAEMON_BATCH_WINDOW = 2.0  # 微批聚合窗口（秒）
+DAEMON_BATCH_SIZE = 200  # 单批最多处理行数
+DAEMON_OWN_WRITES = 10000  # 守护模式记住最近多少次自身回写，轮询时跳过只因回写而变化的行
+DAEMON_RETRY_INTERVAL = 600  # 守护模式重试失败记录的间隔（秒），0表示不重试
+MAX_QUEUE_SIZE = 1000  # 每个优先级通道的最大队列长度
+UNKNOWN_IMAGE_COST = 1024 * 1024  # 大小未知的图片按该字节数估算成本
+FRESH_ROW_SECONDS = 3600  # 该时间内修改过的行视为新行（秒）
+SNIFF_SIZE = 32  # 识别文件类型所需的文件头字节数
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # 下载分块大小
+DOWNLOAD_RESUME_ATTEMPTS = 3  # 下载中断后按Range续传的最大次数
+ROW_PAGE_SIZE = 1000  # 每页读取行数
+ROW_PREFETCH_PAGES = 2  # 后台最多提前读取的页数
+ROW_UPDATE_BATCH = 500  # 每列最多同时等待回写的行数，超过后先等较早的行完成
+SNIFF_CACHE_SIZE = 100000  # 内容识别结果最多缓存的URL数
+
+# 图片文件签名（魔数）: (签名, 扩展名, MIME类型)
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', '.jpg', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', '.png', 'image/png'),
+    (b'GIF87a', '.gif', 'image/gif'),
+    (b'GIF89a', '.gif', 'image/gif'),
+    (b'BM', '.bmp', 'image/bmp'),
+    (b'II*\x00', '.tiff', 'image/tiff'),
+    (b'MM\x00*', '.tiff', 'image/tiff'),
+    (b'\x00\x00\x01\x00', '.ico', 'image/x-icon'),
+]
+
+# ISO-BMFF 容器(ftyp)中的图片品牌: 品牌 -> (扩展名, MIME类型)
+IMAGE_FTYP_BRANDS = {
+    b'avif': ('.avif', 'image/avif'),
+    b'avis': ('.avif', 'image/avif'),
+    b'heic': ('.heic', 'image/heic'),
+    b'heix': ('.heic', 'image/heic'),
+    b'mif1': ('.heif', 'image/heif'),
+}
+
+# 任务优先级通道（数值越小越优先）
+LANE_FRESH = 0  # 新修改的行
+LANE_RETRY = 1  # 失败重试
+LANE_BACKFILL = 2  # 存量回填
+LANE_NAMES = {
+    LANE_FRESH: '新行',
+    LANE_RETRY: '重试',
+    LANE_BACKFILL: '回填'
+}
 
 # 需要处理的域名列表
 PROCESS_DOMAINS = [
@@ -39,7 +166,7 @@ PROCESS_DOMAINS = [
 
 # 创建必要的目录
 os.makedirs(TEMP_DIR, exist_ok=True)
-os.makedirs(os.path.dirname(STATS_FILE), exist_ok=True)
+os.makedirs(STATS_DIR, exist_ok=True)
 
 # 全局统计数据
 stats = {
@@ -51,9 +178,187 @@ stats = {
     'failed': 0,
     'ignored_domain': 0,
     'from_history': 0,
+    'deduplicated': 0,
+    'near_duplicate': 0,
+    'unchanged_bases': 0,
+    'deferred': 0,
+    'verify_failed': 0,
     'details': {}
 }
 
+class RunMetrics:
+    """单次运行指标：按base统计各阶段耗时、字节数、API调用和错误"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bases: Dict[str, Dict[str, Any]] = {}
+        self.stage_times: Dict[str, float] = {}
+        self._active: Dict[int, List[str]] = {}  # 线程ID -> 正在执行的阶段（供采样分析标记）
+
+    def _base(self, base_name: str) -> Dict[str, Any]:
+        """获取base的指标（需持有锁）"""
+        if base_name not in self.bases:
+            self.bases[base_name] = {
+                'images': 0,
+                'success': 0,
+                'failed': 0,
+                'bytes_down': 0,
+                'bytes_up': 0,
+                'api_calls': 0,
+                'errors': 0,
+                'stage_times': {}
+            }
+        return self.bases[base_name]
+
+    @contextmanager
+    def stage(self, base_name: Optional[str], stage: str):
+        """统计一个阶段的耗时；base_name为None时只计入全局"""
+        start = time.monotonic()
+        failed = False
+        ident = threading.get_ident()
+        with self._lock:
+            self._active.setdefault(ident, []).append(stage)
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                stages = self._active[ident]
+                stages.pop()
+                if not stages:
+                    del self._active[ident]
+                self.stage_times[stage] = self.stage_times.get(stage, 0.0) + elapsed
+                if base_name is not None:
+                    base = self._base(base_name)
+                    base['stage_times'][stage] = base['stage_times'].get(stage, 0.0) + elapsed
+                    if failed:
+                        base['errors'] += 1
+
+    def current_stage(self, ident: int) -> Optional[str]:
+        """某线程当前所处的阶段"""
+        with self._lock:
+            stages = self._active.get(ident)
+            return stages[-1] if stages else None
+
+    def add_bytes(self, base_name: str, down: int = 0, up: int = 0):
+        """累计下载/上传字节数"""
+        with self._lock:
+            base = self._base(base_name)
+            base['bytes_down'] += down
+            base['bytes_up'] += up
+
+    def add_api_call(self, base_name: str):
+        """记录一次SeaTable API调用"""
+        with self._lock:
+            self._base(base_name)['api_calls'] += 1
+
+    def revoke_success(self, base_name: str):
+        """撤销一次成功记录（上传结果未通过校验，随后会按失败重新记录）"""
+        with self._lock:
+            base = self._base(base_name)
+            base['images'] -= 1
+            base['success'] -= 1
+
+    def add_image(self, base_name: str, success: bool):
+        """记录一张图片的处理结果"""
+        with self._lock:
+            base = self._base(base_name)
+            base['images'] += 1
+            if success:
+                base['success'] += 1
+            else:
+                base['failed'] += 1
+                base['errors'] += 1
+
+    def totals(self) -> Dict[str, int]:
+        """所有base的合计"""
+        with self._lock:
+            keys = ('images', 'success', 'failed', 'bytes_down', 'bytes_up', 'api_calls', 'errors')
+            return {key: sum(base[key] for base in self.bases.values()) for key in keys}
+
+# 全局运行指标
+metrics = RunMetrics()
+
+class SamplingProfiler:
+    """采样分析：定时抓取所有线程的调用栈，按线程和阶段汇总，输出可直接生成火焰图的折叠栈文件"""
+    MAX_DEPTH = 64
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, output_dir: str = PROFILE_DIR):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.samples: Dict[Tuple[str, str, Tuple[str, ...]], int] = {}  # (线程名, 阶段, 调用栈) -> 采样数
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sync-profiler', daemon=True)
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.MAX_DEPTH:
+                    stack.append(self._frame_label(frame))
+                    frame = frame.f_back
+                key = (names.get(ident, str(ident)), metrics.current_stage(ident) or '-', tuple(reversed(stack)))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Optional[str]:
+        """停止采样并写出结果，返回输出目录"""
+        self._stop.set()
+        self._thread.join()
+        if not self.samples:
+            return None
+        run_dir = os.path.join(self.output_dir, time.strftime('%Y%m%d-%H%M%S'))
+        os.makedirs(run_dir, exist_ok=True)
+
+        # 折叠栈：线程;stage:阶段;调用栈 采样数
+        with open(os.path.join(run_dir, 'collapsed.txt'), 'w') as f:
+            for (thread_name, stage, stack), count in sorted(self.samples.items()):
+                f.write(';'.join((thread_name, f'stage:{stage}') + stack) + f' {count}\n')
+
+        # 每个线程的阶段分布和自身耗时最多的函数
+        by_thread: Dict[str, Dict[Tuple[str, Tuple[str, ...]], int]] = {}
+        for (thread_name, stage, stack), count in self.samples.items():
+            by_thread.setdefault(thread_name, {})[(stage, stack)] = count
+        for thread_name, samples in by_thread.items():
+            total = sum(samples.values())
+            stages: Dict[str, int] = {}
+            leaves: Dict[str, int] = {}
+            for (stage, stack), count in samples.items():
+                stages[stage] = stages.get(stage, 0) + count
+                if stack:
+                    leaves[stack[-1]] = leaves.get(stack[-1], 0) + count
+            lines = [f"线程: {thread_name}", f"采样数: {total} (间隔 {self.interval * 1000:.0f}ms)", "", "阶段分布:"]
+            lines.extend(f"  {stage:<12}{count:>8} {count / total:>7.1%}"
+                         for stage, count in sorted(stages.items(), key=lambda item: -item[1]))
+            lines.extend(["", "自身耗时最多的函数:"])
+            lines.extend(f"  {count:>8} {count / total:>7.1%}  {leaf}"
+                         for leaf, count in sorted(leaves.items(), key=lambda item: -item[1])[:30])
+            safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in thread_name)
+            with open(os.path.join(run_dir, f'thread-{safe_name}.txt'), 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+        return run_dir
+
+    def stage_summary(self) -> Dict[str, int]:
+        """各阶段的采样数（不含未标记阶段）"""
+        totals: Dict[str, int] = {}
+        for (_, stage, _), count in self.samples.items():
+            if stage != '-':
+                totals[stage] = totals.get(stage, 0) + count
+        return totals
+
 @dataclass
 class ImageTask:
     """图片处理任务"""
@@ -64,30 +369,141 @@ class ImageTask:
     base_name: str
     row_data: str = ''
     callback: Optional[Callable] = None
+    lane: int = LANE_BACKFILL
+    cost: int = 0  # 估算成本，同一通道内成本低的先执行
+    source: str = ''  # 成功时结果的来源（统计项名），链接校验失败时据此回退统计
+
+@dataclass
+class SyncScope:
+    """同步范围：base/表格/列的包含与排除规则（支持通配符），以及时间预算"""
+    bases: List[str] = field(default_factory=list)
+    exclude_bases: List[str] = field(default_factory=list)
+    tables: List[str] = field(default_factory=list)
+    exclude_tables: List[str] = field(default_factory=list)
+    columns: List[str] = field(default_factory=list)
+    exclude_columns: List[str] = field(default_factory=list)
+    time_budget: float = 0  # 时间预算（秒），0表示不限制
+    full_audit: bool = False  # 忽略指纹，强制全量检查
+    started_at: float = field(default_factory=time.time)
+    expired: bool = field(default=False, init=False)  # 收到终止信号时提前结束
+
+    @staticmethod
+    def _match(name: str, include: List[str], exclude: List[str]) -> bool:
+        if include and not any(fnmatch.fnmatchcase(name, pattern) for pattern in include):
+            return False
+        return not any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude)
+
+    def match_base(self, name: str) -> bool:
+        return self._match(name, self.bases, self.exclude_bases)
+
+    def match_table(self, name: str) -> bool:
+        return self._match(name, self.tables, self.exclude_tables)
+
+    def match_column(self, name: str) -> bool:
+        # 默认跳过的列只有被显式指定时才处理
+        if name in SKIP_COLUMNS and name not in self.columns:
+            return False
+        return self._match(name, self.columns, self.exclude_columns)
+
+    def match_record(self, record: Dict[str, Any]) -> bool:
+        """失败记录是否在范围内"""
+        return (self.match_base(record.get('base_name', '')) and self.match_table(record.get('table_name', ''))
+                and self.match_column(record.get('column_name', '')))
+
+    def is_expired(self) -> bool:
+        """时间预算是否已用尽"""
+        return self.expired or (self.time_budget > 0 and time.time() - self.started_at >= self.time_budget)
+
+    def expire(self, *_):
+        """立即结束时间预算（可作为信号处理函数）"""
+        if not self.expired:
+            logger.warning("[主程序] ⏰ 收到终止信号，停止开始新的工作")
+        self.expired = True
+
+    def covers_all(self, column_names: Optional[Iterable[str]] = None) -> bool:
+        """是否完整处理了所有表格和列（无过滤且未超出时间预算）；给出的列名中有默认跳过的列时也不算"""
+        filters = (self.bases, self.exclude_bases, self.tables, self.exclude_tables, self.columns, self.exclude_columns)
+        if any(filters) or self.is_expired():
+            return False
+        return column_names is None or not any(name in SKIP_COLUMNS for name in column_names)
 
 class TaskQueue:
-    """任务队列管理"""
+    """任务队列管理（按优先级通道出队，通道内按估算成本从低到高，通道满时阻塞生产者）"""
     def __init__(self, max_size: int = MAX_QUEUE_SIZE):
-        self.queue = queue.Queue(maxsize=max_size)
+        self.max_size = max_size
+        self._lanes: Dict[int, List[Tuple[int, int, ImageTask]]] = {lane: [] for lane in sorted(LANE_NAMES)}
+        self._sequence = itertools.count()  # 成本相同时保持提交顺序
         self._active = True
+        self._unfinished = 0
         self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
 
-    def put(self, task: ImageTask):
-        """添加任务到队列"""
-        if self._active:
-            self.queue.put(task)
+    def put(self, task: ImageTask) -> bool:
+        """添加任务到队列，对应通道已满时阻塞等待"""
+        with self._not_full:
+            lane = self._lanes[task.lane]
+            while self._active and len(lane) >= self.max_size:
+                self._not_full.wait(timeout=1)
+            if not self._active:
+                return False
+            heapq.heappush(lane, (task.cost, next(self._sequence), task))
+            self._unfinished += 1
+            self._not_empty.notify()
+            return True
 
-    def get(self) -> Optional[ImageTask]:
-        """从队列获取任务"""
-        try:
-            return self.queue.get(timeout=1)
-        except queue.Empty:
-            return None
+    def get(self, timeout: float = 1) -> Optional[ImageTask]:
+        """从队列获取优先级最高的任务"""
+        with self._not_empty:
+            deadline = time.monotonic() + timeout
+            while not any(self._lanes.values()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._active:
+                    return None
+                self._not_empty.wait(remaining)
+            for lane in self._lanes.values():
+                if lane:
+                    task = heapq.heappop(lane)[-1]
+                    self._not_full.notify_all()
+                    return task
+        return None
+
+    def task_done(self):
+        """标记一个任务处理完成"""
+        with self._all_done:
+            self._unfinished -= 1
+            if self._unfinished <= 0:
+                self._unfinished = 0
+                self._all_done.notify_all()
+
+    def join(self):
+        """等待所有已入队任务处理完成"""
+        with self._all_done:
+            while self._unfinished:
+                self._all_done.wait()
+
+    def drain_pending(self) -> List[ImageTask]:
+        """取出所有尚未开始的任务"""
+        with self._lock:
+            pending = []
+            for lane in self._lanes.values():
+                pending.extend(entry[-1] for entry in sorted(lane))
+                lane.clear()
+            self._not_full.notify_all()
+            return pending
+
+    def sizes(self) -> Dict[str, int]:
+        """各通道当前排队数"""
+        with self._lock:
+            return {LANE_NAMES[lane]: len(tasks) for lane, tasks in self._lanes.items()}
 
     def stop(self):
         """停止任务队列"""
         with self._lock:
             self._active = False
+            self._not_full.notify_all()
+            self._not_empty.notify_all()
 
     @property
     def is_active(self) -> bool:
@@ -95,11 +511,427 @@ class TaskQueue:
         with self._lock:
             return self._active
 
+class TaskScheduler:
+    """任务调度器：工作线程按优先级从TaskQueue取任务执行"""
+    def __init__(self, task_queue: TaskQueue, handler: Callable[[ImageTask], Optional[str]],
+                 workers: int = INITIAL_CONCURRENCY, is_expired: Optional[Callable[[], bool]] = None):
+        self.task_queue = task_queue
+        self.handler = handler
+        self.workers = workers
+        self.is_expired = is_expired or (lambda: False)
+        self.deferred = 0  # 时间预算用尽后推迟到下次运行的任务数
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动工作线程"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'sync-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"[调度] 🚀 启动 {self.workers} 个工作线程")
+
+    def submit(self, task: ImageTask) -> bool:
+        """提交任务，队列已停止或时间预算用尽时返回False"""
+        if self.is_expired():
+            with self._lock:
+                self.deferred += 1
+            return False
+        self.start()
+        return self.task_queue.put(task)
+
+    def wait_idle(self):
+        """等待所有已提交的任务完成"""
+        self.task_queue.join()
+
+    def _worker(self):
+        """工作线程主循环"""
+        while not (self._stopping.is_set() and not any(self.task_queue.sizes().values())):
+            task = self.task_queue.get(timeout=1)
+            if task is None:
+                continue
+            if self.is_expired():
+                # 时间预算用尽：不再开始新任务，未开始的任务以无结果完成，已完成的行照常回写
+                self._defer([task] + self.task_queue.drain_pending())
+                continue
+            result = None
+            try:
+                result = self.handler(task)
+            except Exception as e:
+                logger.error(f"[调度] ❌ 任务执行出错 {task.url}: {str(e)}")
+            finally:
+                self._finish(task, result)
+
+    def _finish(self, task: ImageTask, result: Optional[str]):
+        """执行任务回调并标记完成"""
+        try:
+            if task.callback:
+                task.callback(task, result)
+        except Exception as e:
+            logger.error(f"[调度] ❌ 任务回调出错 {task.url}: {str(e)}")
+        finally:
+            self.task_queue.task_done()
+
+    def _defer(self, tasks: List[ImageTask]):
+        """推迟未开始的任务"""
+        for task in tasks:
+            self._finish(task, None)
+        with self._lock:
+            self.deferred += len(tasks)
+        logger.warning(f"[调度] ⏰ 预算用尽，推迟 {len(tasks)} 个未开始的任务")
+
+    def stop(self, drain: bool = True):
+        """停止调度器；drain为True时先处理完已入队任务，否则放弃未开始的任务"""
+        if not drain:
+            dropped = self.task_queue.drain_pending()
+            for task in dropped:
+                self._finish(task, None)
+            if dropped:
+                logger.warning(f"[调度] ⚠️ 放弃 {len(dropped)} 个未开始的任务")
+        self.task_queue.join()
+        self._stopping.set()
+        self.task_queue.stop()
+        with self._lock:
+            for thread in self._threads:
+                thread.join(timeout=5)
+            self._threads = []
+
+class RowPager:
+    """行数据预读：后台线程连续读取后续页面，最多提前 lookahead 页"""
+    _DONE = object()
+
+    def __init__(self, manager: 'SeaTableManager', table_name: str, page_size: int = ROW_PAGE_SIZE,
+                 lookahead: int = ROW_PREFETCH_PAGES):
+        self.manager = manager
+        self.table_name = table_name
+        self.page_size = page_size
+        self._pages = queue.Queue(maxsize=max(1, lookahead))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fetch, name=f'pager-{table_name}', daemon=True)
+
+    def __enter__(self) -> 'RowPager':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        """按顺序产出每页的行，读取出错时在调用方抛出"""
+        while True:
+            page = self._pages.get()
+            if page is self._DONE:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+
+    def _put(self, item: Any) -> bool:
+        """放入队列，预读已满时等待消费或停止"""
+        while not self._stop.is_set():
+            try:
+                self._pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch(self):
+        """后台读取线程"""
+        start = 0
+        try:
+            while not self._stop.is_set():
+                with metrics.stage(self.manager.base_name, 'list_rows'):
+                    rows = self.manager.client.list_rows(self.table_name, start=start, limit=self.page_size)
+                if not rows or not self._put(rows):
+                    break
+                start += len(rows)
+                if len(rows) < self.page_size:
+                    break
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(self._DONE)
+
+    def close(self):
+        """停止预读（提前结束时调用）"""
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+class RowUpdate:
+    """行级回写：一行内所有图片任务完成后统一更新该行"""
+    def __init__(self, manager: 'SeaTableManager', table_name: str, column_name: str,
+                 row_id: str, row_info: str, images: List[Any]):
+        self.manager = manager
+        self.table_name = table_name
+        self.column_name = column_name
+        self.row_id = row_id
+        self.row_info = row_info
+        self.images = list(images)
+        self.new_images = list(images)
+        self.tasks: List[Optional[ImageTask]] = [None] * len(images)
+        self._pending = len(images)
+        self._updated = False
+        self.committed = False  # 是否已回写到SeaTable
+        self._lock = threading.Lock()
+        self.done = threading.Event()
+        if not images:
+            self.done.set()
+
+    def make_callback(self, index: int) -> Callable:
+        """生成第index张图片的任务回调"""
+        def callback(task: ImageTask, new_url: Optional[str]):
+            self.tasks[index] = task
+            self.complete(index, new_url)
+        return callback
+
+    def complete(self, index: int, new_url: Optional[str]):
+        """记录单张图片结果，全部完成后回写"""
+        with self._lock:
+            original = self.new_images[index]
+            original_url = original.get('url', '') if isinstance(original, dict) else original
+            # 已在图床中的图片会原样返回，只有链接变化时才需要回写
+            if new_url and new_url != original_url:
+                self.new_images[index] = new_url
+                self._updated = True
+            self._pending -= 1
+            finished = self._pending <= 0
+        if not finished:
+            return
+        verifier = self.manager.verifier
+        if self._updated and verifier:
+            # 新链接校验通过后再回写；校验在独立线程进行，不占用工作线程
+            changed = [new for new, image in zip(self.new_images, self.images) if new is not image]
+            verifier.when_verified(changed, self._commit_verified)
+            return
+        self._commit()
+
+    def _commit_verified(self, results: Dict[str, bool]):
+        """校验未通过的图片保留原图，其余照常回写"""
+        try:
+            for index, image in enumerate(self.images):
+                new_url = self.new_images[index]
+                if new_url is not image and not results.get(new_url, True):
+                    self.new_images[index] = image
+                    self.manager.reject_upload(self.tasks[index], new_url)
+            self._updated = any(new is not image for new, image in zip(self.new_images, self.images))
+        except Exception as e:
+            logger.error(f"[校验] ❌ 处理校验结果出错: {str(e)}")
+        self._commit()
+
+    def _commit(self):
+        try:
+            if self._updated:
+                self.committed = self.manager.commit_row(self.table_name, self.row_id, self.column_name,
+                                                         self.new_images, self.row_info)
+                if self.manager.reclaimer:
+                    self.manager.reclaimer.note_row(self, self.committed)
+        finally:
+            self.done.set()
+
+class AdaptiveLimiter:
+    """AIMD自适应并发限制：延迟和错误率达标时加性增加，遇到限流或服务端错误时减半"""
+    def __init__(self, name: str, initial: int, min_limit: int, max_limit: int,
+                 latency_target: float, error_target: float = ERROR_RATE_TARGET, window: int = 20,
+                 cooldown: float = THROTTLE_COOLDOWN):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.error_target = error_target
+        self.cooldown = cooldown
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._in_flight = 0
+        self._peak = 0
+        self._throttled = 0
+        self._requests = 0
+        self._errors = 0
+        self._total_latency = 0.0
+        self._samples = deque(maxlen=window)
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        """当前并发限制"""
+        with self._cond:
+            return int(self._limit)
+
+    def acquire(self):
+        """获取一个并发名额"""
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+            self._peak = max(self._peak, self._in_flight)
+
+    def release(self, latency: float, ok: bool = True, status: Optional[int] = None):
+        """归还名额并根据结果调整并发限制"""
+        with self._cond:
+            self._in_flight -= 1
+            self._requests += 1
+            self._total_latency += latency
+            if not ok:
+                self._errors += 1
+            self._samples.append((latency, ok))
+            old_limit = int(self._limit)
+            if status in THROTTLE_STATUS_CODES:
+                self._decrease(status)
+            elif ok and self._healthy():
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._cond.notify_all()
+            new_limit = int(self._limit)
+        if new_limit > old_limit:
+            logger.info(f"[并发] 📈 {self.name}并发提升: {old_limit} -> {new_limit}")
+
+    def on_throttle(self, status: int):
+        """遇到限流或服务端错误（包括会话内部重试时）降低并发"""
+        with self._cond:
+            self._decrease(status)
+
+    def _decrease(self, status: int):
+        """乘性减少，冷却时间内只减一次，避免同一波错误连续减半"""
+        now = time.monotonic()
+        self._throttled += 1
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        old_limit = int(self._limit)
+        self._limit = max(float(self.min_limit), self._limit / 2)
+        self._samples.clear()
+        logger.warning(f"[并发] 📉 {self.name}遇到状态码 {status}，并发降低: {old_limit} -> {int(self._limit)}")
+
+    def _healthy(self) -> bool:
+        """最近窗口内的延迟和错误率是否在目标内"""
+        if len(self._samples) < min(5, self._samples.maxlen):
+            return True
+        latencies = [latency for latency, _ in self._samples]
+        errors = sum(1 for _, ok in self._samples if not ok)
+        avg_latency = sum(latencies) / len(latencies)
+        return avg_latency <= self.latency_target and errors / len(self._samples) <= self.error_target
+
+    @contextmanager
+    def slot(self):
+        """占用一个并发名额，结果通过 yield 出的字典回报（ok/status）"""
+        outcome = {'ok': True, 'status': None}
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield outcome
+        except Exception:
+            outcome['ok'] = False
+            raise
+        finally:
+            self.release(time.monotonic() - start, outcome['ok'], outcome['status'])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前指标快照"""
+        with self._cond:
+            return {
+                'limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'peak': self._peak,
+                'requests': self._requests,
+                'errors': self._errors,
+                'throttled': self._throttled,
+                'avg_latency': round(self._total_latency / self._requests, 3) if self._requests else 0.0
+            }
+
+class ByteReservation:
+    """一张图片占用的在途字节预算"""
+    def __init__(self, budget: 'ByteBudget', size: int):
+        self.budget = budget
+        self.size = size
+
+    def resize(self, size: int):
+        """按实际大小调整占用（不阻塞）"""
+        self.budget._adjust(size - self.size)
+        self.size = size
+
+    def release(self):
+        """归还全部占用"""
+        self.resize(0)
+
+class ByteBudget:
+    """按字节计数的信号量：下载前预留，上传完成后归还，限制同时在途的图片总大小"""
+    def __init__(self, capacity: int = INFLIGHT_BYTES_BUDGET):
+        self.capacity = capacity
+        self._in_use = 0
+        self._peak = 0
+        self._waits = 0
+        self._cond = threading.Condition()
+
+    def reserve(self, size: int) -> ByteReservation:
+        """预留字节，预算不足时等待；超过总预算的单个文件在没有其他占用时放行"""
+        size = max(0, min(size, self.capacity))
+        with self._cond:
+            if self._in_use and self._in_use + size > self.capacity:
+                self._waits += 1
+                while self._in_use and self._in_use + size > self.capacity:
+                    self._cond.wait()
+            self._in_use += size
+            self._peak = max(self._peak, self._in_use)
+        return ByteReservation(self, size)
+
+    def _adjust(self, delta: int):
+        with self._cond:
+            self._in_use += delta
+            self._peak = max(self._peak, self._in_use)
+            if delta < 0:
+                self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前指标快照"""
+        with self._cond:
+            return {'capacity': self.capacity, 'in_use': self._in_use, 'peak': self._peak, 'waits': self._waits}
+
+class ConcurrencyController:
+    """并发控制器：分别跟踪下载和上传的自适应并发限制，以及在途字节预算"""
+    def __init__(self, initial: int = INITIAL_CONCURRENCY, min_limit: int = MIN_CONCURRENCY,
+                 max_limit: int = MAX_CONCURRENCY, byte_budget: int = INFLIGHT_BYTES_BUDGET):
+        self.max_limit = max_limit
+        self.download = AdaptiveLimiter('下载', initial, min_limit, max_limit, DOWNLOAD_LATENCY_TARGET)
+        self.upload = AdaptiveLimiter('上传', initial, min_limit, max_limit, UPLOAD_LATENCY_TARGET)
+        self.memory = ByteBudget(byte_budget)
+
+    @property
+    def worker_count(self) -> int:
+        """工作线程数：保证下载和上传都能达到并发上限"""
+        return self.download.max_limit + self.upload.max_limit
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """当前并发指标"""
+        return {
+            'download': self.download.snapshot(),
+            'upload': self.upload.snapshot(),
+            'memory': self.memory.snapshot()
+        }
+
+    def log_status(self):
+        """输出当前并发状态"""
+        download = self.download.snapshot()
+        upload = self.upload.snapshot()
+        memory = self.memory.snapshot()
+        logger.info(f"[并发] 📊 下载并发: {download['limit']} (峰值 {download['peak']}, 限流 {download['throttled']}次), "
+                    f"上传并发: {upload['limit']} (峰值 {upload['peak']}, 限流 {upload['throttled']}次), "
+                    f"在途字节峰值: {ImageProcessor.format_file_size(memory['peak'])}")
+
 class ImageProcessor:
     """图片处理工具"""
+    # 按URL缓存的内容识别结果: URL -> (扩展名, MIME类型)，非图片为None；超过 SNIFF_CACHE_SIZE 条按LRU淘汰
+    _sniff_cache: 'OrderedDict[str, Optional[Tuple[str, str]]]' = OrderedDict()
+    _sniff_lock = threading.Lock()
+
     @staticmethod
     def get_file_extension(url: str) -> str:
-        """获取文件扩展名"""
+        """获取文件扩展名（优先使用内容识别结果）"""
+        sniffed = ImageProcessor.get_sniff_result(url)
+        if sniffed:
+            return sniffed[0]
         ext = os.path.splitext(urlparse(url).path)[1]
         return ext.lower() if ext else '.jpg'
 
@@ -108,10 +940,58 @@ class ImageProcessor:
         """检查是否是有效的图片URL"""
         if not url:
             return False
+        found, sniffed = ImageProcessor._lookup_sniff_result(url)
+        if found:
+            return sniffed is not None
         ext = ImageProcessor.get_file_extension(url)
         valid_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
         return ext in valid_extensions
 
+    @staticmethod
+    def sniff_image_type(header: bytes) -> Optional[Tuple[str, str]]:
+        """根据文件头魔数识别图片类型，返回 (扩展名, MIME类型)"""
+        if not header:
+            return None
+        if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+            return '.webp', 'image/webp'
+        if header[4:8] == b'ftyp' and header[8:12] in IMAGE_FTYP_BRANDS:
+            return IMAGE_FTYP_BRANDS[header[8:12]]
+        for signature, ext, mime_type in IMAGE_SIGNATURES:
+            if header.startswith(signature):
+                return ext, mime_type
+        return None
+
+    @staticmethod
+    def cache_sniff_result(url: str, result: Optional[Tuple[str, str]]):
+        """缓存URL的内容识别结果"""
+        with ImageProcessor._sniff_lock:
+            cache = ImageProcessor._sniff_cache
+            cache[url] = result
+            cache.move_to_end(url)
+            while len(cache) > SNIFF_CACHE_SIZE:
+                cache.popitem(last=False)
+
+    @staticmethod
+    def _lookup_sniff_result(url: str) -> Tuple[bool, Optional[Tuple[str, str]]]:
+        """查找URL的内容识别结果，返回 (是否已识别, 结果)"""
+        with ImageProcessor._sniff_lock:
+            cache = ImageProcessor._sniff_cache
+            if url not in cache:
+                return False, None
+            cache.move_to_end(url)
+            return True, cache[url]
+
+    @staticmethod
+    def get_sniff_result(url: str) -> Optional[Tuple[str, str]]:
+        """获取URL的内容识别结果，未识别或非图片返回None"""
+        return ImageProcessor._lookup_sniff_result(url)[1]
+
+    @staticmethod
+    def is_known_non_image(url: str) -> bool:
+        """URL是否已被识别为非图片内容"""
+        found, sniffed = ImageProcessor._lookup_sniff_result(url)
+        return found and sniffed is None
+
     @staticmethod
     def should_process_domain(url: str) -> bool:
         """检查是否需要处理该域名的图片"""
@@ -143,36 +1023,13 @@ class ImageProcessor:
         temp_file.close()
         return temp_file.name
 
-    @staticmethod
-    def process_batch(tasks: List[ImageTask], manager: 'SeaTableManager') -> Dict[str, Any]:
-        """批量处理图片任务"""
-        results = {}
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_task = {
-                executor.submit(manager.process_single_image, task): task
-                for task in tasks
-            }
-            
-            for future in as_completed(future_to_task):
-                task = future_to_task[future]
-                try:
-                    result = future.result()
-                    results[task.url] = result
-                except Exception as e:
-                    logger.error(f"处理图片失败 {task.url}: {str(e)}")
-                    results[task.url] = None
-                
-                # 添加请求延迟
-                time.sleep(REQUEST_DELAY)
-        
-        return results
-
 class ImageHistory:
     """图片处理历史记录管理"""
     def __init__(self):
         self.current_records = {}
         self._save_lock = threading.Lock()
         self.failed_records = []  # 新增：专门存储失败记录
+        self.content_info: Dict[str, Tuple[str, int]] = {}  # 源URL -> (内容哈希, 大小)，用于导出映射
 
     def add_failed_record(self, image_url: str, error_msg: str, base_name: str = '', table_name: str = '', 
                          row_id: str = '', row_data: str = '', column_name: str = ''):
@@ -202,17 +1059,102 @@ class ImageHistory:
             }
             logger.info(f"[历史] 📝 添加失败记录: {image_url}")
 
-    def add_success_record(self, image_url: str, image_bed_url: str):
+    def set_content(self, image_url: str, content_hash: str, size: int):
+        """记录转存内容的哈希和大小"""
+        with self._save_lock:
+            self.content_info[image_url] = (content_hash, size)
+
+    def add_success_record(self, image_url: str, image_bed_url: str, base_name: str = '',
+                           table_name: str = '', column_name: str = ''):
         """添加成功记录"""
         with self._save_lock:
             # 如果之前是失败记录，从失败列表中移除
             self.failed_records = [r for r in self.failed_records if r['url'] != image_url]
+            content_hash, size = self.content_info.pop(image_url, ('', 0))
             self.current_records[image_url] = {
                 'status': 'success',
                 'image_bed_url': image_bed_url,
-                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
+                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'content_hash': content_hash,
+                'size': size,
+                'base_name': base_name,
+                'table_name': table_name,
+                'column_name': column_name
             }
 
+    def export_mapping(self, path: str) -> int:
+        """导出 源URL -> 图床URL 映射（.csv 为CSV，其它为JSONL），返回导出条数"""
+        with self._save_lock:
+            rows = [
+                {
+                    'original_url': url,
+                    'new_url': record['image_bed_url'],
+                    'content_hash': record.get('content_hash', ''),
+                    'size': record.get('size', 0),
+                    'base_name': record.get('base_name', ''),
+                    'table_name': record.get('table_name', ''),
+                    'column_name': record.get('column_name', ''),
+                    'timestamp': record.get('timestamp', '')
+                }
+                for url, record in self.current_records.items() if record.get('status') == 'success'
+            ]
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', newline='', encoding='utf-8') as f:
+            if path.endswith('.csv'):
+                writer = csv.DictWriter(f, fieldnames=MAPPING_FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        os.replace(temp_path, path)
+        return len(rows)
+
+    def import_mapping(self, path: str) -> int:
+        """导入映射文件预置成功记录（已有记录不覆盖），无法解析的行跳过，返回导入条数"""
+        rows = []
+        skipped = 0
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            if path.endswith('.csv'):
+                rows = list(csv.DictReader(f))
+            else:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError as e:
+                        skipped += 1
+                        logger.warning(f"[映射] ⚠️ 跳过无法解析的行 {path}:{line_number}: {str(e)}")
+                        continue
+                    rows.append(row)
+        imported = 0
+        with self._save_lock:
+            for row in rows:
+                try:
+                    url, new_url = row.get('original_url'), row.get('new_url')
+                    if not url or not new_url or url in self.current_records:
+                        continue
+                    record = {
+                        'status': 'success',
+                        'image_bed_url': new_url,
+                        'timestamp': row.get('timestamp', ''),
+                        'content_hash': row.get('content_hash', ''),
+                        'size': int(row.get('size') or 0),
+                        'base_name': row.get('base_name', ''),
+                        'table_name': row.get('table_name', ''),
+                        'column_name': row.get('column_name', '')
+                    }
+                except (AttributeError, TypeError, ValueError) as e:
+                    skipped += 1
+                    logger.warning(f"[映射] ⚠️ 跳过格式错误的记录 {path}: {str(e)}")
+                    continue
+                self.current_records[url] = record
+                imported += 1
+        if skipped:
+            logger.warning(f"[映射] ⚠️ {path} 中有 {skipped} 行无法导入，已跳过")
+        return imported
+
     def get_record(self, image_url: str) -> Optional[str]:
         """获取历史记录"""
         record = self.current_records.get(image_url)
@@ -220,86 +1162,1155 @@ class ImageHistory:
             return record['image_bed_url']
         return None
 
-    def get_failed_records(self) -> List[Dict[str, Any]]:
-        """获取所有失败记录"""
-        with self._save_lock:
-            failed = self.failed_records.copy()
-            logger.info(f"[历史] 📊 当前失败记录数: {len(failed)}")
-            return failed
+    def get_failed_records(self) -> List[Dict[str, Any]]:
+        """获取所有失败记录"""
+        with self._save_lock:
+            failed = self.failed_records.copy()
+            logger.info(f"[历史] 📊 当前失败记录数: {len(failed)}")
+            return failed
+
+    def take_failed_records(self) -> List[Dict[str, Any]]:
+        """取出并清空失败记录（守护模式重试前调用，重试仍失败的会重新记入）"""
+        with self._save_lock:
+            failed, self.failed_records = self.failed_records, []
+            return failed
+
+    def restore_failed_records(self, records: List[Dict[str, Any]]):
+        """放回失败记录，同一图片、行和列已有记录的不重复添加"""
+        with self._save_lock:
+            seen = {(r['url'], r.get('row_id'), r.get('column_name')) for r in self.failed_records}
+            for record in records:
+                key = (record['url'], record.get('row_id'), record.get('column_name'))
+                if key not in seen:
+                    seen.add(key)
+                    self.failed_records.append(record)
+
+    def failed_base_names(self) -> set:
+        """有失败记录的base名称"""
+        with self._save_lock:
+            return {record['base_name'] for record in self.failed_records}
+
+    def update_record_status(self, url: str, status: str, image_bed_url: str = None):
+        """更新记录状态"""
+        with self._save_lock:
+            if url in self.current_records:
+                old_status = self.current_records[url].get('status')
+                self.current_records[url]['status'] = status
+                if image_bed_url:
+                    self.current_records[url]['image_bed_url'] = image_bed_url
+                
+                # 如果状态从失败变为成功，从失败列表中移除
+                if old_status == 'failed' and status == 'success':
+                    self.failed_records = [r for r in self.failed_records if r['url'] != url]
+                # 如果状态从成功变为失败，添加到失败列表
+                elif old_status == 'success' and status == 'failed':
+                    self.add_failed_record(url, "状态更新为失败")
+
+    def clear_all_records(self):
+        """清理所有记录"""
+        with self._save_lock:
+            failed_count = len(self.failed_records)
+            self.current_records.clear()
+            self.failed_records.clear()
+            self.content_info.clear()
+            logger.info(f"[历史] 🧹 清理所有记录完成 (清理了 {failed_count} 条失败记录)")
+
+class InFlightRegistry:
+    """进行中转存登记：同一URL的并发请求等待并共享同一次转存"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Dict[str, Any]] = {}
+
+    def run(self, url: str, func: Callable[[], Optional[str]]) -> Tuple[Optional[str], bool]:
+        """执行或等待同一URL的转存，返回 (结果, 是否复用了其它请求的结果)"""
+        with self._lock:
+            flight = self._flights.get(url)
+            is_leader = flight is None
+            if is_leader:
+                flight = {'event': threading.Event(), 'result': None}
+                self._flights[url] = flight
+
+        if not is_leader:
+            flight['event'].wait()
+            return flight['result'], True
+
+        try:
+            flight['result'] = func()
+            return flight['result'], False
+        finally:
+            with self._lock:
+                self._flights.pop(url, None)
+            flight['event'].set()
+
+    @property
+    def active_count(self) -> int:
+        """进行中的转存数"""
+        with self._lock:
+            return len(self._flights)
+
+class BlobCache:
+    """本地内容寻址缓存：按源URL索引、按内容哈希存储，超出容量按LRU淘汰"""
+    INDEX_SAVE_INTERVAL = 50  # 每新增多少条保存一次索引
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, 'blobs')
+        self.index_file = os.path.join(cache_dir, 'index.json')
+        self.max_bytes = max_bytes
+        self._urls: Dict[str, str] = {}  # 源URL -> 内容哈希
+        self._digest_urls: Dict[str, set] = {}  # 内容哈希 -> 指向它的源URL，淘汰时据此移除URL
+        self._blobs: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()  # 内容哈希 -> 信息，按最近使用排序
+        self._pins: Dict[str, int] = {}
+        self._total = 0
+        self._dirty = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._load()
+
+    def _blob_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest + ext)
+
+    def _load(self):
+        """加载上次运行保存的索引，丢弃文件已不存在的条目"""
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r') as f:
+                data = json.load(f)
+            for digest, info in sorted(data.get('blobs', {}).items(), key=lambda item: item[1].get('accessed', 0)):
+                if os.path.exists(self._blob_path(digest, info['ext'])):
+                    self._blobs[digest] = info
+                    self._total += info['size']
+            for url, digest in data.get('urls', {}).items():
+                if digest in self._blobs:
+                    self._link(url, digest)
+            logger.info(f"[缓存] 📦 加载缓存索引: {len(self._blobs)} 个文件, "
+                        f"{ImageProcessor.format_file_size(self._total)}")
+        except Exception as e:
+            logger.error(f"[缓存] ❌ 加载缓存索引失败: {str(e)}")
+
+    def save(self):
+        """保存索引"""
+        with self._lock:
+            data = {'urls': dict(self._urls), 'blobs': {digest: dict(info) for digest, info in self._blobs.items()}}
+            self._dirty = 0
+        try:
+            temp_index = self.index_file + '.tmp'
+            with open(temp_index, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_index, self.index_file)
+        except Exception as e:
+            logger.error(f"[缓存] ❌ 保存缓存索引失败: {str(e)}")
+
+    def get(self, url: str) -> Optional[Tuple[str, str, str]]:
+        """查找URL对应的缓存，返回 (文件路径, 内容哈希, MIME类型) 并锁定该文件，用完需调用release"""
+        with self._lock:
+            digest = self._urls.get(url)
+            info = self._blobs.get(digest) if digest else None
+            if not info:
+                self.misses += 1
+                return None
+            path = self._blob_path(digest, info['ext'])
+            if not os.path.exists(path):
+                self._forget(digest)
+                self.misses += 1
+                return None
+            self._blobs.move_to_end(digest)
+            info['accessed'] = time.time()
+            self._pins[digest] = self._pins.get(digest, 0) + 1
+            self.hits += 1
+            return path, digest, info['mime']
+
+    def cached_size(self, url: str) -> Optional[int]:
+        """URL已缓存时返回内容大小（不计入命中统计）"""
+        with self._lock:
+            digest = self._urls.get(url)
+            info = self._blobs.get(digest) if digest else None
+            return info['size'] if info else None
+
+    def put(self, url: str, file_path: str, mime_type: str) -> Optional[Tuple[str, str]]:
+        """将下载好的文件移入缓存，返回 (缓存路径, 内容哈希) 并锁定该文件，用完需调用release"""
+        try:
+            sha256 = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+            size = os.path.getsize(file_path)
+            if size > self.max_bytes:
+                return None
+            ext = os.path.splitext(file_path)[1]
+
+            with self._lock:
+                info = self._blobs.get(digest)
+                if info and os.path.exists(self._blob_path(digest, info['ext'])):
+                    # 相同内容已缓存，丢弃新下载的文件
+                    path = self._blob_path(digest, info['ext'])
+                    os.unlink(file_path)
+                    self._blobs.move_to_end(digest)
+                else:
+                    if info:
+                        # 索引中有但文件已丢失：先扣除旧条目的大小再按新文件登记
+                        self._total -= info['size']
+                    path = self._blob_path(digest, ext)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    shutil.move(file_path, path)
+                    info = {'size': size, 'ext': ext, 'mime': mime_type}
+                    self._blobs[digest] = info
+                    self._blobs.move_to_end(digest)
+                    self._total += size
+                info['accessed'] = time.time()
+                self._link(url, digest)
+                self._pins[digest] = self._pins.get(digest, 0) + 1
+                self._dirty += 1
+                self._evict()
+                should_save = self._dirty >= self.INDEX_SAVE_INTERVAL
+            if should_save:
+                self.save()
+            return path, digest
+        except Exception as e:
+            logger.error(f"[缓存] ❌ 写入缓存失败: {str(e)}")
+            return None
+
+    def release(self, digest: str):
+        """解除文件锁定"""
+        with self._lock:
+            count = self._pins.get(digest, 0) - 1
+            if count > 0:
+                self._pins[digest] = count
+            else:
+                self._pins.pop(digest, None)
+            self._evict()
+
+    def _link(self, url: str, digest: str):
+        """记录URL指向的内容哈希，同时维护反向索引（需持有锁）"""
+        previous = self._urls.get(url)
+        if previous == digest:
+            return
+        if previous is not None:
+            urls = self._digest_urls.get(previous)
+            if urls:
+                urls.discard(url)
+                if not urls:
+                    del self._digest_urls[previous]
+        self._urls[url] = digest
+        self._digest_urls.setdefault(digest, set()).add(url)
+
+    def _forget(self, digest: str):
+        """移除一个文件及指向它的URL（需持有锁）"""
+        info = self._blobs.pop(digest, None)
+        if not info:
+            return
+        self._total -= info['size']
+        for url in self._digest_urls.pop(digest, ()):
+            self._urls.pop(url, None)
+        try:
+            os.unlink(self._blob_path(digest, info['ext']))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """按LRU淘汰未锁定的文件直到低于容量上限（需持有锁）"""
+        if self._total <= self.max_bytes:
+            return
+        for digest in list(self._blobs):
+            if self._total <= self.max_bytes:
+                break
+            if digest not in self._pins:
+                self._forget(digest)
+                self._dirty += 1
+
+    @property
+    def total_size(self) -> int:
+        with self._lock:
+            return self._total
+
+class PerceptualIndex:
+    """感知哈希索引：按dHash查找已上传的近似图片（缩放、重新压缩后的同一张图），需要Pillow"""
+    def __init__(self, db_path: str = PHASH_DB, max_distance: int = PHASH_MAX_DISTANCE,
+                 audit_file: str = PHASH_AUDIT_FILE):
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self.audit_file = audit_file
+        self._entries: Dict[int, str] = {}  # 哈希 -> 图床URL
+        # 哈希切成 max_distance+1 段分别建索引：距离不超过阈值的两个哈希至少有一段完全相同
+        band_count = min(64, max(1, max_distance + 1))
+        widths = [64 // band_count + (i < 64 % band_count) for i in range(band_count)]
+        offsets = [sum(widths[:i]) for i in range(band_count)]
+        self._bands = [(offset, (1 << width) - 1) for offset, width in zip(offsets, widths)]  # (右移位数, 掩码)
+        self._buckets: List[Dict[int, set]] = [{} for _ in self._bands]  # 每段: 分段值 -> 哈希集合
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS phashes (
+                    hash TEXT PRIMARY KEY,
+                    image_bed_url TEXT NOT NULL,
+                    source_url TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            for value, image_bed_url in conn.execute("SELECT hash, image_bed_url FROM phashes"):
+                self._index(int(value, 16), image_bed_url)
+        logger.info(f"[近似] 📦 加载感知哈希索引: {len(self._entries)} 条")
+
+    @contextmanager
+    def _connect(self):
+        """打开数据库连接：块内为一个事务，退出时关闭连接"""
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn, conn:
+            yield conn
+
+    @staticmethod
+    def dhash(file_path: str) -> Optional[int]:
+        """计算64位差值哈希，无法解码的格式返回None"""
+        try:
+            with Image.open(file_path) as img:
+                pixels = img.convert('L').resize((9, 8), Image.LANCZOS).tobytes()
+        except Exception as e:
+            logger.debug(f"[近似] 无法计算感知哈希: {str(e)}")
+            return None
+        value = 0
+        for row in range(8):
+            for col in range(8):
+                value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+        return value
+
+    def _index(self, value: int, image_bed_url: str):
+        """加入内存索引（需持有锁或在初始化时调用）"""
+        self._entries[value] = image_bed_url
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            buckets.setdefault((value >> shift) & mask, set()).add(value)
+
+    def _unindex(self, value: int):
+        """移出内存索引（需持有锁）"""
+        self._entries.pop(value, None)
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            key = (value >> shift) & mask
+            bucket = buckets.get(key)
+            if bucket:
+                bucket.discard(value)
+                if not bucket:
+                    del buckets[key]
+
+    def find(self, value: int) -> Optional[Tuple[str, int]]:
+        """查找汉明距离最近且不超过阈值的已上传图片，返回 (图床URL, 距离)"""
+        best = None
+        with self._lock:
+            candidates = set()
+            for (shift, mask), buckets in zip(self._bands, self._buckets):
+                candidates.update(buckets.get((value >> shift) & mask, ()))
+            entries = [(other, self._entries[other]) for other in candidates]
+        for other, url in entries:
+            distance = bin(value ^ other).count('1')
+            if distance <= self.max_distance and (best is None or distance < best[1]):
+                best = (url, distance)
+                if distance == 0:
+                    break
+        return best
+
+    def add(self, value: int, image_bed_url: str, source_url: str):
+        """记录新上传图片的哈希"""
+        try:
+            with self._lock, self._connect() as conn:
+                cursor = conn.execute("INSERT OR IGNORE INTO phashes (hash, image_bed_url, source_url, created_at) "
+                                      "VALUES (?, ?, ?, ?)", (f'{value:016x}', image_bed_url, source_url, time.time()))
+                # 相同哈希已存在时不插入，内存索引保持原来的链接
+                if cursor.rowcount == 1:
+                    self._index(value, image_bed_url)
+        except Exception as e:
+            logger.error(f"[近似] ❌ 保存感知哈希失败: {str(e)}")
+
+    def remove(self, image_bed_url: str):
+        """删除指向某个图床链接的哈希（链接校验失败时调用）"""
+        try:
+            with self._lock, self._connect() as conn:
+                conn.execute("DELETE FROM phashes WHERE image_bed_url = ?", (image_bed_url,))
+                for value in [value for value, url in self._entries.items() if url == image_bed_url]:
+                    self._unindex(value)
+        except Exception as e:
+            logger.error(f"[近似] ❌ 删除感知哈希失败: {str(e)}")
+
+    def audit(self, source_url: str, image_bed_url: str, value: int, distance: int):
+        """记录一次近似复用，便于事后核查"""
+        record = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'source_url': source_url,
+            'reused_url': image_bed_url,
+            'hash': f'{value:016x}',
+            'distance': distance
+        }
+        try:
+            with self._lock, open(self.audit_file, 'a') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except Exception as e:
+            logger.error(f"[近似] ❌ 写入复用记录失败: {str(e)}")
+
+class UploadVerifier:
+    """上传结果校验：用 Range GET 并发确认图床链接可访问（可抽样），同一链接只校验一次"""
+    def __init__(self, sample_rate: float = VERIFY_SAMPLE_RATE, workers: int = VERIFY_CONCURRENCY,
+                 timeout: float = HTTP_TIMEOUT, cache_size: int = VERIFY_CACHE_SIZE):
+        self.sample_rate = sample_rate
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.cache_size = max(1, cache_size)
+        self.checked = 0
+        self.failed = 0
+        self.sampled_out = 0
+        # 链接 -> 校验结果；超过 cache_size 条按LRU淘汰，守护模式下不会无限增长
+        self._results: 'OrderedDict[str, Future]' = OrderedDict()
+        self._sampled_out = set()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='verify')
+        self._lock = threading.Lock()
+
+    def submit(self, url: str, force: bool = False) -> Future:
+        """提交校验，返回结果为是否可用的Future；未抽中的链接直接视为可用，force 时一定实际校验"""
+        with self._lock:
+            future = self._results.get(url)
+            if future is None or (force and url in self._sampled_out):
+                if not force and self.sample_rate < 1 and random.random() >= self.sample_rate:
+                    self.sampled_out += 1
+                    self._sampled_out.add(url)
+                    future = Future()
+                    future.set_result(True)
+                else:
+                    self._sampled_out.discard(url)
+                    future = self._executor.submit(self._check, url)
+                self._results[url] = future
+                while len(self._results) > self.cache_size:
+                    evicted, _ = self._results.popitem(last=False)
+                    self._sampled_out.discard(evicted)
+            self._results.move_to_end(url)
+            return future
+
+    def _check(self, url: str) -> bool:
+        """只请求第一个字节，200/206 视为可用"""
+        ok = False
+        try:
+            http_transport.configure(HttpTransport.host_prefix(url), self.workers)
+            with metrics.stage(None, 'verify'):
+                with http_transport.session.get(url, headers={'Range': 'bytes=0-0'}, stream=True,
+                                                timeout=self.timeout) as response:
+                    ok = response.status_code in (200, 206)
+            if not ok:
+                logger.warning(f"[校验] ❌ 图床链接不可用 ({response.status_code}): {url}")
+        except Exception as e:
+            logger.warning(f"[校验] ❌ 图床链接校验出错 {url}: {str(e)}")
+        with self._lock:
+            self.checked += 1
+            self.failed += not ok
+        return ok
+
+    def when_verified(self, urls: List[str], callback: Callable[[Dict[str, bool]], None]):
+        """全部链接校验完成后调用 callback(链接 -> 是否可用)，通常在校验线程中执行"""
+        futures = {url: self.submit(url) for url in set(urls)}
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            callback({url: future.result() for url, future in futures.items()})
+
+        for future in futures.values():
+            future.add_done_callback(on_done)
+
+    def verify_all(self, urls: List[str], force: bool = False) -> Dict[str, bool]:
+        """并发校验并等待结果"""
+        futures = {url: self.submit(url, force) for url in set(urls)}
+        return {url: future.result() for url, future in futures.items()}
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {'checked': self.checked, 'failed': self.failed, 'sampled_out': self.sampled_out}
+
+class ReportWriter:
+    """详细报告：运行中把每条成功/失败记录逐行写入JSONL文件，按大小换新文件，只保留最近的若干个"""
+    def __init__(self, directory: str = REPORT_DIR, keep: int = REPORT_KEEP, max_bytes: int = REPORT_MAX_BYTES):
+        self.directory = directory
+        self.keep = max(1, keep)
+        self.max_bytes = max_bytes
+        self.stamp = time.strftime('%Y%m%d_%H%M%S')
+        self.path = os.path.join(directory, f"seatable_image_sync_{self.stamp}.jsonl")  # 第一个文件，通知中引用
+        self.records = 0
+        self._part = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path if not self._part else self.path[:-len('.jsonl')] + f".{self._part}.jsonl"
+        self._file = open(path, 'a', encoding='utf-8')
+        self._prune()
+
+    def _prune(self):
+        """按运行删除较早的报告：同一次运行的拆分文件一起保留或删除，按最后修改时间排序，本次运行的文件不删除"""
+        try:
+            runs: Dict[str, List[str]] = {}
+            for name in os.listdir(self.directory):
+                if match := REPORT_NAME_PATTERN.match(name):
+                    runs.setdefault(match.group(1), []).append(os.path.join(self.directory, name))
+            current = runs.pop(self.stamp, None)
+            latest = sorted(runs.values(), key=lambda paths: max(os.path.getmtime(path) for path in paths), reverse=True)
+            for paths in latest[self.keep - (1 if current else 0):]:
+                for path in paths:
+                    os.unlink(path)
+        except Exception as e:
+            logger.error(f"[报告] ❌ 清理旧报告失败: {str(e)}")
+
+    def write(self, kind: str, record: Dict[str, Any]):
+        """追加一条记录"""
+        line = json.dumps(dict(record, type=kind), ensure_ascii=False, default=list) + '\n'
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._open()  # 第一次写入时才创建，plan等不产生记录的命令不会留下空文件
+                elif self.max_bytes > 0 and self._file.tell() >= self.max_bytes:
+                    self._file.close()
+                    self._part += 1
+                    self._open()
+                self._file.write(line)
+                self._file.flush()
+                self.records += 1
+            except Exception as e:
+                logger.error(f"[报告] ❌ 写入详细报告失败: {str(e)}")
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+class AssetReclaimer:
+    """素材回收（需显式开启）：原素材已转存、图床链接校验通过且不再被引用后，分批限速删除并先写撤销记录"""
+    def __init__(self, verifier: UploadVerifier, batch_size: int = RECLAIM_BATCH_SIZE,
+                 batch_delay: float = RECLAIM_BATCH_DELAY, undo_file: str = RECLAIM_UNDO_FILE):
+        self.verifier = verifier
+        self.batch_size = max(1, batch_size)
+        self.batch_delay = batch_delay
+        self.undo_file = undo_file
+        self.deleted = 0
+        self.failed = 0
+        self.unverified = 0
+        self._candidates: Dict[str, Dict[str, Any]] = {}  # 原链接 -> 素材信息
+        self._blocked = set()  # 有引用未能替换的原链接
+        self._managers: Dict[str, 'SeaTableManager'] = {}  # base_key -> 已完整处理的base
+        self._processed: Dict[str, set] = {}  # base_key -> 已处理的 (表格, 图片列)
+        self._tables: Dict[str, List[str]] = {}  # base_key -> 全部表格名
+        self._lock = threading.Lock()
+
+    def add(self, manager: 'SeaTableManager', url: str, new_url: str, table_name: str, row_id: str,
+            column_name: str):
+        """记录一个已回写的替换"""
+        path = manager.asset_path(url)
+        if not path:
+            return
+        with self._lock:
+            self._candidates.setdefault(url, {
+                'base_key': manager.base_key,
+                'base_name': manager.base_name,
+                'path': path,
+                'original_url': url,
+                'new_url': new_url,
+                'table_name': table_name,
+                'row_id': row_id,
+                'column_name': column_name
+            })
+
+    def block(self, url: str):
+        """该素材仍有引用未替换，本次不回收"""
+        with self._lock:
+            self._blocked.add(url)
+
+    def note_row(self, row_update: 'RowUpdate', committed: bool):
+        """一行回写完成后记录其中被替换的图片"""
+        for image, new_url in zip(row_update.images, row_update.new_images):
+            if new_url is image:
+                continue
+            url = image.get('url', '') if isinstance(image, dict) else image
+            if committed:
+                self.add(row_update.manager, url, new_url, row_update.table_name, row_update.row_id,
+                         row_update.column_name)
+            else:
+                self.block(url)
+
+    def allow(self, manager: 'SeaTableManager', metadata: Dict[str, Any]):
+        """base已完整处理，可以回收其素材；记下处理过的图片列，删除前检查其它列中的引用"""
+        processed = {(table['name'], col['name']) for table in metadata.get('tables', [])
+                     for col in table.get('columns', [])
+                     if col.get('type') == 'image' and manager.scope.match_column(col['name'])}
+        with self._lock:
+            self._managers[manager.base_key] = manager
+            self._processed[manager.base_key] = processed
+            self._tables[manager.base_key] = [table['name'] for table in metadata.get('tables', [])]
+
+    def _referenced_elsewhere(self, base_key: str) -> Optional[set]:
+        """读取base全部行，返回处理范围之外的列中出现的素材路径；读取失败或预算用尽时返回None"""
+        manager = self._managers[base_key]
+        processed = self._processed[base_key]
+        pattern = re.compile(re.escape(str(UUID(str(manager.base.dtable_uuid)))) + r'/([^\s"\'<>)\]]+)')
+        paths = set()
+        try:
+            for table_name in self._tables[base_key]:
+                with RowPager(manager, table_name) as pager:
+                    for rows in pager:
+                        if manager.out_of_budget():
+                            return None
+                        for row in rows:
+                            for column_name, value in row.items():
+                                if (table_name, column_name) in processed or not value:
+                                    continue
+                                text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+                                paths.update(unquote(match.group(1)).strip('/') for match in pattern.finditer(text))
+        except Exception as e:
+            logger.error(f"[回收] ❌ 检查 {manager.base_name} 的其它引用失败，本次不回收: {str(e)}")
+            return None
+        return paths
+
+    def _write_undo(self, records: List[Dict[str, Any]], action: str):
+        """追加撤销记录，写入失败时抛出异常，调用方不再删除"""
+        logged_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(self.undo_file, 'a', encoding='utf-8') as f:
+            for info in records:
+                f.write(json.dumps(dict(info, action=action, time=logged_at), ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def run(self, failed_urls: set):
+        """回收所有符合条件的素材：每批先校验图床链接、写撤销记录，再逐个删除"""
+        with self._lock:
+            pending = [info for url, info in self._candidates.items()
+                       if url not in self._blocked and url not in failed_urls and info['base_key'] in self._managers]
+            self._candidates.clear()
+        # 原素材还被处理范围之外的列引用时不能删除
+        for base_key in {info['base_key'] for info in pending}:
+            elsewhere = self._referenced_elsewhere(base_key)
+            kept = [info for info in pending if info['base_key'] == base_key
+                    and (elsewhere is None or info['path'] in elsewhere)]
+            if kept:
+                logger.info(f"[回收] ℹ️ {self._managers[base_key].base_name}: {len(kept)} 个素材仍被其它列引用或无法确认，保留")
+            pending = [info for info in pending if info not in kept]
+        if not pending:
+            return
+        logger.info(f"[回收] 🧹 开始回收 {len(pending)} 个已迁移的素材（每批 {self.batch_size} 个）")
+        for start in range(0, len(pending), self.batch_size):
+            if start:
+                time.sleep(self.batch_delay)
+            batch = pending[start:start + self.batch_size]
+            verified = self.verifier.verify_all([info['new_url'] for info in batch], force=True)
+            for info in batch:
+                if not verified.get(info['new_url']):
+                    logger.warning(f"[回收] ⚠️ 图床链接校验未通过，保留原素材: {info['original_url']}")
+                    self.unverified += 1
+            batch = [info for info in batch if verified.get(info['new_url'])]
+            if not batch:
+                continue
+            try:
+                self._write_undo(batch, 'delete')
+            except Exception as e:
+                logger.error(f"[回收] ❌ 写入撤销记录失败，停止回收: {str(e)}")
+                return
+            kept = []
+            stopped = False
+            for index, info in enumerate(batch):
+                manager = self._managers[info['base_key']]
+                if manager.out_of_budget():
+                    kept.extend(batch[index:])
+                    stopped = True
+                    logger.warning("[回收] ⏰ 预算用尽，剩余素材留待下次运行")
+                    break
+                if manager.delete_asset(info['path']):
+                    self.deleted += 1
+                else:
+                    self.failed += 1
+                    kept.append(info)
+            if kept:
+                try:
+                    self._write_undo(kept, 'kept')
+                except Exception as e:
+                    logger.error(f"[回收] ❌ 写入撤销记录失败: {str(e)}")
+            if stopped:
+                break
+        logger.info(f"[回收] ✨ 回收完成: 删除 {self.deleted} 个, 失败 {self.failed} 个, 撤销记录: {self.undo_file}")
+
+class ImageBed:
+    """图床管理器"""
+    def __init__(self, upload_api: str, size_limit: int = 5, limiter: Optional[AdaptiveLimiter] = None,
+                 hosts: Optional[List[str]] = None, timeout: float = HTTP_TIMEOUT):
+        self.upload_api = upload_api
+        self.timeout = timeout
+        self.size_limit = size_limit * 1024 * 1024  # 转换为字节
+        # 图床链接所在的主机：上传接口的主机，以及额外配置的（如CDN域名）
+        self.hosts = {urlparse(upload_api).netloc.lower()} | {host.strip().lower() for host in hosts or [] if host.strip()}
+        self.limiter = limiter or AdaptiveLimiter('上传', INITIAL_CONCURRENCY, MIN_CONCURRENCY,
+                                                  MAX_CONCURRENCY, UPLOAD_LATENCY_TARGET)
+        # 图床接口单独建池，大小跟随上传并发上限，限流时只降低上传并发
+        http_transport.configure(upload_api, self.limiter.max_limit, on_status=self.limiter.on_throttle)
+        self.session = http_transport.session
+
+    def is_hosted(self, url: str) -> bool:
+        """链接是否已在图床中"""
+        return urlparse(url).netloc.lower() in self.hosts
+
+    def upload_image(self, file_path: str, mime_type: Optional[str] = None) -> Optional[str]:
+        """上传图片到图床"""
+        try:
+            # 检查文件大小
+            file_size = os.path.getsize(file_path)
+            if file_size > self.size_limit:
+                logger.warning(f"[上传] ⚠️ 文件大小超过限制: {ImageProcessor.format_file_size(file_size)}")
+                return None
+
+            # 上传文件
+            with open(file_path, 'rb') as f:
+                file_name = os.path.basename(file_path)
+                files = {'file': (file_name, f, mime_type) if mime_type else (file_name, f)}
+                logger.info(f"[上传] 📤 正在上传到图床: {self.upload_api}")
+                with self.limiter.slot() as outcome:
+                    response = self.session.post(self.upload_api, files=files, timeout=self.timeout)
+                    outcome['status'] = response.status_code
+                    outcome['ok'] = response.status_code == 200
+
+            if response.status_code == 200:
+                result = response.json()
+                if url := result.get('url'):
+                    logger.info(f"[上传] ✅ 上传成功: {url}")
+                    return url
+                logger.error(f"[上传] ❌ 上传失败: {result.get('message', '未知错误')}")
+            else:
+                logger.error(f"[上传] ❌ 上传失败，状态码: {response.status_code}")
+
+        except Exception as e:
+            logger.error(f"[上传] ❌ 上传过程出错: {str(e)}")
+
+        return None
+
+class ObservedRetry(Retry):
+    """重试策略：因限流或服务端错误重试时通知回调"""
+    def __init__(self, *args, on_status: Optional[Callable[[int], None]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_status = on_status
+
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.on_status = self.on_status
+        return retry
+
+    def increment(self, method=None, url=None, response=None, error=None, *args, **kwargs):
+        if self.on_status and response is not None and response.status in THROTTLE_STATUS_CODES:
+            try:
+                self.on_status(response.status)
+            except Exception:
+                pass
+        return super().increment(method, url, response, error, *args, **kwargs)
+
+class DnsCache:
+    """DNS缓存：按TTL缓存主机解析结果（LRU限制条目数），只供共享传输层新建连接时使用"""
+    def __init__(self, ttl: float = DNS_CACHE_TTL, max_entries: int = DNS_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Tuple[str, int], Tuple[float, List[str]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> List[str]:
+        """主机的地址列表（按解析顺序去重），解析失败返回空列表"""
+        key = (host.lower(), port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(entry[1])
+        try:
+            infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        except OSError:
+            return []
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (now + self.ttl, addresses)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return list(addresses)
+
+class DnsCachedConnectionMixin:
+    """urllib3连接：建连时按 DnsCache 中的地址依次尝试，Host头和SNI仍使用原主机名"""
+    def __init__(self, *args, dns_cache: Optional[DnsCache] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dns_cache = dns_cache
+
+    def _new_conn(self):
+        host = getattr(self, '_dns_host', None)
+        addresses = self.dns_cache.resolve(host, self.port) if self.dns_cache and host else []
+        if not addresses:
+            # 未启用缓存或解析失败时交给urllib3处理（包括抛出解析错误）
+            return super()._new_conn()
+        error = None
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    error = e
+        finally:
+            self._dns_host = host
+        raise error
+
+class DnsCachedHTTPConnection(DnsCachedConnectionMixin, HTTPConnection):
+    pass
+
+class DnsCachedHTTPSConnection(DnsCachedConnectionMixin, HTTPSConnection):
+    pass
+
+class DnsCachedPoolManager(PoolManager):
+    """新建的连接池改用带DNS缓存的连接类"""
+    CONNECTION_CLASSES = {'http': DnsCachedHTTPConnection, 'https': DnsCachedHTTPSConnection}
+
+    def __init__(self, dns_cache: DnsCache, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dns_cache = dns_cache
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port, request_context)
+        pool.ConnectionCls = self.CONNECTION_CLASSES[scheme]
+        pool.conn_kw['dns_cache'] = self.dns_cache
+        return pool
+
+class DnsCachedAdapter(HTTPAdapter):
+    """只在本适配器的连接池内使用DNS缓存，不影响进程内其它网络调用"""
+    def __init__(self, dns_cache: DnsCache, **kwargs):
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = DnsCachedPoolManager(self.dns_cache, num_pools=connections, maxsize=maxsize,
+                                                block=block, **pool_kwargs)
+
+class TransportRouter(BaseAdapter):
+    """按URL前缀把请求分发到 HttpTransport 中对应的连接池"""
+    def __init__(self, transport: 'HttpTransport'):
+        super().__init__()
+        self.transport = transport
+
+    def send(self, request, **kwargs):
+        return self.transport.adapter_for(request.url).send(request, **kwargs)
+
+    def close(self):
+        self.transport.close()
+
+class HttpTransport:
+    """进程内共享的HTTP传输层：图片下载、图床上传和通知按主机（或接口前缀）复用长连接池，带连接复用统计"""
+    def __init__(self, default_pool_size: int = 10, dns_cache: bool = DNS_CACHE_SUPPORTED):
+        self.default_pool_size = default_pool_size
+        self.dns = DnsCache()
+        self.dns_cache = dns_cache
+        self._routes: Dict[str, Dict[str, Any]] = {}  # URL前缀 -> {adapter, adapters, pool_size, retries, on_status}
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        router = TransportRouter(self)
+        self.session.mount('http://', router)
+        self.session.mount('https://', router)
+
+    @staticmethod
+    def host_prefix(url: str) -> str:
+        """URL所属主机的前缀"""
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}/".lower()
+
+    def configure(self, prefix: str, pool_size: int, on_status: Optional[Callable[[int], None]] = None,
+                  retries: int = 3):
+        """登记URL前缀的连接池：已有的池只会扩容，限流回调以最后一次登记为准"""
+        prefix = self.host_prefix(prefix) if prefix.count('/') < 3 else prefix.lower()
+        with self._lock:
+            route = self._routes.get(prefix)
+            if route is None:
+                route = self._routes[prefix] = {'adapters': [], 'pool_size': 0, 'retries': None, 'on_status': None}
+            if on_status:
+                route['on_status'] = on_status
+            if route['pool_size'] >= pool_size and route['retries'] == retries:
+                return
+            # 扩容时新建适配器，旧适配器上进行中的请求不受影响
+            route['pool_size'] = max(route['pool_size'], pool_size)
+            route['retries'] = retries
+            route['adapter'] = self._create_adapter(prefix, route['pool_size'], retries)
+            route['adapters'].append(route['adapter'])
+
+    def _create_adapter(self, prefix: str, pool_size: int, retries: int) -> HTTPAdapter:
+        """创建带重试的连接池适配器，重试时把状态码交给该前缀的限流回调"""
+        retry = ObservedRetry(
+            total=retries,
+            backoff_factor=1,
+            status_forcelist=sorted(THROTTLE_STATUS_CODES),
+            allowed_methods=["GET", "POST"],
+            on_status=lambda status: self._notify(prefix, status)
+        )
+        # requests/urllib3 只支持 HTTP/1.1，靠长连接复用减少握手；urllib3版本未验证时退回标准适配器
+        if self.dns_cache:
+            return DnsCachedAdapter(self.dns, max_retries=retry, pool_connections=2, pool_maxsize=pool_size)
+        return HTTPAdapter(max_retries=retry, pool_connections=2, pool_maxsize=pool_size)
+
+    def _notify(self, prefix: str, status: int):
+        with self._lock:
+            on_status = self._routes[prefix]['on_status']
+        if on_status:
+            on_status(status)
+
+    def _match(self, url: str) -> Optional[HTTPAdapter]:
+        """最长前缀匹配"""
+        lowered = url.lower()
+        with self._lock:
+            matched = [prefix for prefix in self._routes if lowered.startswith(prefix)]
+            return self._routes[max(matched, key=len)]['adapter'] if matched else None
+
+    def adapter_for(self, url: str) -> HTTPAdapter:
+        """URL对应的适配器，未登记的主机按默认大小建池"""
+        adapter = self._match(url)
+        if adapter is None:
+            self.configure(self.host_prefix(url), self.default_pool_size)
+            adapter = self._match(url)
+        return adapter
+
+    def snapshot(self) -> Dict[str, Any]:
+        """连接复用统计：请求数、新建连接数（按前缀）以及DNS缓存命中"""
+        with self._lock:
+            routes = {prefix: list(route['adapters']) for prefix, route in self._routes.items()}
+        hosts = {}
+        for prefix, adapters in routes.items():
+            request_count = connection_count = 0
+            for adapter in adapters:
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        request_count += pool.num_requests
+                        connection_count += pool.num_connections
+            hosts[prefix] = {'requests': request_count, 'connections': connection_count}
+        total_requests = sum(host['requests'] for host in hosts.values())
+        total_connections = sum(host['connections'] for host in hosts.values())
+        return {
+            'requests': total_requests,
+            'connections': total_connections,
+            'reuse_rate': round(1 - total_connections / total_requests, 3) if total_requests else 0.0,
+            'dns_hits': self.dns.hits,
+            'dns_misses': self.dns.misses,
+            'hosts': hosts
+        }
+
+    def close(self):
+        """关闭所有连接池"""
+        with self._lock:
+            adapters = [adapter for route in self._routes.values() for adapter in route['adapters']]
+        for adapter in adapters:
+            adapter.close()
+
+http_transport = HttpTransport()
+
+class SdkRequests:
+    """seatable_api 使用的 requests 替身：当前线程绑定了会话时经该会话发送，否则原样交给 requests"""
+    def __init__(self):
+        self._local = threading.local()
+
+    @contextmanager
+    def bind(self, session: Optional[requests.Session]):
+        """在当前线程内让SDK请求走指定会话"""
+        previous = getattr(self._local, 'session', None)
+        self._local.session = session
+        try:
+            yield
+        finally:
+            self._local.session = previous
+
+    def _target(self):
+        return getattr(self._local, 'session', None) or requests
+
+    def request(self, method, url, **kwargs):
+        return self._target().request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self._target().get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._target().post(url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self._target().put(url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self._target().delete(url, **kwargs)
+
+    def __getattr__(self, name):
+        # 异常类等其它属性照旧取自 requests
+        return getattr(requests, name)
+
+sdk_requests = SdkRequests()
+
+def install_sdk_requests():
+    """让 seatable_api 的请求经过 sdk_requests（可重复调用）"""
+    # seatable-api 4.x 在模块级直接调用 requests、没有会话接口；未绑定会话的线程行为不变
+    for module_name in ('seatable_api.main', 'seatable_api.api_gateway'):
+        module = sys.modules.get(module_name)
+        if module is not None and getattr(module, 'requests', None) is requests:
+            module.requests = sdk_requests
+
+class MeteredClient:
+    """SeaTable客户端代理：调用经所属线程的会话发送，调用前通知 on_call(方法名)，遇到限流或服务端错误时通知 on_status(状态码)"""
+    def __init__(self, client: Base, session: Optional[requests.Session] = None,
+                 on_call: Optional[Callable[[str], None]] = None,
+                 on_status: Optional[Callable[[int], None]] = None):
+        self._client = client
+        self._session = session
+        self._on_call = on_call
+        self._on_status = on_status
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            if self._on_call:
+                self._on_call(name)
+            try:
+                with sdk_requests.bind(self._session):
+                    return attr(*args, **kwargs)
+            except ConnectionError as e:
+                # SDK 以 ConnectionError(状态码, 内容) 报告非2xx响应
+                if self._on_status and e.args and e.args[0] in THROTTLE_STATUS_CODES:
+                    self._on_status(e.args[0])
+                raise
+        return call
+
+class SeaTableClientPool:
+    """SeaTable客户端池：每个工作线程一个已认证的客户端和自己的keep-alive会话，连接池按线程数设定"""
+    def __init__(self, base: Base, pool_size: int, on_status: Optional[Callable[[int], None]] = None,
+                 on_call: Optional[Callable[[str], None]] = None):
+        self.base = base
+        self.pool_size = pool_size
+        self.on_status = on_status
+        self.on_call = on_call
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions: List[requests.Session] = []
+        install_sdk_requests()
+        # 下载链接等非SDK请求经共享传输层，SeaTable各服务地址的连接池同样按工作线程数扩容
+        for attr in ('server_url', 'dtable_server_url', 'dtable_db_url'):
+            if url := getattr(base, attr, None):
+                http_transport.configure(str(url), pool_size, on_status=on_status)
+
+    def _ensure(self):
+        """为当前线程创建客户端和会话"""
+        if getattr(self._local, 'client', None) is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=3, pool_maxsize=self.pool_size)  # 3个服务地址
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            # 复制已认证的base，各线程共享认证信息，SDK调用经本线程的会话复用连接
+            self._local.client = MeteredClient(copy.copy(self.base), session, self.on_call, self.on_status)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+
+    @property
+    def client(self) -> Base:
+        """当前线程的SeaTable客户端"""
+        self._ensure()
+        return self._local.client
+
+    @property
+    def thread_session(self) -> requests.Session:
+        """当前线程SeaTable客户端使用的会话"""
+        self._ensure()
+        return self._local.session
+
+    @property
+    def session(self) -> requests.Session:
+        """共享的HTTP会话"""
+        return http_transport.session
 
-    def update_record_status(self, url: str, status: str, image_bed_url: str = None):
-        """更新记录状态"""
-        with self._save_lock:
-            if url in self.current_records:
-                old_status = self.current_records[url].get('status')
-                self.current_records[url]['status'] = status
-                if image_bed_url:
-                    self.current_records[url]['image_bed_url'] = image_bed_url
-                
-                # 如果状态从失败变为成功，从失败列表中移除
-                if old_status == 'failed' and status == 'success':
-                    self.failed_records = [r for r in self.failed_records if r['url'] != url]
-                # 如果状态从成功变为失败，添加到失败列表
-                elif old_status == 'success' and status == 'failed':
-                    self.add_failed_record(url, "状态更新为失败")
+    @property
+    def size(self) -> int:
+        """已创建的客户端数"""
+        with self._lock:
+            return len(self._sessions)
 
-    def clear_all_records(self):
-        """清理所有记录"""
-        with self._save_lock:
-            failed_count = len(self.failed_records)
-            self.current_records.clear()
-            self.failed_records.clear()
-            logger.info(f"[历史] 🧹 清理所有记录完成 (清理了 {failed_count} 条失败记录)")
+    def close(self):
+        """关闭各线程的会话"""
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
 
-class ImageBed:
-    """图床管理器"""
-    def __init__(self, upload_api: str, size_limit: int = 5):
-        self.upload_api = upload_api
-        self.size_limit = size_limit * 1024 * 1024  # 转换为字节
-        self.session = create_session()
+class MemoryTracer:
+    """内存追踪：在阶段边界做 tracemalloc 快照，记录当前/峰值占用、分配最多的位置及相对上一快照的增长"""
+    FILTERS = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    )
 
-    def upload_image(self, file_path: str) -> Optional[str]:
-        """上传图片到图床"""
-        try:
-            # 检查文件大小
-            file_size = os.path.getsize(file_path)
-            if file_size > self.size_limit:
-                logger.warning(f"[上传] ⚠️ 文件大小超过限制: {ImageProcessor.format_file_size(file_size)}")
-                return None
+    def __init__(self, top: int = MEMORY_TOP_SITES):
+        self.top = top
+        self.phases: List[Dict[str, Any]] = []
+        self._previous = None
+        self._top_sites: List[str] = []
 
-            # 上传文件
-            with open(file_path, 'rb') as f:
-                files = {'file': f}
-                logger.info(f"[上传] 📤 正在上传到图床: {self.upload_api}")
-                response = self.session.post(self.upload_api, files=files, timeout=60)
+    def start(self):
+        tracemalloc.start()
+        logger.info("[内存] 🔬 已开启内存追踪")
 
-            if response.status_code == 200:
-                result = response.json()
-                if url := result.get('url'):
-                    logger.info(f"[上传] ✅ 上传成功: {url}")
-                    return url
-                logger.error(f"[上传] ❌ 上传失败: {result.get('message', '未知错误')}")
-            else:
-                logger.error(f"[上传] ❌ 上传失败，状态码: {response.status_code}")
+    @staticmethod
+    def _site(stat) -> str:
+        frame = stat.traceback[0]
+        return f"{os.path.basename(frame.filename)}:{frame.lineno}"
 
-        except Exception as e:
-            logger.error(f"[上传] ❌ 上传过程出错: {str(e)}")
+    def snapshot(self, label: str):
+        """在阶段边界记录快照，只保留上一快照用于比较"""
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(self.FILTERS)
+        growth = []
+        if self._previous is not None:
+            growth = [
+                f"{ImageProcessor.format_file_size(stat.size_diff)} ({stat.count_diff:+d}) {self._site(stat)}"
+                for stat in snapshot.compare_to(self._previous, 'lineno')[:self.top] if stat.size_diff > 0
+            ]
+        self._top_sites = [
+            f"{ImageProcessor.format_file_size(stat.size)} ({stat.count}) {self._site(stat)}"
+            for stat in snapshot.statistics('lineno')[:self.top]
+        ]
+        self._previous = snapshot
+        self.phases.append({'label': label, 'current': current, 'peak': peak, 'growth': growth})
+        logger.info(f"[内存] 📸 {label}: 当前 {ImageProcessor.format_file_size(current)}, "
+                    f"峰值 {ImageProcessor.format_file_size(peak)}")
 
-        return None
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
 
-def create_session():
-    """创建带重试的会话"""
-    session = requests.Session()
-    retry = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["GET", "POST"]
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-    return session
+    def format_report(self) -> str:
+        """内存报告：各阶段占用、增长最多的位置和最后一次快照中分配最多的位置"""
+        if not self.phases:
+            return ''
+        lines = ["=" * 50, "内存分析", "=" * 50]
+        for phase in self.phases:
+            lines.append(f"[{phase['label']}] 当前 {ImageProcessor.format_file_size(phase['current'])}, "
+                         f"峰值 {ImageProcessor.format_file_size(phase['peak'])}")
+            lines.extend(f"  + {line}" for line in phase['growth'])
+        lines.extend(["", "分配最多的位置:"])
+        lines.extend(f"  - {line}" for line in self._top_sites)
+        return "\n".join(lines)
 
 def cleanup_temp_files():
     """清理临时文件"""
@@ -317,33 +2328,305 @@ def cleanup_temp_files():
 def notify_status(title: str, content: str):
     """发送通知到青龙面板"""
     try:
-        url = 'http://localhost:5700/api/sendNotify'
         data = {
             'title': title,
             'content': content
         }
-        requests.post(url, json=data, timeout=5)
+        # 通知接口不重试，避免面板不可用时拖慢收尾
+        http_transport.configure(NOTIFY_URL, 1, retries=0)
+        http_transport.session.post(NOTIFY_URL, json=data, timeout=5)
     except:
         pass  # 通知失败不影响主流程
 
-def update_stats(new_stats: Dict[str, int]):
-    """更新运行统计"""
-    try:
-        stats = {}
-        if os.path.exists(STATS_FILE):
-            with open(STATS_FILE, 'r') as f:
-                stats = json.load(f)
-                
-        stats['last_run'] = time.strftime('%Y-%m-%d %H:%M:%S')
-        stats['total_runs'] = stats.get('total_runs', 0) + 1
-        stats['total_images'] = stats.get('total_images', 0) + new_stats['images']
-        stats['total_success'] = stats.get('total_success', 0) + new_stats['success']
-        stats['total_ignored_domain'] = stats.get('total_ignored_domain', 0) + new_stats['ignored_domain']
-        
-        with open(STATS_FILE, 'w') as f:
-            json.dump(stats, f, indent=2, ensure_ascii=False)
-    except:
-        pass
+class RunHistoryStore:
+    """运行历史：每次运行追加一条记录（SQLite），按base拆分明细"""
+    def __init__(self, db_path: str = RUNS_DB):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    started_at TEXT NOT NULL,
+                    duration REAL NOT NULL,
+                    images INTEGER NOT NULL,
+                    success INTEGER NOT NULL,
+                    failed INTEGER NOT NULL,
+                    skipped INTEGER NOT NULL,
+                    images_per_sec REAL NOT NULL,
+                    bytes_down INTEGER NOT NULL,
+                    bytes_up INTEGER NOT NULL,
+                    api_calls INTEGER NOT NULL,
+                    errors INTEGER NOT NULL,
+                    stage_times TEXT NOT NULL,
+                    extra TEXT NOT NULL DEFAULT '{}'
+                );
+                CREATE TABLE IF NOT EXISTS run_bases (
+                    run_id INTEGER NOT NULL REFERENCES runs(id),
+                    base_name TEXT NOT NULL,
+                    images INTEGER NOT NULL,
+                    success INTEGER NOT NULL,
+                    failed INTEGER NOT NULL,
+                    bytes_down INTEGER NOT NULL,
+                    bytes_up INTEGER NOT NULL,
+                    api_calls INTEGER NOT NULL,
+                    errors INTEGER NOT NULL,
+                    stage_times TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_run_bases_run ON run_bases(run_id);
+                CREATE TABLE IF NOT EXISTS base_fingerprints (
+                    base_key TEXT PRIMARY KEY,
+                    base_name TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    audited_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS api_usage (
+                    day TEXT NOT NULL,
+                    base_key TEXT NOT NULL,
+                    base_name TEXT NOT NULL,
+                    call_type TEXT NOT NULL,
+                    calls INTEGER NOT NULL,
+                    PRIMARY KEY (day, base_key, call_type)
+                );
+            """)
+
+    @contextmanager
+    def _connect(self):
+        """打开数据库连接：块内为一个事务，退出时关闭连接"""
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn, conn:
+            conn.row_factory = sqlite3.Row
+            yield conn
+
+    def record_run(self, started_at: float, duration: float, run_stats: Dict[str, Any],
+                   run_metrics: RunMetrics, extra: Optional[Dict[str, Any]] = None) -> int:
+        """追加一次运行记录，返回记录ID"""
+        totals = run_metrics.totals()
+        migrated = run_stats.get('success', 0)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (started_at, duration, images, success, failed, skipped, images_per_sec, "
+                "bytes_down, bytes_up, api_calls, errors, stage_times, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started_at)),
+                    round(duration, 3),
+                    run_stats.get('images', 0),
+                    migrated,
+                    run_stats.get('failed', 0),
+                    run_stats.get('skipped', 0),
+                    round(migrated / duration, 4) if duration > 0 else 0.0,
+                    totals['bytes_down'],
+                    totals['bytes_up'],
+                    totals['api_calls'],
+                    totals['errors'],
+                    json.dumps({k: round(v, 3) for k, v in run_metrics.stage_times.items()}),
+                    json.dumps(extra or {}, ensure_ascii=False, default=str)
+                )
+            )
+            run_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO run_bases (run_id, base_name, images, success, failed, bytes_down, bytes_up, "
+                "api_calls, errors, stage_times) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (run_id, base_name, base['images'], base['success'], base['failed'], base['bytes_down'],
+                     base['bytes_up'], base['api_calls'], base['errors'],
+                     json.dumps({k: round(v, 3) for k, v in base['stage_times'].items()}))
+                    for base_name, base in run_metrics.bases.items()
+                ]
+            )
+        return run_id
+
+    def recent_runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """最近的运行记录（按时间倒序）"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def run_bases(self, run_id: int) -> List[Dict[str, Any]]:
+        """某次运行的base明细"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM run_bases WHERE run_id = ? ORDER BY base_name", (run_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def baseline(self, before_id: int, window: int = REGRESSION_WINDOW) -> Optional[float]:
+        """某次运行之前的吞吐基线（最近有迁移的运行的中位数）"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT images_per_sec FROM runs WHERE id < ? AND success > 0 ORDER BY id DESC LIMIT ?",
+                (before_id, window)
+            ).fetchall()
+        values = [row['images_per_sec'] for row in rows]
+        return statistics.median(values) if len(values) >= 3 else None
+
+    def check_regression(self, run: Dict[str, Any], threshold: float = REGRESSION_THRESHOLD) -> Optional[str]:
+        """吞吐明显低于基线时返回告警信息"""
+        if not run['success']:
+            return None
+        baseline = self.baseline(run['id'])
+        if baseline and run['images_per_sec'] < baseline * threshold:
+            return (f"吞吐下降: {run['images_per_sec']:.3f} 张/秒, "
+                    f"低于基线 {baseline:.3f} 张/秒的 {threshold:.0%}")
+        return None
+
+    def get_fingerprint(self, base_key: str) -> Optional[Dict[str, Any]]:
+        """上次完整处理后记录的base指纹"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM base_fingerprints WHERE base_key = ?", (base_key,)).fetchone()
+        return dict(row) if row else None
+
+    def save_fingerprint(self, base_key: str, base_name: str, fingerprint: str):
+        """记录base完整处理后的指纹"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO base_fingerprints (base_key, base_name, fingerprint, audited_at) VALUES (?, ?, ?, ?)",
+                (base_key, base_name, fingerprint, time.time())
+            )
+
+    def api_usage(self, day: str, base_key: str) -> int:
+        """某个base当日累计的API调用数"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT COALESCE(SUM(calls), 0) AS calls FROM api_usage WHERE day = ? AND base_key = ?",
+                               (day, base_key)).fetchone()
+        return row['calls']
+
+    def add_api_usage(self, day: str, counts: Dict[Tuple[str, str, str], int]):
+        """累加API调用数，counts 为 (base_key, base名称, 调用类型) -> 次数"""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO api_usage (day, base_key, base_name, call_type, calls) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(day, base_key, call_type) DO UPDATE SET calls = calls + excluded.calls, "
+                "base_name = excluded.base_name",
+                [(day, base_key, base_name, call_type, calls)
+                 for (base_key, base_name, call_type), calls in counts.items()]
+            )
+
+    def format_trends(self, limit: int = 20) -> str:
+        """运行趋势报告"""
+        runs = self.recent_runs(limit)
+        if not runs:
+            return "暂无运行记录"
+        lines = [
+            "=" * 50,
+            f"最近 {len(runs)} 次运行趋势",
+            "=" * 50,
+            f"{'时间':<20}{'耗时(秒)':>10}{'成功':>7}{'失败':>7}{'张/秒':>9}{'下载':>11}{'API':>7}  状态"
+        ]
+        for run in runs:
+            warning = self.check_regression(run)
+            lines.append(
+                f"{run['started_at']:<20}{run['duration']:>10.1f}{run['success']:>7}{run['failed']:>7}"
+                f"{run['images_per_sec']:>9.3f}{ImageProcessor.format_file_size(run['bytes_down']):>11}"
+                f"{run['api_calls']:>7}  {'⚠️ ' + warning if warning else '正常'}"
+            )
+
+        latest = runs[0]
+        lines.extend(["", f"最近一次运行阶段耗时: {latest['stage_times']}", "", "按base明细:"])
+        for base in self.run_bases(latest['id']):
+            lines.append(
+                f"  - {base['base_name']}: 图片 {base['images']}, 成功 {base['success']}, 失败 {base['failed']}, "
+                f"下载 {ImageProcessor.format_file_size(base['bytes_down'])}, API {base['api_calls']}, "
+                f"阶段 {base['stage_times']}"
+            )
+        return "\n".join(lines)
+
+class ApiQuota:
+    """SeaTable API调用计数：按base和调用类型统计，累计当日用量，接近每日预算时放慢、用尽时推迟剩余工作"""
+    def __init__(self, daily_budget: int = API_DAILY_BUDGET, slowdown: float = API_BUDGET_SLOWDOWN,
+                 db_path: str = RUNS_DB):
+        self.daily_budget = daily_budget
+        self.slowdown = slowdown
+        self.db_path = db_path
+        self.day = time.strftime('%Y-%m-%d')
+        self.calls: Dict[str, Dict[str, int]] = {}  # base_key -> 调用类型 -> 本次运行的调用数
+        self.names: Dict[str, str] = {}  # base_key -> base名称（以最近一次为准）
+        self._used: Dict[str, int] = {}  # base_key -> 当日已用（含此前的运行）
+        self._unsaved: Dict[Tuple[str, str, str], int] = {}  # (base_key, base名称, 类型) -> 未保存的调用数
+        self._exhausted = set()
+        self._store: Optional[RunHistoryStore] = None
+        self._lock = threading.Lock()
+
+    def _used_today(self, base_key: str) -> int:
+        """当日已用调用数（需持有锁），首次查询时读取此前运行的用量"""
+        if base_key not in self._used:
+            try:
+                if self._store is None:
+                    self._store = RunHistoryStore(self.db_path)
+                self._used[base_key] = self._store.api_usage(self.day, base_key)
+            except Exception as e:
+                logger.error(f"[API] ❌ 读取当日API用量失败: {str(e)}")
+                self._used[base_key] = 0
+        return self._used[base_key]
+
+    def _roll_day(self):
+        """跨天后重新计数（需持有锁）"""
+        today = time.strftime('%Y-%m-%d')
+        if today != self.day:
+            self._flush()
+            self.day = today
+            self._used.clear()
+            self._exhausted.clear()
+
+    def record(self, base_key: str, base_name: str, call_type: str) -> float:
+        """记录一次调用，返回接近预算时建议等待的秒数"""
+        with self._lock:
+            self._roll_day()
+            used = self._used_today(base_key) + 1
+            self._used[base_key] = used
+            self.names[base_key] = base_name
+            by_type = self.calls.setdefault(base_key, {})
+            by_type[call_type] = by_type.get(call_type, 0) + 1
+            key = (base_key, base_name, call_type)
+            self._unsaved[key] = self._unsaved.get(key, 0) + 1
+        if self.daily_budget <= 0:
+            return 0.0
+        ratio = used / self.daily_budget
+        if ratio < self.slowdown:
+            return 0.0
+        # 超过放慢阈值后每次调用的等待时间线性增加，最多 QUOTA_MAX_DELAY 秒
+        return QUOTA_MAX_DELAY * min(1.0, (ratio - self.slowdown) / max(1 - self.slowdown, 1e-6))
+
+    def is_exhausted(self, base_key: str) -> bool:
+        """当日预算是否已用尽"""
+        if self.daily_budget <= 0:
+            return False
+        with self._lock:
+            self._roll_day()
+            exhausted = self._used_today(base_key) >= self.daily_budget
+            first = exhausted and base_key not in self._exhausted
+            if first:
+                self._exhausted.add(base_key)
+        if first:
+            logger.warning(f"[API] ⛔ 当日API调用预算已用尽 ({self.daily_budget}次)，剩余工作推迟到下次运行")
+        return exhausted
+
+    def usage(self, base_key: str) -> int:
+        """当日已用调用数"""
+        with self._lock:
+            return self._used_today(base_key)
+
+    def _flush(self):
+        """保存未写入的调用数（需持有锁）"""
+        if not self._unsaved:
+            return
+        try:
+            if self._store is None:
+                self._store = RunHistoryStore(self.db_path)
+            self._store.add_api_usage(self.day, self._unsaved)
+            self._unsaved = {}
+        except Exception as e:
+            logger.error(f"[API] ❌ 保存API用量失败: {str(e)}")
+
+    def save(self):
+        """保存本次运行新增的调用数，供之后的运行计算当日用量"""
+        with self._lock:
+            self._flush()
+
+    def totals(self) -> Dict[str, int]:
+        """按调用类型合计"""
+        with self._lock:
+            totals: Dict[str, int] = {}
+            for by_type in self.calls.values():
+                for call_type, count in by_type.items():
+                    totals[call_type] = totals.get(call_type, 0) + count
+            return totals
 
 def check_environment() -> bool:
     """检查运行环境"""
@@ -365,9 +2648,9 @@ def check_environment() -> bool:
 
 class Config:
     """配置管理"""
-    def __init__(self):
-        """初始化配置"""
-        self.config = self._load_from_env()
+    def __init__(self, bases: Optional[List[Dict[str, str]]] = None):
+        """初始化配置，bases 不为空时不再从环境变量读取token（用于模拟测试）"""
+        self.config = self._load_from_env(bases)
 
     def _parse_base_tokens(self, tokens_str: str) -> List[Dict[str, str]]:
         """解析base tokens
@@ -391,54 +2674,203 @@ class Config:
         
         return bases
 
-    def _load_from_env(self) -> Dict[str, Any]:
+    def _load_from_env(self, bases: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
         """从环境变量加载配置"""
         # 获取并解析base tokens
-        base_tokens_str = os.getenv('SEATABLE_API_TOKENS') or os.getenv('SEATABLE_API_TOKEN')
-        if not base_tokens_str:
-            raise Exception("环境变量未设置: SEATABLE_API_TOKENS 或 SEATABLE_API_TOKEN")
-            
-        bases = self._parse_base_tokens(base_tokens_str)
         if not bases:
-            raise Exception("无效的API Token配置")
+            base_tokens_str = os.getenv('SEATABLE_API_TOKENS') or os.getenv('SEATABLE_API_TOKEN')
+            if not base_tokens_str:
+                raise Exception("环境变量未设置: SEATABLE_API_TOKENS 或 SEATABLE_API_TOKEN")
+
+            bases = self._parse_base_tokens(base_tokens_str)
+            if not bases:
+                raise Exception("无效的API Token配置")
 
         return {
+            'http': {
+                'timeout': float(os.getenv('SYNC_HTTP_TIMEOUT', str(HTTP_TIMEOUT)))
+            },
             'seatable': {
                 'bases': bases,
                 'server_url': os.getenv('SEATABLE_SERVER_URL', 'https://cloud.seatable.cn')
             },
             'image_bed': {
                 'upload_api': os.getenv('IMAGE_BED_API', 'https://img.shuang.fun/api/tgchannel'),
+                'hosts': [host for host in os.getenv('IMAGE_BED_HOSTS', '').split(',') if host.strip()],  # 图床链接的其它主机
                 'size_limit': int(os.getenv('IMAGE_SIZE_LIMIT', '5'))  # 默认5MB
+            },
+            'scheduler': {
+                'fresh_seconds': int(os.getenv('SYNC_FRESH_SECONDS', str(FRESH_ROW_SECONDS))),
+                'initial_concurrency': int(os.getenv('SYNC_CONCURRENCY', str(INITIAL_CONCURRENCY))),
+                'min_concurrency': int(os.getenv('SYNC_MIN_CONCURRENCY', str(MIN_CONCURRENCY))),
+                'max_concurrency': int(os.getenv('SYNC_MAX_CONCURRENCY', str(MAX_CONCURRENCY))),
+                'inflight_bytes': int(float(os.getenv('SYNC_INFLIGHT_MB', str(INFLIGHT_BYTES_BUDGET // 1024 // 1024))) * 1024 * 1024),
+                'table_concurrency': int(os.getenv('SYNC_TABLE_CONCURRENCY', str(TABLE_CONCURRENCY))),
+                'time_budget': float(os.getenv('SYNC_TIME_BUDGET', '0')),
+                'audit_hours': float(os.getenv('SYNC_AUDIT_HOURS', str(AUDIT_INTERVAL_HOURS)))
+            },
+            'cache': {
+                'dir': os.getenv('SYNC_CACHE_DIR', CACHE_DIR),
+                'max_bytes': int(float(os.getenv('SYNC_CACHE_SIZE_MB', str(CACHE_MAX_SIZE // 1024 // 1024))) * 1024 * 1024)
+            },
+            'mapping': {
+                'import': [path for path in (os.getenv('SYNC_MAPPING_IMPORT') or os.getenv('SYNC_MAPPING_FILE', '')).split(',') if path],
+                'export': os.getenv('SYNC_MAPPING_EXPORT') or os.getenv('SYNC_MAPPING_FILE', '')
+            },
+            'api': {
+                'daily_budget': int(os.getenv('SYNC_API_DAILY_BUDGET', str(API_DAILY_BUDGET))),
+                'slowdown': float(os.getenv('SYNC_API_SLOWDOWN', str(API_BUDGET_SLOWDOWN)))
+            },
+            'reclaim': {
+                'enabled': os.getenv('SYNC_RECLAIM_ASSETS', '0').lower() in ('1', 'true', 'yes'),
+                'batch_size': int(os.getenv('SYNC_RECLAIM_BATCH', str(RECLAIM_BATCH_SIZE))),
+                'batch_delay': float(os.getenv('SYNC_RECLAIM_DELAY', str(RECLAIM_BATCH_DELAY))),
+                'delete_api': os.getenv('SYNC_ASSET_DELETE_API', ASSET_DELETE_API)
+            },
+            'report': {
+                'dir': os.getenv('SYNC_REPORT_DIR', REPORT_DIR),
+                'keep': int(os.getenv('SYNC_REPORT_KEEP', str(REPORT_KEEP)))
+            },
+            'verify': {
+                'sample_rate': float(os.getenv('SYNC_VERIFY_SAMPLE', str(VERIFY_SAMPLE_RATE))),
+                'concurrency': int(os.getenv('SYNC_VERIFY_CONCURRENCY', str(VERIFY_CONCURRENCY)))
+            },
+            'phash': {
+                'enabled': os.getenv('SYNC_PHASH', '0').lower() in ('1', 'true', 'yes'),
+                'max_distance': int(os.getenv('SYNC_PHASH_DISTANCE', str(PHASH_MAX_DISTANCE)))
+            },
+            'daemon': {
+                'host': os.getenv('SYNC_DAEMON_HOST', DAEMON_HOST),
+                'port': int(os.getenv('SYNC_DAEMON_PORT', str(DAEMON_PORT))),
+                'poll_interval': float(os.getenv('SYNC_POLL_INTERVAL', str(DAEMON_POLL_INTERVAL))),
+                'batch_window': float(os.getenv('SYNC_BATCH_WINDOW', str(DAEMON_BATCH_WINDOW))),
+                'retry_interval': float(os.getenv('SYNC_DAEMON_RETRY_INTERVAL', str(DAEMON_RETRY_INTERVAL))),
+                'webhook_token': os.getenv('SYNC_WEBHOOK_TOKEN', '')
             }
         }
 
+def create_concurrency_controller(config: Config) -> ConcurrencyController:
+    """根据配置创建并发控制器"""
+    scheduler_config = config.config['scheduler']
+    return ConcurrencyController(
+        initial=scheduler_config['initial_concurrency'],
+        min_limit=scheduler_config['min_concurrency'],
+        max_limit=scheduler_config['max_concurrency'],
+        byte_budget=scheduler_config['inflight_bytes']
+    )
+
+def create_blob_cache(config: Config) -> Optional[BlobCache]:
+    """根据配置创建下载缓存，容量为0时不启用"""
+    cache_config = config.config['cache']
+    if cache_config['max_bytes'] <= 0:
+        return None
+    try:
+        return BlobCache(cache_config['dir'], cache_config['max_bytes'])
+    except Exception as e:
+        logger.error(f"[缓存] ❌ 初始化缓存失败，本次不使用缓存: {str(e)}")
+        return None
+
+def create_phash_index(config: Config) -> Optional[PerceptualIndex]:
+    """根据配置创建感知哈希索引，未启用或缺少Pillow时不使用"""
+    phash_config = config.config['phash']
+    if not phash_config['enabled']:
+        return None
+    if Image is None:
+        logger.warning("[近似] ⚠️ 未安装Pillow，近似重复检测不可用")
+        return None
+    try:
+        return PerceptualIndex(max_distance=phash_config['max_distance'])
+    except Exception as e:
+        logger.error(f"[近似] ❌ 初始化感知哈希索引失败，本次不使用: {str(e)}")
+        return None
+
+def create_api_quota(config: Config) -> ApiQuota:
+    """根据配置创建API调用计数和每日预算"""
+    api_config = config.config['api']
+    return ApiQuota(api_config['daily_budget'], api_config['slowdown'])
+
+def create_report_writer(config: Config) -> ReportWriter:
+    """根据配置创建详细报告写入器"""
+    report_config = config.config['report']
+    return ReportWriter(report_config['dir'], report_config['keep'])
+
+def create_upload_verifier(config: Config) -> Optional[UploadVerifier]:
+    """根据配置创建上传结果校验器，抽样比例为0时不校验"""
+    verify_config = config.config['verify']
+    if verify_config['sample_rate'] <= 0:
+        return None
+    return UploadVerifier(min(1.0, verify_config['sample_rate']), verify_config['concurrency'],
+                          config.config['http']['timeout'])
+
+def create_asset_reclaimer(config: Config, verifier: Optional[UploadVerifier]) -> Optional[AssetReclaimer]:
+    """根据配置创建素材回收器（默认关闭）；删除前总是实际校验图床链接，未开启校验时单独建一个"""
+    reclaim_config = config.config['reclaim']
+    if not reclaim_config['enabled']:
+        return None
+    return AssetReclaimer(verifier or UploadVerifier(1.0, config.config['verify']['concurrency'],
+                                                     config.config['http']['timeout']),
+                          reclaim_config['batch_size'], reclaim_config['batch_delay'])
+
 class SeaTableManager:
     """SeaTable管理器"""
-    def __init__(self, config: Config, api_token: str):
+    def __init__(self, config: Config, api_token: str, concurrency: Optional[ConcurrencyController] = None,
+                 blob_cache: Optional[BlobCache] = None):
         self.config = config
         self.api_token = api_token
+        self.http_timeout = config.config['http']['timeout']
         self.base = self._init_base()
         self._base_name = None
+        self.concurrency = concurrency or create_concurrency_controller(config)
+        self.blob_cache = blob_cache if blob_cache is not None else create_blob_cache(config)
         image_bed_config = config.config['image_bed']
         self.image_bed = ImageBed(
             upload_api=image_bed_config['upload_api'],
-            size_limit=image_bed_config['size_limit']
+            size_limit=image_bed_config['size_limit'],
+            limiter=self.concurrency.upload,
+            hosts=image_bed_config['hosts'],
+            timeout=self.http_timeout
+        )
+        self.client_pool = SeaTableClientPool(
+            self.base,
+            pool_size=self.concurrency.worker_count,
+            on_status=self.concurrency.download.on_throttle,
+            on_call=self._on_api_call
         )
-        self.session = create_session()
         self.image_history = ImageHistory()
+        self.inflight = InFlightRegistry()
+        self.phash_index: Optional[PerceptualIndex] = None
+        self.verifier: Optional[UploadVerifier] = None
+        self.api_quota: Optional[ApiQuota] = None
+        self.reclaimer: Optional[AssetReclaimer] = None
+        self.report_writer: Optional[ReportWriter] = None
+        self.previous_failures = set()  # 上次运行失败的源URL，排在未迁移过的图片之后
         self.task_queue = TaskQueue()
+        self.scheduler = TaskScheduler(self.task_queue, self.execute_task, workers=self.concurrency.worker_count,
+                                       is_expired=self.out_of_budget)
+        self.fresh_seconds = config.config['scheduler']['fresh_seconds']
+        self.scope = SyncScope()
         self.processing = False
         self._stats_lock = threading.Lock()
         # 添加日志记录字典
         self.processing_logs = {
             'bases': {},
-            'success_records': [],
-            'failure_records': [],
+            'success_count': 0,
+            'failure_count': 0,
+            'failure_reasons': Counter(),  # 归类后的失败原因 -> 次数，逐条记录只写入详细报告
             'skip_count': 0,
             'ignored_domain_count': 0
         }
 
+    @property
+    def client(self) -> Base:
+        """当前线程的SeaTable客户端"""
+        return self.client_pool.client
+
+    @property
+    def session(self) -> requests.Session:
+        """共享的HTTP会话"""
+        return self.client_pool.session
+
     @property
     def base_name(self) -> str:
         """获取base名称的属性"""
@@ -449,34 +2881,210 @@ class SeaTableManager:
         """设置base名称的属性"""
         self._base_name = value
 
+    @property
+    def base_key(self) -> str:
+        """base的稳定标识（dtable_uuid）"""
+        return str(self.base.dtable_uuid)
+
+    def _on_api_call(self, call_type: str):
+        """SeaTable API调用计数，接近每日预算时放慢"""
+        metrics.add_api_call(self.base_name)
+        if self.api_quota:
+            delay = self.api_quota.record(self.base_key, self.base_name, call_type)
+            if delay > 0:
+                time.sleep(delay)
+
+    def out_of_budget(self) -> bool:
+        """时间预算或当日API调用预算是否已用尽"""
+        return self.scope.is_expired() or bool(self.api_quota and self.api_quota.is_exhausted(self.base_key))
+
     def _init_base(self) -> Base:
         """初始化SeaTable连接"""
         seatable_config = self.config.config['seatable']
         base = Base(self.api_token, seatable_config['server_url'])
+        session = getattr(base, 'session', None)
+        if isinstance(session, requests.Session):
+            # SDK暴露会话时复用共享连接池；seatable-api 4.x 没有会话，其调用经客户端池中各线程的会话发送
+            router = TransportRouter(http_transport)
+            session.mount('http://', router)
+            session.mount('https://', router)
         base.auth()
         return base
 
-    def _download_image(self, image_url: str) -> Optional[str]:
-        """下载图片"""
+    def asset_path(self, image_url: str) -> Optional[str]:
+        """资源链接在base素材中的路径，不属于当前base时返回None"""
+        dtable_uuid = str(UUID(str(self.base.dtable_uuid)))
+        if dtable_uuid not in image_url:
+            return None
+        return unquote(image_url.split(dtable_uuid)[-1].strip('/'))
+
+    def delete_asset(self, path: str, attempts: int = 3) -> bool:
+        """删除base素材中的文件，已不存在也视为成功；限流时按 Retry-After 等待后重试"""
+        url = str(self.base.server_url).rstrip('/') + self.config.config['reclaim']['delete_api']
+        for attempt in range(attempts):
+            try:
+                self._on_api_call('delete_asset')
+                # 共享传输层只对GET/POST自动重试，删除的限流在这里处理
+                response = http_transport.session.delete(url, params={'path': '/' + path.lstrip('/')},
+                                                         headers={'Authorization': f'Token {self.api_token}'},
+                                                         timeout=self.http_timeout)
+            except Exception as e:
+                logger.error(f"[回收] ❌ 删除素材出错 {path}: {str(e)}")
+                return False
+            if response.status_code == 200:
+                logger.info(f"[回收] 🗑️ 已删除素材: {path}")
+                return True
+            if response.status_code == 404:
+                logger.info(f"[回收] ℹ️ 素材已不存在: {path}")
+                return True
+            if response.status_code not in THROTTLE_STATUS_CODES or attempt == attempts - 1:
+                break
+            retry_after = response.headers.get('Retry-After', '')
+            time.sleep(float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+        logger.error(f"[回收] ❌ 删除素材失败 ({response.status_code}): {path}")
+        return False
+
+    def _get_download_link(self, image_url: str) -> str:
+        """获取资源的临时下载链接"""
+        path = self.asset_path(image_url)
+        if path is None:
+            raise Exception('资源链接不属于当前base')
+        return self.client.get_file_download_link(path)
+
+    def _stream_download(self, image_url: str, outcome: Dict[str, Any],
+                         reservation: Optional[ByteReservation] = None) -> Tuple[Optional[str], Optional[str]]:
+        """流式下载到临时文件，返回 (临时文件, MIME类型)；非图片内容读取文件头后即中止，超过大小限制也中止"""
+        download_link = self._get_download_link(image_url)
+        # 下载链接可能在独立的文件服务器上，按下载并发为其建池
+        http_transport.configure(HttpTransport.host_prefix(download_link), self.client_pool.pool_size,
+                                 on_status=self.concurrency.download.on_throttle)
+        response = self.session.get(download_link, stream=True, timeout=self.http_timeout)
+        responses = [response]  # 续传时新建的响应也在结束时关闭
+        chunks = None
         try:
-            # 创建临时文件
-            ext = ImageProcessor.get_file_extension(image_url)
+            outcome['status'] = response.status_code
+            if response.status_code != 200:
+                outcome['ok'] = False
+                logger.error(f"[下载] ❌ 下载失败，状态码: {response.status_code}")
+                return None, None
+
+            # 已知大小时按实际大小调整字节预算
+            content_length = int(response.headers.get('Content-Length') or 0)
+            if content_length > self.image_bed.size_limit:
+                logger.warning(f"[下载] ⚠️ 文件大小超过限制，跳过下载: {ImageProcessor.format_file_size(content_length)}")
+                return None, None
+            if reservation and content_length:
+                reservation.resize(content_length)
+
+            # 读取文件头并识别真实类型（文件头和其余内容一样可以续传）
+            chunks = self._iter_resumable(download_link, responses, content_length)
+            header = b''
+            for chunk in chunks:
+                header += chunk
+                if len(header) >= SNIFF_SIZE:
+                    break
+
+            sniffed = ImageProcessor.sniff_image_type(header)
+            ImageProcessor.cache_sniff_result(image_url, sniffed)
+            if not sniffed:
+                content_type = response.headers.get('Content-Type', '未知')
+                logger.warning(f"[下载] ⚠️ 非图片内容，中止下载: {content_type}")
+                return None, None
+
+            ext, mime_type = sniffed
             temp_file = ImageProcessor.get_temp_file(ext)
+            try:
+                with open(temp_file, 'wb') as f:
+                    f.write(header)
+                    size = self._copy_body(chunks, f, len(header))
+            except Exception:
+                os.unlink(temp_file)
+                raise
+            if size > self.image_bed.size_limit:
+                os.unlink(temp_file)
+                logger.warning(f"[下载] ⚠️ 文件大小超过限制，中止下载: {image_url}")
+                return None, None
+            return temp_file, mime_type
+        finally:
+            if chunks is not None:
+                chunks.close()
+            for item in responses:
+                item.close()
 
+    def _iter_resumable(self, download_link: str, responses: List[requests.Response], content_length: int):
+        """逐块产出下载内容；连接中断或内容不完整时按Range从已产出的位置续传"""
+        delivered = 0  # 已产出的字节数
+        skip = 0  # 服务端忽略Range从头返回时需要跳过的字节数，调用方无需回退
+        response = responses[-1]  # 当前响应，续传时新建的响应追加到 responses 由调用方关闭
+        for attempt in range(DOWNLOAD_RESUME_ATTEMPTS + 1):
+            try:
+                if response is None:
+                    response = self.session.get(download_link, stream=True, timeout=self.http_timeout,
+                                                headers={'Range': f'bytes={delivered}-'})
+                    responses.append(response)
+                    if response.status_code == 200:
+                        skip = delivered
+                    elif (response.status_code != 206 or
+                          not response.headers.get('Content-Range', '').startswith(f'bytes {delivered}-')):
+                        raise Exception(f"续传失败，状态码: {response.status_code}")
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if skip:
+                        dropped = min(skip, len(chunk))
+                        chunk = chunk[dropped:]
+                        skip -= dropped
+                        if not chunk:
+                            continue
+                    delivered += len(chunk)
+                    yield chunk
+                if not content_length or delivered >= content_length:
+                    return
+                error = f"内容不完整: {delivered}/{content_length}"
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                error = str(e)
+            if attempt >= DOWNLOAD_RESUME_ATTEMPTS:
+                break
+
+            # 保留已下载部分，从中断处续传
+            logger.warning(f"[下载] ⚠️ 下载中断，从 {ImageProcessor.format_file_size(delivered)} 处续传"
+                           f" ({attempt + 1}/{DOWNLOAD_RESUME_ATTEMPTS}): {error}")
+            if response is not None:
+                response.close()
+            response = None
+        raise Exception(f"续传 {DOWNLOAD_RESUME_ATTEMPTS} 次后仍未完成: {error}")
+
+    def _copy_body(self, chunks, f, size: int) -> int:
+        """写入剩余内容，返回累计字节数；超过大小限制时停止"""
+        for chunk in chunks:
+            size += len(chunk)
+            if size > self.image_bed.size_limit:
+                break
+            f.write(chunk)
+        return size
+
+    def _download_image(self, image_url: str, reservation: Optional[ByteReservation] = None) -> Optional[str]:
+        """下载图片（先校验文件头，非图片内容提前中止）"""
+        temp_file = None
+        try:
             logger.info(f"[下载] 📥 开始下载: {image_url}")
 
             try:
-                self.base.download_file(image_url, temp_file)
+                with metrics.stage(self.base_name, 'download_file'), self.concurrency.download.slot() as outcome:
+                    temp_file, mime_type = self._stream_download(image_url, outcome, reservation)
+                if not temp_file:
+                    return None
+
                 file_size = os.path.getsize(temp_file)
+                metrics.add_bytes(self.base_name, down=file_size)
                 if file_size > 0:
-                    logger.info(f"[下载] ✅ 下载成功: {ImageProcessor.format_file_size(file_size)}")
+                    logger.info(f"[下载] ✅ 下载成功: {ImageProcessor.format_file_size(file_size)} ({mime_type})")
                     return temp_file
                 else:
                     logger.error("[下载] ❌ 下载失败: 文件大小为0")
             except Exception as e:
                 logger.error(f"[下载] ❌ 下载失败: {str(e)}")
 
-            if os.path.exists(temp_file):
+            if temp_file and os.path.exists(temp_file):
                 os.unlink(temp_file)
             return None
 
@@ -487,27 +3095,79 @@ class SeaTableManager:
     def process_image(self, url: str) -> Optional[str]:
         """处理单个图片"""
         try:
-            # 1. 下载图片
-            temp_file = self._download_image(url)
-            if not temp_file:
+            # 已识别为非图片的内容不再下载
+            if ImageProcessor.is_known_non_image(url):
                 return None
 
+            # 1. 优先复用缓存中已下载的内容，否则下载并放入缓存
+            #    在途字节预算从下载开始占用，到上传完成后归还
+            digest = None
+            reservation = None
+            cached = self.blob_cache.get(url) if self.blob_cache else None
+            if cached:
+                temp_file, digest, mime_type = cached
+                reservation = self.concurrency.memory.reserve(os.path.getsize(temp_file))
+                ImageProcessor.cache_sniff_result(url, (os.path.splitext(temp_file)[1], mime_type))
+                logger.info(f"[缓存] ♻️ 复用已下载内容: {url}")
+            else:
+                # 大小未知时先按上传大小上限预留，拿到实际大小后调整
+                reservation = self.concurrency.memory.reserve(self.image_bed.size_limit)
+                temp_file = self._download_image(url, reservation)
+                if not temp_file:
+                    reservation.release()
+                    return None
+                reservation.resize(os.path.getsize(temp_file))
+                sniffed = ImageProcessor.get_sniff_result(url)
+                stored = self.blob_cache.put(url, temp_file, sniffed[1] if sniffed else '') if self.blob_cache and sniffed else None
+                if stored:
+                    temp_file, digest = stored
+
             try:
-                # 2. 上传到图床
-                new_url = self.image_bed.upload_image(temp_file)
+                # 2. 已上传过近似图片时直接复用其图床链接
+                phash = PerceptualIndex.dhash(temp_file) if self.phash_index else None
+                if phash is not None and (match := self.phash_index.find(phash)):
+                    reused_url, distance = match
+                    self.phash_index.audit(url, reused_url, phash, distance)
+                    self.image_history.set_content(url, digest or self._file_digest(temp_file), os.path.getsize(temp_file))
+                    with self._stats_lock:
+                        stats['near_duplicate'] += 1
+                    logger.info(f"[近似] ♻️ 复用近似图片 (距离 {distance}): {reused_url}")
+                    return reused_url
+
+                # 3. 上传到图床（使用识别出的真实MIME类型）
+                sniffed = ImageProcessor.get_sniff_result(url)
+                with metrics.stage(self.base_name, 'upload'):
+                    new_url = self.image_bed.upload_image(temp_file, mime_type=sniffed[1] if sniffed else None)
                 if new_url:
+                    file_size = os.path.getsize(temp_file)
+                    metrics.add_bytes(self.base_name, up=file_size)
+                    self.image_history.set_content(url, digest or self._file_digest(temp_file), file_size)
                     logger.info(f"[处理] ✅ 成功: {new_url}")
+                    if phash is not None:
+                        self.phash_index.add(phash, new_url, url)
                 return new_url
 
             finally:
-                # 清理临时文件
-                if os.path.exists(temp_file):
+                reservation.release()
+                # 缓存文件只解除锁定，未缓存的临时文件直接删除
+                if digest:
+                    self.blob_cache.release(digest)
+                elif os.path.exists(temp_file):
                     os.unlink(temp_file)
 
         except Exception as e:
             logger.error(f"[处理] ❌ 处理失败: {str(e)}")
             return None
 
+    @staticmethod
+    def _file_digest(file_path: str) -> str:
+        """文件内容的sha256"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
     def process_single_image(self, task: ImageTask) -> Optional[str]:
         """处理单个图片任务"""
         try:
@@ -526,7 +3186,7 @@ class SeaTableManager:
                 return None
 
             # 3. 检查是否已在图床中
-            if 'img.shuang.fun' in task.url:
+            if self.image_bed.is_hosted(task.url):
                 with self._stats_lock:
                     stats['skipped'] += 1
                     self._log_skip(task)
@@ -536,46 +3196,72 @@ class SeaTableManager:
             if history_url := self.image_history.get_record(task.url):
                 with self._stats_lock:
                     stats['from_history'] += 1
-                    self._log_success(task, history_url)
+                    self._log_success(task, history_url, 'from_history')
                 return history_url
 
-            # 5. 处理新图片
-            logger.info(f"[处理] 📥 开始处理: {task.url}")
+            # 5. 检查是否已识别为非图片内容
+            if ImageProcessor.is_known_non_image(task.url):
+                with self._stats_lock:
+                    stats['skipped'] += 1
+                    self._log_skip(task)
+                return None
+
+            # 6. 处理新图片（同一URL的并发请求共享一次转存）
+            new_url, shared = self.inflight.run(task.url, lambda: self._transfer_new_image(task))
+            if shared:
+                self._record_shared_result(task, new_url)
+            return new_url
+
+        except Exception as e:
+            error_msg = str(e)
             with self._stats_lock:
-                stats['images'] += 1
+                stats['failed'] += 1
+                self.image_history.add_failed_record(
+                    task.url,
+                    error_msg,
+                    base_name=task.base_name,
+                    table_name=task.table_name,
+                    row_id=task.row_id,
+                    row_data=task.row_data,
+                    column_name=task.column_name
+                )
+                self._log_failure(task, error_msg)
+            logger.error(f"[处理] ❌ 处理出错: {error_msg}")
+            return None
 
-            # 6. 下载并上传图片
-            try:
-                new_url = self.process_image(task.url)
-                
-                # 7. 更新统计和历史记录
-                with self._stats_lock:
-                    if new_url:
-                        stats['success'] += 1
-                        self.image_history.add_success_record(task.url, new_url)
-                        self._log_success(task, new_url)
-                        logger.info(f"[处理] ✅ 成功: {new_url}")
-                    else:
-                        stats['failed'] += 1
-                        error_msg = "下载或上传失败"
-                        self.image_history.add_failed_record(
-                            task.url,
-                            error_msg,
-                            base_name=task.base_name,
-                            table_name=task.table_name,
-                            row_id=task.row_id,
-                            row_data=task.row_data,
-                            column_name=task.column_name
-                        )
-                        self._log_failure(task, error_msg)
-                        logger.error(f"[处理] ❌ 失败: {error_msg}")
+    def _transfer_new_image(self, task: ImageTask) -> Optional[str]:
+        """下载并上传新图片，记录统计和历史"""
+        # 再次检查历史记录，前一个同URL转存可能刚刚完成
+        if history_url := self.image_history.get_record(task.url):
+            with self._stats_lock:
+                stats['from_history'] += 1
+                self._log_success(task, history_url, 'from_history')
+            return history_url
 
-                return new_url
+        # 处理新图片
+        logger.info(f"[处理] 📥 开始处理: {task.url}")
+        with self._stats_lock:
+            stats['images'] += 1
 
-            except Exception as e:
-                error_msg = str(e)
-                with self._stats_lock:
+        # 下载并上传图片
+        try:
+            new_url = self.process_image(task.url)
+            
+            # 更新统计和历史记录
+            with self._stats_lock:
+                if not new_url and ImageProcessor.is_known_non_image(task.url):
+                    stats['skipped'] += 1
+                    self._log_skip(task)
+                    logger.warning(f"[处理] ⚠️ 跳过非图片内容: {task.url}")
+                elif new_url:
+                    stats['success'] += 1
+                    self.image_history.add_success_record(task.url, new_url, task.base_name,
+                                                          task.table_name, task.column_name)
+                    self._log_success(task, new_url)
+                    logger.info(f"[处理] ✅ 成功: {new_url}")
+                else:
                     stats['failed'] += 1
+                    error_msg = "下载或上传失败"
                     self.image_history.add_failed_record(
                         task.url,
                         error_msg,
@@ -586,8 +3272,9 @@ class SeaTableManager:
                         column_name=task.column_name
                     )
                     self._log_failure(task, error_msg)
-                logger.error(f"[处理] ❌ 处理出错: {error_msg}")
-                return None
+                    logger.error(f"[处理] ❌ 失败: {error_msg}")
+
+            return new_url
 
         except Exception as e:
             error_msg = str(e)
@@ -606,15 +3293,130 @@ class SeaTableManager:
             logger.error(f"[处理] ❌ 处理出错: {error_msg}")
             return None
 
-    def update_row_callback(self, task: ImageTask, new_url: str):
-        """更新行数据的回调函数"""
+    def _record_shared_result(self, task: ImageTask, new_url: Optional[str]):
+        """记录复用了并发转存结果的图片"""
+        with self._stats_lock:
+            if new_url:
+                stats['deduplicated'] += 1
+                self._log_success(task, new_url, 'deduplicated')
+            elif ImageProcessor.is_known_non_image(task.url):
+                stats['skipped'] += 1
+                self._log_skip(task)
+            else:
+                stats['failed'] += 1
+                error_msg = "共享的转存失败"
+                self.image_history.add_failed_record(
+                    task.url,
+                    error_msg,
+                    base_name=task.base_name,
+                    table_name=task.table_name,
+                    row_id=task.row_id,
+                    row_data=task.row_data,
+                    column_name=task.column_name
+                )
+                self._log_failure(task, error_msg)
+        logger.info(f"[去重] 🔗 复用并发转存结果: {task.url}")
+
+    def execute_task(self, task: ImageTask) -> Optional[str]:
+        """调度器执行入口：重试任务直接转存，其它任务走完整检查流程"""
+        if task.lane == LANE_RETRY:
+            if history_url := self.image_history.get_record(task.url):
+                return history_url
+            new_url, _ = self.inflight.run(task.url, lambda: self.process_image(task.url))
+            return new_url
+        return self.process_single_image(task)
+
+    def commit_row(self, table_name: str, row_id: str, column_name: str, images: List[Any], row_info: str = '') -> bool:
+        """回写一行的图片列，返回是否成功"""
         try:
-            self.base.update_row(task.table_name, task.row_id, {
-                task.column_name: new_url
-            })
-            logger.info(f"[更新] ✅ {task.table_name} - {task.row_id} - {task.column_name}")
+            with metrics.stage(self.base_name, 'update_row'):
+                self.client.update_row(table_name, row_id, {column_name: images})
+            logger.info(f"[更新] ✅ 行更新成功: {row_info or row_id}")
+            return True
+        except Exception as e:
+            logger.error(f"[更新] ❌ 行更新失败: {str(e)}")
+            return False
+
+    def reject_upload(self, task: ImageTask, new_url: str):
+        """图床链接校验失败：该图片保留原图并记为失败，留给重试，也不再复用这个链接"""
+        error_msg = f"图床链接校验失败: {new_url}"
+        with self._stats_lock:
+            stats['verify_failed'] += 1
+            stats['failed'] += 1
+            if task.source:
+                # 撤销之前计入的成功统计，详细报告中随后追加失败记录
+                stats[task.source] -= 1
+                metrics.revoke_success(task.base_name)
+                task.source = ''
+                self.processing_logs['success_count'] -= 1
+                table_stats = self.processing_logs['bases'].get(task.base_name, {}).get('tables', {}).get(task.table_name)
+                if table_stats:
+                    table_stats['success_count'] -= 1
+            self.image_history.add_failed_record(task.url, error_msg, base_name=task.base_name,
+                                                 table_name=task.table_name, row_id=task.row_id,
+                                                 row_data=task.row_data, column_name=task.column_name)
+            self._log_failure(task, error_msg)
+        if self.phash_index:
+            self.phash_index.remove(new_url)
+
+    def get_row_lane(self, row: Dict[str, Any]) -> int:
+        """根据行的修改时间确定优先级通道"""
+        mtime = row.get('_mtime')
+        if not mtime or self.fresh_seconds <= 0:
+            return LANE_BACKFILL
+        try:
+            modified = datetime.fromisoformat(str(mtime).replace('Z', '+00:00'))
+            if modified.tzinfo is None:
+                modified = modified.replace(tzinfo=timezone.utc)
+            age = (datetime.now(timezone.utc) - modified).total_seconds()
+            return LANE_FRESH if age <= self.fresh_seconds else LANE_BACKFILL
+        except ValueError:
+            return LANE_BACKFILL
+
+    def close(self):
+        """处理完已入队任务并停止调度器，关闭SeaTable客户端的会话"""
+        self.scheduler.stop(drain=True)
+        with self._stats_lock:
+            stats['deferred'] += self.scheduler.deferred
+            self.scheduler.deferred = 0
+        self.client_pool.close()
+
+    def known_size(self, image: Any) -> Optional[int]:
+        """不发请求能得知的图片大小：下载缓存或单元格中的size（图片列的单元格通常只有URL），未知返回None"""
+        url = image.get('url', '') if isinstance(image, dict) else image
+        size = self.blob_cache.cached_size(url) if self.blob_cache else None
+        if size is None and isinstance(image, dict) and image.get('size'):
+            size = int(image['size'])
+        return size
+
+    def estimate_cost(self, image: Any) -> int:
+        """估算图片任务成本（字节）：已有结果的最便宜，小图优先，大小未知的按 UNKNOWN_IMAGE_COST，上次失败过的排在最后"""
+        url = image.get('url', '') if isinstance(image, dict) else image
+        if self.image_history.get_record(url):
+            return 0
+        size = self.known_size(image)
+        cost = size if size is not None else UNKNOWN_IMAGE_COST
+        if url in self.previous_failures:
+            cost += self.image_bed.size_limit
+        return cost
+
+    def schema_fingerprint(self, metadata: Dict[str, Any]) -> Optional[str]:
+        """base指纹：图片列结构 + 各表行数和最后修改时间，查询失败时返回None"""
+        # SeaTable SQL 不支持 UNION 或跨表聚合，每个含图片列的表各查询一次；没有图片列的表不查询
+        parts = []
+        try:
+            for table in sorted(metadata.get('tables', []), key=lambda t: t['name']):
+                image_columns = sorted(col['name'] for col in table.get('columns', []) if col.get('type') == 'image')
+                if not image_columns:
+                    continue
+                escaped = table['name'].replace('`', '``')
+                with metrics.stage(self.base_name, 'metadata'):
+                    rows = self.client.query(f"SELECT COUNT(*), MAX(_mtime) FROM `{escaped}`") or []
+                parts.append([table.get('_id'), table['name'], image_columns, sorted(map(str, rows[0].values())) if rows else []])
         except Exception as e:
-            logger.error(f"[更新] ❌ 更新失败: {str(e)}")
+            logger.warning(f"[指纹] ⚠️ {self.base_name} 计算指纹失败，执行全量检查: {str(e)}")
+            return None
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False, default=str).encode()).hexdigest()
 
     def process_table(self, table_name: str) -> None:
         """处理单个表格"""
@@ -622,113 +3424,82 @@ class SeaTableManager:
         
         try:
             # 获取表格信息
-            metadata = self.base.get_metadata()
+            with metrics.stage(self.base_name, 'metadata'):
+                metadata = self.client.get_metadata()
             table = next((t for t in metadata.get('tables', []) if t['name'] == table_name), None)
             if not table:
                 logger.error(f"[表格] ❌ 表格不存在: {table_name}")
                 return
 
-            # 获取图片列
-            image_columns = [col['name'] for col in table.get('columns', []) if col.get('type') == 'image']
+            # 获取范围内的图片列
+            image_columns = [col['name'] for col in table.get('columns', [])
+                             if col.get('type') == 'image' and self.scope.match_column(col['name'])]
             if not image_columns:
-                logger.info(f"[表格] ℹ️ 表格中没有图片列，跳过")
+                logger.info(f"[表格] ℹ️ 表格中没有需要处理的图片列，跳过")
                 return
 
             logger.info(f"[表格] 📷 发现图片列: {', '.join(image_columns)}")
 
-            # 使用线程池处理列
-            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            # 使用线程池处理列（列线程只负责读取和提交任务）
+            with ThreadPoolExecutor(max_workers=max(1, min(len(image_columns), self.concurrency.max_limit))) as executor:
                 futures = [
                     executor.submit(self.process_column, table_name, column_name)
                     for column_name in image_columns
-                    if column_name != "产品图片"  # 跳过产品图片列
                 ]
                 
                 for future in as_completed(futures):
                     try:
                         rows_count = future.result()
                         if rows_count:
-                            self._update_table_total_rows(self.base_name, table_name, rows_count)
+                            with self._stats_lock:
+                                self._update_table_total_rows(self.base_name, table_name, rows_count)
                     except Exception as e:
                         logger.error(f"[表格] ❌ 处理列时出错: {str(e)}")
 
         except Exception as e:
             logger.error(f"[表格] ❌ 处理表格时出错: {str(e)}")
 
+    def process_tables(self, table_names: List[str], max_workers: int = TABLE_CONCURRENCY):
+        """并发处理同一base内的多个表格，预算用尽后不再开始新表格"""
+        def run(table_name: str):
+            if self.out_of_budget():
+                logger.warning(f"[Base] ⏰ 预算用尽，跳过表格: {table_name}")
+                return
+            self.process_table(table_name)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(table_names), max_workers)),
+                                thread_name_prefix='sync-table') as executor:
+            list(executor.map(run, table_names))
+
     def process_column(self, table_name: str, column_name: str) -> Optional[int]:
         """处理单个列"""
         logger.info(f"\n[列] 📑 开始处理列: {column_name}")
 
         try:
-            # 分页处理
-            page_size = 1000
-            start = 0
             total_processed = 0
+            row_updates: deque = deque()  # 尚未确认完成的行，按提交顺序
 
-            while True:
-                # 获取当前页数据
-                rows = self.base.list_rows(table_name, start=start, limit=page_size)
-                if not rows:
-                    break
-
-                if total_processed == 0:
-                    logger.info(f"[列] 📄 发现 {len(rows)} 条记录")
-                total_processed += len(rows)
-
-                # 处理每一行
-                for row in rows:
-                    images = row.get(column_name, [])
-                    if not images:
-                        continue
-
-                    if isinstance(images, str):
-                        images = [images]
-
-                    # 获取首列内容作为标识
-                    first_column = next(iter(row.keys()))
-                    first_column_value = row.get(first_column, '') if first_column != '_id' else ''
-                    row_info = f"{first_column_value[:30]}..." if len(str(first_column_value)) > 30 else str(first_column_value)
-
-                    # 初始化新图片列表
-                    new_images = []
-                    updated = False
-
-                    # 处理每个图片
-                    for image in images:
-                        image_url = image.get('url', '') if isinstance(image, dict) else image
-                        
-                        task = ImageTask(
-                            url=image_url,
-                            table_name=table_name,
-                            column_name=column_name,
-                            row_id=row['_id'],
-                            base_name=self.base_name,
-                            row_data=row_info
-                        )
-                        
-                        # 处理单个图片
-                        new_url = self.process_single_image(task)
-                        
-                        if new_url:
-                            new_images.append(new_url)
-                            updated = True
-                        else:
-                            new_images.append(image)
-
-                    # 更新行数据
-                    if updated:
-                        try:
-                            self.base.update_row(table_name, row['_id'], {column_name: new_images})
-                            logger.info(f"[更新] ✅ 行更新成功: {row_info}")
-                        except Exception as e:
-                            logger.error(f"[更新] ❌ 行更新失败: {str(e)}")
+            # 分页处理：后台预读下一页，提交任务时不等待 list_rows
+            with RowPager(self, table_name) as pager:
+                for rows in pager:
+                    if total_processed == 0:
+                        logger.info(f"[列] 📄 发现 {len(rows)} 条记录")
+                    total_processed += len(rows)
 
-                start += len(rows)
-                if len(rows) < page_size:
-                    break
+                    # 处理每一行：按行拆分任务提交到调度器
+                    for row in rows:
+                        row_update = self.submit_row(table_name, column_name, row)
+                        if row_update:
+                            row_updates.append(row_update)
+                            if len(row_updates) >= ROW_UPDATE_BATCH:
+                                self._flush_row_updates(row_updates, ROW_UPDATE_BATCH // 2)
 
-                # 添加处理间隔
-                time.sleep(REQUEST_DELAY)
+                    if self.out_of_budget():
+                        logger.warning(f"[列] ⏰ 预算用尽，停止读取后续数据: {column_name}")
+                        break
+
+            # 等待本列剩余的行处理并回写完成
+            self._flush_row_updates(row_updates, 0)
 
             if total_processed > 0:
                 logger.info(f"[列] ✨ 处理完成，共 {total_processed} 条记录")
@@ -740,20 +3511,57 @@ class SeaTableManager:
 
         return None
 
-    def _process_batch_tasks(self, tasks: List[ImageTask]):
-        """处理一批任务"""
-        try:
-            results = ImageProcessor.process_batch(tasks, self)
-            logger.info(f"[批处理] ✅ 完成处理 {len(results)} 个任务")
-        except Exception as e:
-            logger.error(f"[批处理] ❌ 处理失败: {str(e)}")
+    @staticmethod
+    def _flush_row_updates(row_updates: deque, keep: int):
+        """按提交顺序等待行回写完成并释放，直到未完成的行不超过 keep 个"""
+        while row_updates and (len(row_updates) > keep or row_updates[0].done.is_set()):
+            row_updates.popleft().done.wait()
+
+    def submit_row(self, table_name: str, column_name: str, row: Dict[str, Any],
+                   lane: Optional[int] = None) -> Optional[RowUpdate]:
+        """将一行中某列的图片拆分为任务提交到调度器，队列满时阻塞"""
+        images = row.get(column_name, [])
+        if not images:
+            return None
+
+        if isinstance(images, str):
+            images = [images]
+
+        # 获取首列内容作为标识
+        first_column = next(iter(row.keys()))
+        first_column_value = row.get(first_column, '') if first_column != '_id' else ''
+        row_info = f"{first_column_value[:30]}..." if len(str(first_column_value)) > 30 else str(first_column_value)
+
+        row_update = RowUpdate(self, table_name, column_name, row['_id'], row_info, images)
+        if lane is None:
+            lane = self.get_row_lane(row)
+
+        # 提交每个图片
+        for index, image in enumerate(images):
+            image_url = image.get('url', '') if isinstance(image, dict) else image
+            
+            task = ImageTask(
+                url=image_url,
+                table_name=table_name,
+                column_name=column_name,
+                row_id=row['_id'],
+                base_name=self.base_name,
+                row_data=row_info,
+                callback=row_update.make_callback(index),
+                lane=lane,
+                cost=self.estimate_cost(image)
+            )
+            if not self.scheduler.submit(task):
+                row_update.complete(index, None)
 
-    def retry_failed_images(self):
-        """重试处理失败的图片"""
-        failed_records = self.image_history.get_failed_records()
+        return row_update
+
+    def retry_failed_images(self, records: Optional[List[Dict[str, Any]]] = None) -> Dict[str, int]:
+        """重试处理失败的图片（默认取历史中的失败记录），返回重试统计"""
+        failed_records = records if records is not None else self.image_history.get_failed_records()
         if not failed_records:
             logger.info("[重试] ℹ️ 没有失败记录")
-            return
+            return {'total': 0, 'success': 0, 'failed': 0}
 
         logger.info(f"\n[重试] 🔄 开始处理 {len(failed_records)} 个失败记录")
         
@@ -776,6 +3584,7 @@ class SeaTableManager:
 
         # 输出重试统计
         self._print_retry_stats(retry_stats)
+        return retry_stats
 
     def _group_records_by_base_table(self, records: List[Dict[str, Any]]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
         """将失败记录按Base和表格分组"""
@@ -797,53 +3606,93 @@ class SeaTableManager:
         """重试处理同一表格的记录"""
         # 按行分组，避免重复更新
         rows_to_update = {}
-        
-        for record in records:
+        results: Dict[int, Optional[str]] = {}
+        tasks: Dict[int, ImageTask] = {}
+        results_lock = threading.Lock()
+
+        def collect(index: int) -> Callable:
+            def callback(task: ImageTask, new_url: Optional[str]):
+                with results_lock:
+                    results[index] = new_url
+                    tasks[index] = task
+            return callback
+
+        # 以重试优先级提交到调度器
+        for index, record in enumerate(records):
             task = ImageTask(
                 url=record['url'],
                 table_name=table_name,
                 column_name=record['column_name'],
                 row_id=record['row_id'],
                 base_name=base_name,
-                row_data=record['row_data']
+                row_data=record['row_data'],
+                callback=collect(index),
+                lane=LANE_RETRY
             )
-            
-            # 处理单个图片
-            new_url = self.process_image(task.url)  # 直接使用 process_image 而不是 process_single_image
+            if not self.scheduler.submit(task):
+                results[index] = None
+        self.scheduler.wait_idle()
+
+        # 回写前校验新链接，校验失败的按失败处理
+        if self.verifier:
+            verified = self.verifier.verify_all([url for url in results.values() if url])
+            for index, new_url in list(results.items()):
+                if new_url and not verified.get(new_url, True):
+                    results[index] = None
+                    self.reject_upload(tasks[index], new_url)
+
+        for index, record in enumerate(records):
+            new_url = results.get(index)
             
             if new_url:
                 retry_stats['success'] += 1
-                # 记录需要更新的行
+                # 记录需要更新的行（原链接 -> 新链接）
                 row_id = record['row_id']
                 if row_id not in rows_to_update:
                     rows_to_update[row_id] = {
                         'column': record['column_name'],
-                        'urls': []
+                        'urls': {}
                     }
-                rows_to_update[row_id]['urls'].append(new_url)
+                rows_to_update[row_id]['urls'][record['url']] = new_url
                 # 添加成功记录
-                self.image_history.add_success_record(record['url'], new_url)
+                self.image_history.add_success_record(record['url'], new_url, base_name,
+                                                      table_name, record['column_name'])
             else:
                 retry_stats['failed'] += 1
-            
-            # 添加延迟避免请求过快
-            time.sleep(REQUEST_DELAY)
         
         # 批量更新行数据
         self._update_rows(table_name, rows_to_update)
 
     def _update_rows(self, table_name: str, rows_to_update: Dict[str, Dict[str, Any]]):
-        """批量更新行数据"""
+        """批量更新行数据：读取当前行，只替换重试成功的图片，保留同一单元格中的其它图片"""
         for row_id, data in rows_to_update.items():
             try:
-                self.base.update_row(
-                    table_name,
-                    row_id,
-                    {data['column']: data['urls']}
-                )
+                with metrics.stage(self.base_name, 'list_rows'):
+                    row = self.client.get_row(table_name, row_id)
+                images = row.get(data['column']) or []
+                if isinstance(images, str):
+                    images = [images]
+                new_images = [
+                    data['urls'].get(image.get('url', '') if isinstance(image, dict) else image, image)
+                    for image in images
+                ]
+                if new_images == images:
+                    continue
+                with metrics.stage(self.base_name, 'update_row'):
+                    self.client.update_row(
+                        table_name,
+                        row_id,
+                        {data['column']: new_images}
+                    )
                 logger.info(f"[重试] ✅ 更新成功: {row_id}")
+                if self.reclaimer:
+                    for url, new_url in data['urls'].items():
+                        self.reclaimer.add(self, url, new_url, table_name, row_id, data['column'])
             except Exception as e:
                 logger.error(f"[重试] ❌ 更新失败 {row_id}: {str(e)}")
+                if self.reclaimer:
+                    for url in data['urls']:
+                        self.reclaimer.block(url)
 
     def _print_retry_stats(self, stats: Dict[str, int]):
         """输出重试统计信"""
@@ -855,8 +3704,9 @@ class SeaTableManager:
         logger.info(f"仍然失败: {stats['failed']}")
         logger.info("=" * 50)
 
-    def _log_success(self, task: ImageTask, new_url: str):
-        """记录成功处理的图片"""
+    def _log_success(self, task: ImageTask, new_url: str, source: str = 'success'):
+        """记录成功处理的图片，source 为计入的统计项"""
+        task.source = source
         success_record = {
             'base_name': task.base_name,
             'table_name': task.table_name,
@@ -866,7 +3716,10 @@ class SeaTableManager:
             'new_url': new_url,
             'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
         }
-        self.processing_logs['success_records'].append(success_record)
+        self.processing_logs['success_count'] += 1
+        metrics.add_image(task.base_name, True)
+        if self.report_writer:
+            self.report_writer.write('success', success_record)
         
         # 更新base统计
         if task.base_name not in self.processing_logs['bases']:
@@ -896,7 +3749,11 @@ class SeaTableManager:
             'error': error_msg,
             'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
         }
-        self.processing_logs['failure_records'].append(failure_record)
+        self.processing_logs['failure_count'] += 1
+        self.processing_logs['failure_reasons'][failure_reason(error_msg)] += 1
+        metrics.add_image(task.base_name, False)
+        if self.report_writer:
+            self.report_writer.write('failure', failure_record)
         
         # 更新base统计
         if task.base_name not in self.processing_logs['bases']:
@@ -971,6 +3828,607 @@ class SeaTableManager:
         
         self.processing_logs['bases'][base_name]['tables'][table_name]['total_rows'] = total_rows
 
+class SyncContext:
+    """一次运行内共享的组件：配置、范围、历史记录、进行中转存登记、并发控制和下载缓存"""
+    manager_class = SeaTableManager
+
+    def __init__(self, config: Config, scope: Optional[SyncScope] = None):
+        self.config = config
+        self.scope = scope or SyncScope()
+        self.image_history = ImageHistory()
+        self.inflight = InFlightRegistry()
+        self.concurrency = create_concurrency_controller(config)
+        self.blob_cache = create_blob_cache(config)
+        self.phash_index = create_phash_index(config)
+        self.verifier = create_upload_verifier(config)
+        self.api_quota = create_api_quota(config)
+        self.reclaimer = create_asset_reclaimer(config, self.verifier)
+        self.report_writer = create_report_writer(config)
+        self.import_mappings(config.config['mapping']['import'])
+        self.base_tokens: Dict[str, str] = {}  # base名称 -> token
+        self.previous_failures = {record['url'] for record in load_failed_records()}
+        # 所有管理器共享处理日志和统计锁，报告覆盖本次运行的全部base
+        self.stats_lock = threading.Lock()
+        self.processing_logs = {
+            'bases': {},
+            'success_count': 0,
+            'failure_count': 0,
+            'failure_reasons': Counter(),  # 归类后的失败原因 -> 次数，逐条记录只写入详细报告
+            'skip_count': 0,
+            'ignored_domain_count': 0
+        }
+        self.audit_seconds = config.config['scheduler']['audit_hours'] * 3600
+        self.pending_fingerprints: Dict[str, Tuple[str, str]] = {}  # base名称 -> (base_key, 指纹)
+        self._fingerprint_store: Optional[RunHistoryStore] = None
+        self._base_names = set()
+        self._unnamed_count = 0
+
+    def reset_processing_logs(self) -> Tuple[int, int]:
+        """清空处理日志（守护模式每批处理后调用，避免长时间运行内存增长），返回清空前的 (成功数, 失败数)"""
+        with self.stats_lock:
+            # 原地清空，所有管理器引用的是同一份日志
+            logs = self.processing_logs
+            counts = (logs['success_count'], logs['failure_count'])
+            logs['bases'].clear()
+            logs['success_count'] = 0
+            logs['failure_count'] = 0
+            logs['failure_reasons'].clear()
+            logs['skip_count'] = 0
+            logs['ignored_domain_count'] = 0
+        return counts
+
+    def create_manager(self, api_token: str, base_name: Optional[str] = None) -> SeaTableManager:
+        """创建共享本次运行组件的管理器"""
+        manager = self.manager_class(self.config, api_token, concurrency=self.concurrency, blob_cache=self.blob_cache)
+        manager.image_history = self.image_history  # 使用全局的历史记录管理器
+        manager.inflight = self.inflight
+        manager.phash_index = self.phash_index
+        manager.verifier = self.verifier
+        manager.api_quota = self.api_quota
+        manager.reclaimer = self.reclaimer
+        manager.report_writer = self.report_writer
+        manager.previous_failures = self.previous_failures
+        manager.processing_logs = self.processing_logs
+        manager._stats_lock = self.stats_lock
+        manager.scope = self.scope
+        if base_name:
+            manager.base_name = base_name
+        return manager
+
+    def resolve_base_name(self, config_base_name: Optional[str], metadata: Dict[str, Any]) -> str:
+        """确定base名称"""
+        if config_base_name:
+            # 使用配置中的名称
+            base_name = config_base_name
+        else:
+            # 使用API返回的名称，如果重复则添加序号
+            base_name = metadata.get('name', '未命名')
+            if base_name == '未命名' or base_name in self._base_names:
+                self._unnamed_count += 1
+                base_name = f'未命名{self._unnamed_count}'
+        self._base_names.add(base_name)  # 记录使用过的名称
+        return base_name
+
+    def iter_bases(self):
+        """依次连接范围内的base，产出 (管理器, 元数据)"""
+        for base_config in self.config.config['seatable']['bases']:
+            base_token = base_config.get('token')
+            config_base_name = base_config.get('name')
+            # 配置了名称的base无需连接即可按范围过滤
+            if config_base_name and not self.scope.match_base(config_base_name):
+                continue
+            manager = None
+            try:
+                manager = self.create_manager(base_token, config_base_name)
+                with metrics.stage(None, 'metadata'):
+                    # 名称确定后再计数，避免把这次调用记到“未命名”下
+                    metadata = manager.base.get_metadata()
+                base_name = self.resolve_base_name(config_base_name, metadata)
+            except Exception as e:
+                logger.error(f"[Base] ❌ {config_base_name or '未命名'} 连接失败: {str(e)}")
+                if manager:
+                    manager.close()
+                continue
+            if not self.scope.match_base(base_name):
+                manager.close()
+                continue
+            manager.base_name = base_name  # 更新manager中的base名称
+            manager._on_api_call('get_metadata')
+            self.base_tokens[base_name] = base_token
+            yield manager, metadata
+
+    def import_mappings(self, paths: List[str]):
+        """导入映射文件预置历史记录，已转存过的图片不再下载"""
+        for path in paths:
+            if not os.path.exists(path):
+                logger.info(f"[映射] ℹ️ 映射文件不存在，跳过导入: {path}")
+                continue
+            try:
+                count = self.image_history.import_mapping(path)
+                logger.info(f"[映射] 📥 已导入 {count} 条映射: {path}")
+            except Exception as e:
+                logger.error(f"[映射] ❌ 导入映射失败 {path}: {str(e)}")
+
+    def export_mapping(self):
+        """按配置导出当前的映射（包含导入的记录）"""
+        path = self.config.config['mapping']['export']
+        if not path:
+            return
+        try:
+            count = self.image_history.export_mapping(path)
+            logger.info(f"[映射] 📤 已导出 {count} 条映射: {path}")
+        except Exception as e:
+            logger.error(f"[映射] ❌ 导出映射失败 {path}: {str(e)}")
+
+    @property
+    def fingerprint_store(self) -> RunHistoryStore:
+        if self._fingerprint_store is None:
+            self._fingerprint_store = RunHistoryStore()
+        return self._fingerprint_store
+
+    def is_base_unchanged(self, manager: SeaTableManager, metadata: Dict[str, Any]) -> bool:
+        """指纹与上次完整处理后一致，且未到强制全量检查时间（比较需要每个图片表一次聚合查询）"""
+        if self.scope.full_audit or self.audit_seconds <= 0:
+            return False
+        try:
+            saved = self.fingerprint_store.get_fingerprint(str(manager.base.dtable_uuid))
+        except Exception as e:
+            logger.error(f"[指纹] ❌ 读取指纹失败: {str(e)}")
+            return False
+        if not saved or time.time() - saved['audited_at'] >= self.audit_seconds:
+            return False
+        return manager.schema_fingerprint(metadata) == saved['fingerprint']
+
+    def mark_base_synced(self, manager: SeaTableManager, metadata: Dict[str, Any]):
+        """base完整处理后计算指纹（包含本次写回），待确认无失败记录后保存"""
+        if not self.scope.covers_all() or self.audit_seconds <= 0 or self.api_quota.is_exhausted(manager.base_key):
+            return
+        fingerprint = manager.schema_fingerprint(metadata)
+        if fingerprint:
+            self.pending_fingerprints[manager.base_name] = (str(manager.base.dtable_uuid), fingerprint)
+
+    def save_fingerprints(self, failed_records: List[Dict[str, Any]]):
+        """保存没有遗留失败记录的base指纹，下次运行可整体跳过"""
+        failed_bases = {record['base_name'] for record in failed_records}
+        for base_name, (base_key, fingerprint) in self.pending_fingerprints.items():
+            if base_name in failed_bases:
+                continue
+            try:
+                self.fingerprint_store.save_fingerprint(base_key, base_name, fingerprint)
+            except Exception as e:
+                logger.error(f"[指纹] ❌ 保存指纹失败 {base_name}: {str(e)}")
+        self.pending_fingerprints.clear()
+
+def run_retry(context: SyncContext, records: List[Dict[str, Any]],
+              managers: Optional[Dict[str, SeaTableManager]] = None) -> Dict[str, int]:
+    """按base分组重试失败记录，每个base使用自己的管理器下载"""
+    managers = managers or {}  # 已连接的管理器（base名称 -> 管理器）由调用方关闭，其它base按需新建
+    totals = {'total': len(records), 'success': 0, 'failed': 0}
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        grouped.setdefault(record['base_name'], []).append(record)
+
+    for base_name, base_records in grouped.items():
+        if context.scope.is_expired():
+            logger.warning(f"[重试] ⏰ 时间预算用尽，剩余失败记录留待下次重试")
+            break
+        if base_name in managers:
+            result = managers[base_name].retry_failed_images(base_records)
+        else:
+            token = context.base_tokens.get(base_name)
+            if not token:
+                logger.warning(f"[重试] ⚠️ 未找到base配置，跳过 {len(base_records)} 条记录: {base_name}")
+                totals['failed'] += len(base_records)
+                continue
+            manager = context.create_manager(token, base_name)
+            try:
+                result = manager.retry_failed_images(base_records)
+            finally:
+                manager.close()
+        totals['success'] += result['success']
+        totals['failed'] += result['failed']
+    return totals
+
+def load_failed_records() -> List[Dict[str, Any]]:
+    """读取上次保存的失败记录"""
+    if not os.path.exists(FAILED_FILE):
+        return []
+    try:
+        with open(FAILED_FILE, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"[重试] ❌ 读取失败记录出错: {str(e)}")
+        return []
+
+def save_failed_records(records: List[Dict[str, Any]], scope: SyncScope):
+    """保存失败记录：替换范围内的旧记录，保留范围外的"""
+    try:
+        kept = [record for record in load_failed_records() if not scope.match_record(record)]
+        with open(FAILED_FILE, 'w') as f:
+            json.dump(kept + records, f, indent=2, ensure_ascii=False)
+    except Exception as e:
+        logger.error(f"[重试] ❌ 保存失败记录出错: {str(e)}")
+
+class ChangeBatcher:
+    """变更事件微批聚合：同一行的多次变更合并，按时间窗口成批取出"""
+    def __init__(self, window: float = DAEMON_BATCH_WINDOW, max_size: int = DAEMON_BATCH_SIZE):
+        self.window = window
+        self.max_size = max_size
+        self._pending: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+
+    def add(self, base_key: str, table_name: str, row_id: str,
+            columns: Optional[List[str]] = None, row: Optional[Dict[str, Any]] = None):
+        """添加一条行变更；columns为None表示该行所有图片列"""
+        with self._cond:
+            key = (base_key, table_name, row_id)
+            entry = self._pending.setdefault(key, {'columns': set(), 'all_columns': False, 'row': None})
+            if columns is None:
+                entry['all_columns'] = True
+            else:
+                entry['columns'].update(columns)
+            if row is not None:
+                entry['row'] = row
+            self._cond.notify_all()
+
+    def next_batch(self, timeout: float = 1) -> List[Tuple[Tuple[str, str, str], Dict[str, Any]]]:
+        """等待并取出一批变更：收到首个事件后再聚合一个窗口期"""
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(timeout)
+                if not self._pending:
+                    return []
+            deadline = time.monotonic() + self.window
+            while len(self._pending) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            keys = list(self._pending)[:self.max_size]
+            return [(key, self._pending.pop(key)) for key in keys]
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """接收SeaTable行变更webhook"""
+    server_version = 'SeaTableImageSync'
+
+    def log_message(self, format, *args):
+        logger.debug(f"[守护] {self.address_string()} {format % args}")
+
+    def _reply(self, status: int, data: Dict[str, Any]):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """健康检查"""
+        if urlparse(self.path).path != '/health':
+            self._reply(404, {'error': 'not found'})
+            return
+        self._reply(200, self.server.sync_daemon.status())
+
+    def do_POST(self):
+        """接收行变更事件"""
+        daemon = self.server.sync_daemon
+        token = daemon.webhook_token
+        if token:
+            query_token = parse_qs(urlparse(self.path).query).get('token', [''])[0]
+            candidates = [candidate for candidate in (query_token, self.headers.get('X-Sync-Token', '')) if candidate]
+            if not candidates:
+                self._reply(401, {'error': 'missing token'})
+                return
+            # 常数时间比较，避免按响应时间逐字符猜出令牌
+            if not any(hmac.compare_digest(token.encode(), candidate.encode()) for candidate in candidates):
+                self._reply(403, {'error': 'invalid token'})
+                return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError):
+            self._reply(400, {'error': 'invalid json'})
+            return
+        queued = daemon.handle_webhook(payload)
+        self._reply(200, {'queued': queued})
+
+class SyncDaemon:
+    """守护模式：接收webhook或轮询_mtime，只处理发生变化的行和列"""
+    def __init__(self, config: Config, scope: Optional[SyncScope] = None):
+        self.config = config
+        daemon_config = config.config['daemon']
+        self.host = daemon_config['host']
+        self.port = daemon_config['port']
+        self.poll_interval = daemon_config['poll_interval']
+        self.webhook_token = daemon_config['webhook_token']
+        self.retry_interval = daemon_config['retry_interval']
+        self._last_retry = time.monotonic()
+        self.batcher = ChangeBatcher(window=daemon_config['batch_window'])
+        self.context = SyncContext(config, scope)
+        self.managers: Dict[str, SeaTableManager] = {}
+        self.image_columns: Dict[str, Dict[str, List[str]]] = {}
+        self._poll_marks: Dict[Tuple[str, str], Tuple[str, str]] = {}  # (base_key, 表格) -> (_mtime, _id)
+        self._own_writes: OrderedDict = OrderedDict()  # (base_key, 表格, 行ID) -> {列名: 回写的链接}
+        self._own_writes_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.processed_rows = 0
+
+    def start_managers(self):
+        """为每个base创建常驻管理器（保持认证、会话和缓存）"""
+        start_mark = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000+00:00')
+        for manager, metadata in self.context.iter_bases():
+            base_key = str(manager.base.dtable_uuid)
+            self.managers[base_key] = manager
+            self._load_image_columns(base_key, metadata)
+            for table_name in self.image_columns[base_key]:
+                self._poll_marks[(base_key, table_name)] = (start_mark, '')
+            logger.info(f"[守护] 📚 已加载base: {manager.base_name}")
+        # 接续已保存的失败记录，之后在内存中维护，每批处理后写回
+        image_history = self.context.image_history
+        image_history.restore_failed_records([record for record in load_failed_records()
+                                              if self.context.scope.match_record(record)])
+
+    def _load_image_columns(self, base_key: str, metadata: Dict[str, Any]):
+        """缓存各表格需要处理的图片列"""
+        scope = self.context.scope
+        self.image_columns[base_key] = {
+            table['name']: [col['name'] for col in table.get('columns', [])
+                            if col.get('type') == 'image' and scope.match_column(col['name'])]
+            for table in metadata.get('tables', [])
+            if scope.match_table(table['name'])
+        }
+
+    def _find_base_key(self, dtable_uuid: str) -> Optional[str]:
+        """根据dtable_uuid查找已加载的base"""
+        if not dtable_uuid:
+            return next(iter(self.managers), None) if len(self.managers) == 1 else None
+        for base_key in self.managers:
+            if base_key.replace('-', '') == str(dtable_uuid).replace('-', ''):
+                return base_key
+        return None
+
+    def handle_webhook(self, payload: Dict[str, Any]) -> int:
+        """解析webhook并加入批处理，返回入队的行数"""
+        data = payload.get('data', payload)
+        base_key = self._find_base_key(data.get('dtable_uuid', ''))
+        table_name = data.get('table_name')
+        row_id = data.get('row_id')
+        if not base_key or not table_name or not row_id:
+            logger.warning(f"[守护] ⚠️ 忽略无法识别的webhook: {json.dumps(payload, ensure_ascii=False)[:200]}")
+            return 0
+
+        # 只处理变更涉及的图片列，无法判断时处理该行所有图片列
+        changed = [item.get('column_name') for item in data.get('row_data', []) or []
+                   if isinstance(item, dict) and item.get('column_type') == 'image']
+        self.batcher.add(base_key, table_name, row_id, columns=changed or None)
+        return 1
+
+    @staticmethod
+    def _image_urls(images: Any) -> List[str]:
+        """单元格中的图片链接列表"""
+        if isinstance(images, str):
+            images = [images]
+        return [image.get('url', '') if isinstance(image, dict) else image for image in images or []]
+
+    def _note_own_write(self, base_key: str, row_update: RowUpdate):
+        """记下本进程回写的内容，轮询到的行只因这次回写而变化时不再处理"""
+        key = (base_key, row_update.table_name, row_update.row_id)
+        with self._own_writes_lock:
+            columns = self._own_writes.pop(key, {})
+            columns[row_update.column_name] = self._image_urls(row_update.new_images)
+            self._own_writes[key] = columns
+            while len(self._own_writes) > DAEMON_OWN_WRITES:
+                self._own_writes.popitem(last=False)
+
+    def _is_own_write(self, base_key: str, table_name: str, row: Dict[str, Any]) -> bool:
+        """行中回写过的图片列是否仍是本进程写入的内容（只检查一次）"""
+        with self._own_writes_lock:
+            columns = self._own_writes.pop((base_key, table_name, row['_id']), None)
+        return bool(columns) and all(self._image_urls(row.get(column_name)) == urls
+                                     for column_name, urls in columns.items())
+
+    def poll_once(self):
+        """按 (_mtime, _id) 分页轮询各表格的新变更，跳过只因本进程回写而变化的行"""
+        for (base_key, table_name) in list(self._poll_marks):
+            manager = self.managers[base_key]
+            escaped = table_name.replace('`', '``')
+            queued = 0
+            while not self._stop.is_set():
+                mtime, last_id = self._poll_marks[(base_key, table_name)]
+                try:
+                    # 同一_mtime的行可能超过一页，按_id续接，避免跳过
+                    rows = manager.client.query(
+                        f"SELECT * FROM `{escaped}` WHERE _mtime > ? OR (_mtime = ? AND _id > ?) "
+                        f"ORDER BY _mtime, _id LIMIT {DAEMON_BATCH_SIZE}",
+                        parameters=[mtime, mtime, last_id]
+                    ) or []
+                except Exception as e:
+                    logger.error(f"[守护] ❌ 轮询失败 {manager.base_name}/{table_name}: {str(e)}")
+                    break
+                for row in rows:
+                    if row.get('_mtime'):
+                        self._poll_marks[(base_key, table_name)] = (str(row['_mtime']), row['_id'])
+                    if not self._is_own_write(base_key, table_name, row):
+                        self.batcher.add(base_key, table_name, row['_id'], row=row)
+                        queued += 1
+                if len(rows) < DAEMON_BATCH_SIZE:
+                    break
+            if queued:
+                logger.info(f"[守护] 🔎 {manager.base_name}/{table_name} 发现 {queued} 行变更")
+
+    def _poll_loop(self):
+        """轮询线程"""
+        while not self._stop.wait(self.poll_interval):
+            self.poll_once()
+
+    def process_batch(self, batch: List[Tuple[Tuple[str, str, str], Dict[str, Any]]]):
+        """处理一批行变更"""
+        start_time = time.time()
+        row_updates: List[Tuple[str, RowUpdate]] = []
+        for (base_key, table_name, row_id), entry in batch:
+            manager = self.managers[base_key]
+            if table_name not in self.image_columns[base_key] and self.context.scope.match_table(table_name):
+                # 新建的表格，刷新元数据
+                try:
+                    self._load_image_columns(base_key, manager.client.get_metadata())
+                except Exception as e:
+                    logger.error(f"[守护] ❌ 刷新元数据失败 {manager.base_name}/{table_name}: {str(e)}")
+                    continue
+            columns = self.image_columns[base_key].get(table_name, [])
+            if not entry['all_columns']:
+                columns = [col for col in columns if col in entry['columns']]
+            if not columns:
+                continue
+            row = entry['row']
+            if not row:
+                try:
+                    row = manager.client.get_row(table_name, row_id)
+                except Exception as e:
+                    logger.error(f"[守护] ❌ 获取行失败 {table_name}/{row_id}: {str(e)}")
+                    continue
+                # webhook同样会因本进程的回写触发
+                if not row or self._is_own_write(base_key, table_name, row):
+                    continue
+            for column_name in columns:
+                row_update = manager.submit_row(table_name, column_name, row, lane=LANE_FRESH)
+                if row_update:
+                    row_updates.append((base_key, row_update))
+
+        for base_key, row_update in row_updates:
+            row_update.done.wait()
+            if row_update.committed:
+                self._note_own_write(base_key, row_update)
+
+        success, failed = self._save_progress()
+        self.processed_rows += len(batch)
+        if row_updates:
+            logger.info(f"[守护] ✅ 批次完成: {len(batch)} 行, 成功 {success}, 失败 {failed}, "
+                        f"耗时 {time.time() - start_time:.2f}秒")
+
+    def _save_progress(self) -> Tuple[int, int]:
+        """保存失败记录和API用量，清空处理日志，返回清空前的 (成功数, 失败数)"""
+        save_failed_records(self.context.image_history.get_failed_records(), self.context.scope)
+        self.context.api_quota.save()
+        # 所有管理器共享同一份处理日志，统计一次后清空
+        return self.context.reset_processing_logs()
+
+    def retry_failures(self):
+        """以重试优先级重新处理失败记录，仍失败的放回等待下次重试"""
+        self._last_retry = time.monotonic()
+        image_history = self.context.image_history
+        records = image_history.take_failed_records()
+        managers = {manager.base_name: manager for manager in self.managers.values()}
+        pending = [record for record in records if record.get('base_name') in managers]
+        image_history.restore_failed_records([record for record in records if record not in pending])
+        if not pending:
+            return
+        logger.info(f"[守护] 🔄 重试 {len(pending)} 条失败记录")
+        try:
+            retry_stats = run_retry(self.context, pending, managers)
+            logger.info(f"[守护] ✅ 重试完成: 成功 {retry_stats['success']}, 失败 {retry_stats['failed']}")
+        except Exception as e:
+            logger.error(f"[守护] ❌ 重试失败记录出错: {str(e)}")
+        # 重试中失败的已重新记入，未处理到的在这里放回
+        image_history.restore_failed_records([record for record in pending
+                                              if not image_history.get_record(record['url'])])
+        self._save_progress()
+
+    def status(self) -> Dict[str, Any]:
+        """运行状态"""
+        return {
+            'bases': len(self.managers),
+            'pending_rows': len(self.batcher),
+            'processed_rows': self.processed_rows,
+            'concurrency': self.context.concurrency.snapshot()
+        }
+
+    def stop(self, *args):
+        """请求停止"""
+        if not self._stop.is_set():
+            logger.info("[守护] 🛑 收到停止信号，处理完当前批次后退出")
+        self._stop.set()
+
+    def run(self):
+        """启动webhook服务和轮询，主线程循环处理微批"""
+        self.start_managers()
+        if not self.managers:
+            logger.error("[守护] ❌ 没有可用的base，退出")
+            return
+
+        self.server = ThreadingHTTPServer((self.host, self.port), WebhookHandler)
+        self.server.sync_daemon = self
+        threading.Thread(target=self.server.serve_forever, name='sync-webhook', daemon=True).start()
+        logger.info(f"[守护] 🌐 webhook监听: http://{self.host}:{self.server.server_address[1]}/")
+
+        if self.poll_interval > 0:
+            threading.Thread(target=self._poll_loop, name='sync-poller', daemon=True).start()
+            logger.info(f"[守护] 🔁 每 {self.poll_interval:g} 秒轮询一次_mtime")
+
+        try:
+            while not self._stop.is_set():
+                if self.retry_interval > 0 and time.monotonic() - self._last_retry >= self.retry_interval:
+                    self.retry_failures()
+                batch = self.batcher.next_batch(timeout=1)
+                if not batch:
+                    continue
+                try:
+                    self.process_batch(batch)
+                except Exception as e:
+                    # 单个批次出错不影响常驻进程，继续处理后续变更
+                    logger.error(f"[守护] ❌ 批次处理出错（{len(batch)} 行）: {str(e)}")
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            for manager in self.managers.values():
+                manager.close()
+            if self.context.blob_cache:
+                self.context.blob_cache.save()
+            self.context.api_quota.save()
+            self.context.report_writer.close()
+            logger.info("[守护] ✨ 已停止")
+
+def run_daemon(config: Config, scope: Optional[SyncScope] = None):
+    """守护模式入口"""
+    daemon = SyncDaemon(config, scope)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run()
+
+def failure_reason(error: Optional[str]) -> str:
+    """错误信息的归类：去掉其中的链接和主机名"""
+    return re.sub(r"https?://\S+|host='[^']*'", '…', error or '未知错误')[:80]
+
+def top_failure_reasons(records: List[Dict[str, Any]], limit: int = REPORT_TOP_ERRORS) -> List[Tuple[str, int]]:
+    """按错误信息归类失败记录，返回最常见的几类"""
+    return Counter(failure_reason(record.get('error')) for record in records).most_common(limit)
+
+def generate_summary(manager: SeaTableManager, duration: float, retry_stats: Dict[str, int],
+                     failed_records: List[Dict[str, Any]]) -> str:
+    """生成用于通知的简要报告：总数、主要失败原因和详细报告路径"""
+    logs = manager.processing_logs
+    lines = [
+        f"处理Base {len(logs['bases'])} 个, 图片 {logs['success_count'] + logs['failure_count']} 张,"
+        f" 耗时 {duration:.0f}秒",
+        f"成功 {logs['success_count']} / 重试成功 {retry_stats.get('success', 0)}"
+        f" / 仍失败 {len(failed_records)} / 跳过 {logs['skip_count']}"
+    ]
+    if manager.scope.is_expired():
+        lines.append(f"⏰ 时间预算用尽，推迟 {stats['deferred']} 张图片到下次运行")
+    if manager.reclaimer:
+        lines.append(f"素材回收: 删除 {manager.reclaimer.deleted} 个 / 失败 {manager.reclaimer.failed} 个（撤销记录: {manager.reclaimer.undo_file}）")
+    reasons = top_failure_reasons(failed_records)
+    if reasons:
+        lines.append("主要失败原因:")
+        lines.extend(f"- {reason}: {count}次" for reason, count in reasons)
+    if manager.report_writer and manager.report_writer.records:
+        lines.append(f"详细报告: {manager.report_writer.path}")
+    return "\n".join(lines)
+
 def generate_report(manager: SeaTableManager, duration: float) -> str:
     """生成处理报告"""
     lines = [
@@ -989,42 +4447,11 @@ def generate_report(manager: SeaTableManager, duration: float) -> str:
 
         # 处理每个表格
         for table_name, table_stats in base_info['tables'].items():
+            # 逐条的成功/失败记录已在运行中写入详细报告，这里只输出统计
             lines.extend([
                 f"表格: {table_name}",
                 f"  - 总行数: {table_stats['total_rows']}",
-                f"  - 处理列: {', '.join(sorted(table_stats['columns']))}"
-            ])
-
-            # 添加成功记录
-            success_records = [r for r in manager.processing_logs['success_records'] 
-                             if r['base_name'] == base_name and r['table_name'] == table_name]
-            if success_records:
-                lines.append("\n  成功记录:")
-                for i, record in enumerate(success_records, 1):
-                    lines.extend([
-                        f"  {i}. 行ID: {record['row_id']}",
-                        f"     - 列: {record['column_name']}",
-                        f"     - 原图: {record['original_url']}",
-                        f"     - 新图: {record['new_url']}"
-                    ])
-
-            # 添加失败记录
-            failure_records = [r for r in manager.processing_logs['failure_records']
-                             if r['base_name'] == base_name and r['table_name'] == table_name]
-            if failure_records:
-                lines.append("\n  失败记录:")
-                for i, record in enumerate(failure_records, 1):
-                    lines.extend([
-                        f"  {i}. 行ID: {record['row_id']}",
-                        f"     - 列: {record['column_name']}",
-                        f"     - 原图: {record['original_url']}",
-                        f"     - 错误: {record['error']}",
-                        f"     - 时间: {record['timestamp']}"
-                    ])
-
-            # 添加统计信息
-            lines.extend([
-                "\n  统计信息:",
+                f"  - 处理列: {', '.join(sorted(table_stats['columns']))}",
                 f"  - 跳过图片: {table_stats['skip_count']}条",
                 f"  - 不处理域名: {table_stats['ignored_domain_count']}条",
                 f"  - 成功转存: {table_stats['success_count']}条",
@@ -1038,44 +4465,116 @@ def generate_report(manager: SeaTableManager, duration: float) -> str:
         "总体统计",
         "=" * 50,
         f"- 处理Base数: {len(manager.processing_logs['bases'])}",
+        f"- 未变化跳过Base数: {stats['unchanged_bases']}",
+        f"- 近似图片复用: {stats['near_duplicate']}",
+        f"- 链接校验失败: {stats['verify_failed']}",
+    ])
+    if manager.reclaimer:
+        lines.append(f"- 素材回收: 删除 {manager.reclaimer.deleted} / 失败 {manager.reclaimer.failed} / 校验未通过 {manager.reclaimer.unverified}")
+    lines.extend([
         f"- 处理表格数: {sum(len(base_info['tables']) for base_info in manager.processing_logs['bases'].values())}",
-        f"- 处理图片数: {len(manager.processing_logs['success_records']) + len(manager.processing_logs['failure_records'])}",
-        f"- 成功转存: {len(manager.processing_logs['success_records'])}",
-        f"- 失败图片: {len(manager.processing_logs['failure_records'])}",
+        f"- 处理图片数: {manager.processing_logs['success_count'] + manager.processing_logs['failure_count']}",
+        f"- 成功转存: {manager.processing_logs['success_count']}",
+        f"- 失败图片: {manager.processing_logs['failure_count']}",
         f"- 跳过图片: {manager.processing_logs['skip_count']}",
         f"- 不处理域名: {manager.processing_logs['ignored_domain_count']}",
         f"- 执行时间: {duration:.2f}秒",
         ""
     ])
+    if manager.scope.is_expired():
+        lines.extend([
+            f"⏰ 时间预算用尽，本次为部分结果：推迟 {stats['deferred']} 张图片到下次运行",
+            ""
+        ])
+
+    # 添加并发统计
+    concurrency = manager.concurrency.snapshot()
+    transport = http_transport.snapshot()
+    lines.extend([
+        "并发统计:",
+        f"- 下载并发: 当前 {concurrency['download']['limit']} / 峰值 {concurrency['download']['peak']}"
+        f" / 限流 {concurrency['download']['throttled']}次 / 平均延迟 {concurrency['download']['avg_latency']}秒",
+        f"- 上传并发: 当前 {concurrency['upload']['limit']} / 峰值 {concurrency['upload']['peak']}"
+        f" / 限流 {concurrency['upload']['throttled']}次 / 平均延迟 {concurrency['upload']['avg_latency']}秒",
+        f"- 在途字节: 峰值 {ImageProcessor.format_file_size(concurrency['memory']['peak'])}"
+        f" / 上限 {ImageProcessor.format_file_size(concurrency['memory']['capacity'])} / 等待 {concurrency['memory']['waits']}次",
+        f"- 连接复用: 请求 {transport['requests']}次 / 新建连接 {transport['connections']}个"
+        f" / 复用率 {transport['reuse_rate'] * 100:.1f}% / DNS缓存命中 {transport['dns_hits']}/{transport['dns_hits'] + transport['dns_misses']}",
+        ""
+    ])
 
-    # 添加失败记录汇总
-    if manager.processing_logs['failure_records']:
+    # 添加API调用统计
+    if manager.api_quota:
+        quota = manager.api_quota
+        api_totals = quota.totals()
+        total_calls = sum(api_totals.values())
+        migrated = manager.processing_logs['success_count']
         lines.extend([
-            "=" * 50,
-            "失败记录汇总",
-            "=" * 50
+            "API调用:",
+            f"- 合计: {total_calls}次" + (f" / 每张转存图片 {total_calls / migrated:.2f}次" if migrated else ""),
+            "- 按类型: " + (', '.join(f"{call_type} {count}" for call_type, count in
+                                    sorted(api_totals.items(), key=lambda item: -item[1])) or '无')
         ])
-        
-        current_base = None
-        for record in manager.processing_logs['failure_records']:
-            if current_base != record['base_name']:
-                current_base = record['base_name']
-                lines.append(f"\nBase: {current_base}")
-            
-            lines.extend([
-                f"- {record['row_id']} ({record['table_name']})",
-                f"  - 列: {record['column_name']}",
-                f"  - 原图: {record['original_url']}",
-                f"  - 错误: {record['error']}",
-                f"  - 时间: {record['timestamp']}"
-            ])
+        for base_key, by_type in list(quota.calls.items()):
+            line = f"- {quota.names.get(base_key, base_key)}: {sum(by_type.values())}次"
+            if quota.daily_budget > 0:
+                line += f" / 今日已用 {quota.usage(base_key)}/{quota.daily_budget}"
+            lines.append(line)
+        lines.append("")
+
+    # 添加失败原因汇总
+    reasons = manager.processing_logs['failure_reasons'].most_common(REPORT_TOP_ERRORS)
+    if reasons:
+        lines.append("失败原因:")
+        lines.extend(f"- {reason}: {count}次" for reason, count in reasons)
+        lines.append("")
+    if manager.report_writer and manager.report_writer.records:
+        lines.append(f"详细记录: {manager.report_writer.path}")
 
     return "\n".join(lines)
 
-def main():
-    """主函数"""
+def record_run_history(start_time: float, duration: float, retry_stats: Dict[str, int],
+                       image_history: ImageHistory, concurrency: ConcurrencyController,
+                       blob_cache: Optional[BlobCache], api_quota: Optional[ApiQuota] = None) -> Optional[str]:
+    """记录本次运行到历史库，吞吐明显下降时返回告警信息"""
+    try:
+        run_stats = dict(stats)
+        run_stats['success'] = stats['success'] + retry_stats.get('success', 0)
+        run_stats['failed'] = len(image_history.get_failed_records())
+        extra = {
+            'bases': stats['bases'],
+            'from_history': stats['from_history'],
+            'deduplicated': stats['deduplicated'],
+            'near_duplicate': stats['near_duplicate'],
+            'unchanged_bases': stats['unchanged_bases'],
+            'ignored_domain': stats['ignored_domain'],
+            'concurrency': concurrency.snapshot()
+        }
+        if blob_cache:
+            extra['cache'] = {'hits': blob_cache.hits, 'misses': blob_cache.misses, 'size': blob_cache.total_size}
+        if api_quota:
+            extra['api_calls'] = api_quota.totals()
+        store = RunHistoryStore()
+        run_id = store.record_run(start_time, duration, run_stats, metrics, extra)
+        regression = store.check_regression(store.recent_runs(1)[0])
+        if regression:
+            logger.warning(f"[历史] ⚠️ {regression}")
+        logger.info(f"[历史] 📝 已记录第 {run_id} 次运行")
+        return regression
+    except Exception as e:
+        logger.error(f"[历史] ❌ 记录运行历史失败: {str(e)}")
+        return None
+
+def show_run_history(limit: int = 20):
+    """输出运行趋势"""
+    print(RunHistoryStore().format_trends(limit))
+
+def main(config: Optional[Config] = None, scope: Optional[SyncScope] = None,
+         memory_tracer: Optional[MemoryTracer] = None):
+    """主函数（sync 命令）"""
     start_time = time.time()
-    global stats
+    global stats, metrics
+    metrics = RunMetrics()
     stats = {
         'bases': 0,
         'tables': 0,
@@ -1085,123 +4584,168 @@ def main():
         'failed': 0,
         'ignored_domain': 0,
         'from_history': 0,
+        'deduplicated': 0,
+        'near_duplicate': 0,
+        'unchanged_bases': 0,
+        'deferred': 0,
+        'verify_failed': 0,
         'details': {}
     }
 
+    context = None
+    previous_sigterm = None
+    retry_managers: Dict[str, SeaTableManager] = {}  # 有失败记录的base保持连接，重试时直接使用
     try:
         # 清理旧的临时文件
         cleanup_temp_files()
         
         # 检查环境
-        if not check_environment():
-            return
-        
-        # 加载配置
-        config = Config()
+        if config is None:
+            if not check_environment():
+                return
+            # 加载配置
+            config = Config()
+        scope = scope or SyncScope(started_at=start_time, time_budget=config.config['scheduler']['time_budget'])
+        # cron到时先发送SIGTERM：提前收尾，保留已完成的工作和报告
+        if threading.current_thread() is threading.main_thread():
+            previous_sigterm = signal.signal(signal.SIGTERM, scope.expire)
         
         # 获取所有base配置
         bases = config.config['seatable']['bases']
         logger.info(f"[主程序] 📚 发现 {len(bases)} 个base待处理")
         
-        # 用于跟踪未命名base的计数
-        unnamed_count = 0
-        base_names = set()
-        
-        # 创建一个全局的图片历史记录管理器
-        image_history = ImageHistory()
+        # 创建全局共享的历史记录、进行中转存登记、并发控制和下载缓存
+        context = SyncContext(config, scope)
+        image_history = context.image_history
+        manager = None
         
         # 处理每个base
-        for base_config in bases:
-            base_token = base_config.get('token')
-            config_base_name = base_config.get('name')
-            
+        for manager, metadata in context.iter_bases():
+            base_name = manager.base_name
             try:
-                # 初始化SeaTable管理器
-                manager = SeaTableManager(config, base_token)
-                manager.image_history = image_history  # 使用全局的历史记录管理器
-                
-                # 获取base元数据
-                metadata = manager.base.get_metadata()
-                
-                # 确定base名称
-                if config_base_name:
-                    # 使用配置中的名称
-                    base_name = config_base_name
-                else:
-                    # 使用API返回的名称，如果重复则添加序号
-                    base_name = metadata.get('name', '未命名')
-                    if base_name == '未命名' or base_name in base_names:
-                        unnamed_count += 1
-                        base_name = f'未命名{unnamed_count}'
-                
-                manager.base_name = base_name  # 更新manager中的base名称
-                base_names.add(base_name)  # 记录使用过的名称
-                
+                if scope.is_expired():
+                    logger.warning(f"[主程序] ⏰ 时间预算用尽，跳过剩余base")
+                    manager.close()
+                    break
+
                 logger.info(f"\n[Base] 🔄 开始处理base: {base_name}")
+
+                # 当日API预算已用尽的base留待下次运行
+                if context.api_quota.is_exhausted(manager.base_key):
+                    logger.warning(f"[Base] ⛔ {base_name} 当日API调用预算已用尽，跳过")
+                    manager.close()
+                    continue
+
+                # 指纹未变化的base整体跳过
+                if context.is_base_unchanged(manager, metadata):
+                    logger.info(f"[Base] ⏭️ {base_name} 自上次完整处理后未变化，跳过")
+                    stats['unchanged_bases'] += 1
+                    manager.close()
+                    continue
                 
-                # 获取所有表格
-                tables = metadata.get('tables', [])
+                # 获取范围内的表格
+                tables = [table for table in metadata.get('tables', []) if scope.match_table(table['name'])]
                 
                 if not tables:
                     logger.error(f"[Base] ❌ {base_name} 未找到任何表格")
+                    manager.close()
                     continue
                 
                 logger.info(f"[Base] 发现 {base_name} 有 {len(tables)} 个表格")
                 stats['bases'] += 1
                 stats['details'][base_name] = {'tables': {}}
                 
-                # 处理每个表格
-                for table in tables:
-                    table_name = table['name']
-                    stats['details'][base_name]['tables'][table_name] = {'columns': {}}
-                    manager.process_table(table_name)
+                # 并发处理各表格（共享去重和历史记录）
+                try:
+                    for table in tables:
+                        stats['details'][base_name]['tables'][table['name']] = {'columns': {}}
+                    manager.process_tables([table['name'] for table in tables],
+                                           config.config['scheduler']['table_concurrency'])
+                    context.mark_base_synced(manager, metadata)
+                    # 只有完整处理（全部表格和图片列、未推迟任何图片）的base才回收素材，避免删除仍被引用的文件
+                    column_names = [col['name'] for table in tables for col in table.get('columns', [])]
+                    if (context.reclaimer and scope.covers_all(column_names) and not manager.out_of_budget()
+                            and manager.scheduler.deferred == 0):
+                        context.reclaimer.allow(manager, metadata)
+                finally:
+                    if base_name in image_history.failed_base_names():
+                        retry_managers[base_name] = manager
+                    else:
+                        manager.close()
                     
                 logger.info(f"[Base] ✨ {base_name} 处理完成")
+                context.concurrency.log_status()
+                if memory_tracer:
+                    memory_tracer.snapshot(f"Base {base_name}")
                 
             except Exception as e:
                 logger.error(f"[Base] ❌ {base_name} 处理出错: {str(e)}")
                 continue
+
+        if manager is None:
+            logger.warning("[主程序] ⚠️ 范围内没有可处理的base")
+            return
         
-        # 更新统计信息
-        update_stats(stats)
-        
-        # 生成主处理报告
-        duration = time.time() - start_time
-        main_report = generate_report(manager, duration)
-        logger.info(main_report)
+        if memory_tracer:
+            memory_tracer.snapshot("主处理完成")
+
+        # 逐条记录已写入详细报告，主处理结束只输出一行概况，完整报告在重试后输出一次
+        logs = context.processing_logs
+        logger.info(f"[主程序] ✅ 主处理完成: 成功 {logs['success_count']}, 失败 {logs['failure_count']}, "
+                    f"耗时 {time.time() - start_time:.2f}秒")
         
-        # 开始重试处理
-        logger.info("\n[主程序] 🔄 开始重试处理失败记录")
-        manager = SeaTableManager(config, base_token)
-        manager.image_history = image_history  # 使用全局的历史记录管理器
-        manager.retry_failed_images()
+        # 开始重试处理（每个base使用自己的管理器），时间预算用尽时留待下次
+        if scope.is_expired():
+            logger.warning("[主程序] ⏰ 时间预算用尽，跳过重试，输出部分结果")
+            retry_stats = {'total': 0, 'success': 0, 'failed': 0}
+        else:
+            logger.info("\n[主程序] 🔄 开始重试处理失败记录")
+            retry_stats = run_retry(context, image_history.get_failed_records(), retry_managers)
+        for retry_manager in retry_managers.values():
+            retry_manager.close()
+        retry_managers.clear()
+        if memory_tracer:
+            memory_tracer.snapshot("重试完成")
+
+        # 回收已迁移且不再被引用的原素材（需显式开启），仍有失败记录的图片不回收
+        if context.reclaimer and not scope.is_expired():
+            context.reclaimer.run({record['url'] for record in image_history.get_failed_records()})
         
         # 生成最终报告（包含重试结果）
         final_duration = time.time() - start_time
-        final_report = generate_report(manager, final_duration)
+        with metrics.stage(None, 'report'):
+            final_report = generate_report(manager, final_duration)
+            if memory_tracer:
+                final_report += "\n" + memory_tracer.format_report()
         logger.info(final_report)
-        notify_status('SeaTable图片同步', final_report)
-        
-        # 输出失败详情
-        logger.info("\n" + "=" * 50)
-        logger.info("失败记录详情")
-        logger.info("=" * 50)
-        
-        failed_details = manager.image_history.get_failed_records()
-        if not failed_details:
-            logger.info("没有失败记录")
+
+        # 重试后仍失败的记录写入详细报告，日志只输出数量
+        failed_details = image_history.get_failed_records()
+        for record in failed_details:
+            context.report_writer.write('pending_failure', record)
+        if failed_details:
+            logger.info(f"[主程序] ⚠️ 仍有 {len(failed_details)} 条失败记录，详见: {context.report_writer.path}")
         else:
-            for record in failed_details:
-                logger.info(f"\nBase: {record['base_name']}")
-                logger.info(f"Table: {record['table_name']}")
-                logger.info(f"数据: {record['row_data']}")
-                logger.info(f"链接: {record['url']}")
-                logger.info(f"错误: {record['error']}")
-        
-        logger.info("=" * 50)
+            logger.info("[主程序] 没有失败记录")
+
+        # 记录本次运行到历史库，并检查吞吐是否明显下降
+        regression = record_run_history(start_time, time.time() - start_time, retry_stats, image_history,
+                                        context.concurrency, context.blob_cache, context.api_quota)
+        # 通知只发简要报告，完整内容见日志和详细报告文件
+        summary = generate_summary(manager, final_duration, retry_stats, failed_details)
+        if regression:
+            summary += f"\n⚠️ {regression}"
+        notify_status('SeaTable图片同步（部分完成）' if scope.is_expired() else 'SeaTable图片同步', summary)
+
+        # 保存失败记录，供 retry 命令单独重试
+        save_failed_records(failed_details, scope)
+        # 没有遗留失败的base记录指纹
+        context.save_fingerprints(failed_details)
+        # 导出映射，供其它实例导入
+        context.export_mapping()
         
         # 清理所有记录（放在最后）
-        manager.image_history.clear_all_records()
+        image_history.clear_all_records()
         
         logger.info("[主程序] ✨ 所有处理完成")
         
@@ -1210,8 +4754,317 @@ def main():
         notify_status('SeaTable图片同步异常', str(e))
         raise
     finally:
+        # 出错提前结束时关闭仍保持连接的管理器
+        for retry_manager in retry_managers.values():
+            retry_manager.close()
+        # 保存下载缓存索引和API用量，供下次运行复用
+        if context and context.blob_cache:
+            context.blob_cache.save()
+        if context:
+            context.api_quota.save()
+            context.report_writer.close()
+        if previous_sigterm is not None:
+            signal.signal(signal.SIGTERM, previous_sigterm)
         # 清理临时文件
         cleanup_temp_files()
 
+def run_retry_command(config: Config, scope: SyncScope):
+    """retry 命令：只重试上次保存的失败记录"""
+    records = [record for record in load_failed_records() if scope.match_record(record)]
+    if not records:
+        logger.info("[重试] ℹ️ 范围内没有失败记录")
+        return
+
+    start_time = time.time()
+    context = SyncContext(config, scope)
+    managers: Dict[str, SeaTableManager] = {}
+    try:
+        # 只连接失败记录涉及的base，连接时创建的管理器直接用于重试，不再重复认证
+        wanted = {record['base_name'] for record in records}
+        for manager, _ in context.iter_bases():
+            if manager.base_name in wanted:
+                managers[manager.base_name] = manager
+            else:
+                manager.close()
+            if wanted <= set(managers):
+                break
+        try:
+            retry_stats = run_retry(context, records, managers)
+        finally:
+            for manager in managers.values():
+                manager.close()
+        remaining = [record for record in records if not context.image_history.get_record(record['url'])]
+        duration = time.time() - start_time
+        if managers:
+            logger.info(generate_report(next(iter(managers.values())), duration))
+        for record in remaining:
+            context.report_writer.write('pending_failure', record)
+        record_run_history(start_time, duration, retry_stats, context.image_history,
+                           context.concurrency, context.blob_cache, context.api_quota)
+        save_failed_records(remaining, scope)
+        context.export_mapping()
+        logger.info(f"[重试] ✨ 完成: 成功 {retry_stats['success']}, 仍失败 {len(remaining)}")
+    finally:
+        if context.blob_cache:
+            context.blob_cache.save()
+        context.api_quota.save()
+        context.report_writer.close()
+        cleanup_temp_files()
+
+def iter_scoped_columns(context: SyncContext):
+    """遍历范围内的 (管理器, 表格名, 图片列名)"""
+    for manager, metadata in context.iter_bases():
+        try:
+            for table in metadata.get('tables', []):
+                if not context.scope.match_table(table['name']):
+                    continue
+                for col in table.get('columns', []):
+                    if col.get('type') == 'image' and context.scope.match_column(col['name']):
+                        yield manager, table['name'], col['name']
+        finally:
+            manager.close()
+
+def iter_pending_images(manager: SeaTableManager, table_name: str, column_name: str):
+    """遍历某列中需要转存的图片，产出 (URL, 已知大小或None)，不下载"""
+    with RowPager(manager, table_name) as pager:
+        for rows in pager:
+            for row in rows:
+                images = row.get(column_name) or []
+                if isinstance(images, str):
+                    images = [images]
+                for image in images:
+                    url = image.get('url', '') if isinstance(image, dict) else image
+                    if (url and ImageProcessor.should_process_domain(url) and not manager.image_bed.is_hosted(url)
+                            and not manager.image_history.get_record(url)):
+                        yield url, manager.known_size(image)
+
+def run_plan(config: Config, scope: SyncScope):
+    """plan 命令：统计范围内待转存的图片数量，不下载也不写回"""
+    context = SyncContext(config, scope)
+    total = 0
+    known_bytes = 0
+    unknown = 0  # 大小未知的图片数（不发请求无法得知，不按0计入）
+    base_counts: Dict[str, Tuple[str, int]] = {}  # base_key -> (base名称, 待转存数)
+    lines = ["=" * 50, "转存计划", "=" * 50]
+    for manager, table_name, column_name in iter_scoped_columns(context):
+        if scope.is_expired():
+            lines.append("⏰ 时间预算用尽，以下统计不完整")
+            break
+        sizes = [size for _, size in iter_pending_images(manager, table_name, column_name)]
+        count = len(sizes)
+        total += count
+        known_bytes += sum(size for size in sizes if size is not None)
+        unknown += sum(1 for size in sizes if size is None)
+        base_counts[manager.base_key] = (manager.base_name, base_counts.get(manager.base_key, ('', 0))[1] + count)
+        lines.append(f"{manager.base_name} / {table_name} / {column_name}: {count} 张待转存")
+    context.api_quota.save()
+
+    lines.append(f"合计: {total} 张")
+    if total:
+        if unknown == total:
+            lines.append("预计下载: 未知（单元格中没有图片大小）")
+        else:
+            lines.append(f"预计下载: 已知 {ImageProcessor.format_file_size(known_bytes)}"
+                         + (f"，另有 {unknown} 张大小未知" if unknown else ""))
+    runs = RunHistoryStore().recent_runs(REGRESSION_WINDOW)
+    rates = [run['images_per_sec'] for run in runs if run['success']]
+    if total and rates:
+        lines.append(f"预计耗时: {total / statistics.median(rates):.0f} 秒（按最近运行吞吐 {statistics.median(rates):.3f} 张/秒）")
+    # 按最近运行的每张图片API调用数估算，对照当日剩余预算
+    call_rates = [run['api_calls'] / run['success'] for run in runs if run['success']]
+    if total and call_rates:
+        per_image = statistics.median(call_rates)
+        lines.append(f"预计API调用: {total * per_image:.0f} 次（按最近运行每张 {per_image:.2f} 次）")
+        quota = context.api_quota
+        for base_key, (base_name, count) in base_counts.items():
+            if quota.daily_budget <= 0 or not count:
+                continue
+            remaining = max(0, quota.daily_budget - quota.usage(base_key))
+            if count * per_image > remaining:
+                lines.append(f"⚠️ {base_name}: 预计需要 {count * per_image:.0f} 次，当日剩余 {remaining} 次，部分图片将推迟到之后运行")
+    print("\n".join(lines))
+
+def run_bench(config: Config, scope: SyncScope, sample: int = 20):
+    """bench 命令：抽样下载范围内待转存的图片，测量读取和下载吞吐（不上传、不写回）"""
+    context = SyncContext(config, scope)
+    urls: List[Tuple[SeaTableManager, str]] = []
+    list_start = time.monotonic()
+    for manager, table_name, column_name in iter_scoped_columns(context):
+        for url, _ in iter_pending_images(manager, table_name, column_name):
+            urls.append((manager, url))
+            if len(urls) >= sample:
+                break
+        if len(urls) >= sample or scope.is_expired():
+            break
+    list_elapsed = time.monotonic() - list_start
+    if not urls:
+        print("范围内没有待转存的图片")
+        return
+
+    def fetch(item: Tuple[SeaTableManager, str]) -> int:
+        manager, url = item
+        temp_file = manager._download_image(url)
+        if not temp_file:
+            return -1
+        try:
+            return os.path.getsize(temp_file)
+        finally:
+            os.unlink(temp_file)
+
+    download_start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=context.concurrency.download.limit) as executor:
+        sizes = list(executor.map(fetch, urls))
+    download_elapsed = time.monotonic() - download_start
+    cleanup_temp_files()
+
+    ok = [size for size in sizes if size >= 0]
+    total_bytes = sum(ok)
+    print("\n".join([
+        "=" * 50,
+        "基准测试",
+        "=" * 50,
+        f"读取行数据: {list_elapsed:.2f}秒 (抽样 {len(urls)} 张)",
+        f"下载: 成功 {len(ok)} / {len(urls)}, 共 {ImageProcessor.format_file_size(total_bytes)}, 耗时 {download_elapsed:.2f}秒",
+        f"下载吞吐: {len(ok) / download_elapsed:.2f} 张/秒, "
+        f"{ImageProcessor.format_file_size(total_bytes / download_elapsed)}/秒" if download_elapsed > 0 else "下载吞吐: -",
+        f"并发: {context.concurrency.download.limit}"
+    ]))
+
+def add_scope_arguments(parser: argparse.ArgumentParser):
+    """添加范围过滤参数"""
+    parser.add_argument('--base', dest='bases', action='append', default=[], metavar='NAME',
+                        help='只处理匹配的base（可重复，支持通配符）')
+    parser.add_argument('--exclude-base', dest='exclude_bases', action='append', default=[], metavar='NAME',
+                        help='排除匹配的base')
+    parser.add_argument('--table', dest='tables', action='append', default=[], metavar='NAME',
+                        help='只处理匹配的表格')
+    parser.add_argument('--exclude-table', dest='exclude_tables', action='append', default=[], metavar='NAME',
+                        help='排除匹配的表格')
+    parser.add_argument('--column', dest='columns', action='append', default=[], metavar='NAME',
+                        help='只处理匹配的图片列（默认跳过的列需显式指定）')
+    parser.add_argument('--exclude-column', dest='exclude_columns', action='append', default=[], metavar='NAME',
+                        help='排除匹配的图片列')
+    parser.add_argument('--time-budget', type=float, default=0, metavar='SECONDS',
+                        help='时间预算（秒，覆盖 SYNC_TIME_BUDGET），用尽后不再开始新的工作并输出部分结果')
+    parser.add_argument('--concurrency', type=int, default=0, metavar='N',
+                        help='并发上限（覆盖 SYNC_MAX_CONCURRENCY）')
+    parser.add_argument('--table-concurrency', type=int, default=0, metavar='N',
+                        help='同一base内并发处理的表格数（覆盖 SYNC_TABLE_CONCURRENCY）')
+    parser.add_argument('--full-audit', action='store_true',
+                        help='忽略base指纹，强制全量检查')
+
+def run_sync(config: Config, scope: SyncScope, trace_memory: bool = False):
+    """sync 命令，可选开启内存追踪"""
+    memory_tracer = MemoryTracer() if trace_memory else None
+    if memory_tracer:
+        memory_tracer.start()
+    try:
+        main(config, scope, memory_tracer)
+    finally:
+        if memory_tracer:
+            memory_tracer.stop()
+
+def run_profiled(command: str, config: Config, scope: SyncScope, trace_memory: bool = False):
+    """在采样分析下运行 sync 或 retry"""
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        if command == 'retry':
+            run_retry_command(config, scope)
+        else:
+            run_sync(config, scope, trace_memory)
+    finally:
+        run_dir = profiler.stop()
+        if run_dir:
+            summary = profiler.stage_summary()
+            total = sum(summary.values()) or 1
+            logger.info(f"[性能] 📝 分析结果已写入: {run_dir}")
+            for stage, count in sorted(summary.items(), key=lambda item: -item[1]):
+                logger.info(f"[性能]   {stage}: {count} 次采样 ({count / total:.1%})")
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """命令行参数"""
+    parser = argparse.ArgumentParser(description='SeaTable图片同步工具')
+    subparsers = parser.add_subparsers(dest='command')
+
+    for name, help_text in (('sync', '转存图片并写回表格（默认）'), ('retry', '只重试上次失败的图片')):
+        command = subparsers.add_parser(name, help=help_text)
+        add_scope_arguments(command)
+        command.add_argument('--profile', action='store_true',
+                             help='采样分析本次运行，输出按线程和阶段汇总的结果及折叠栈文件')
+        command.add_argument('--import-mapping', action='append', default=[], metavar='PATH',
+                             help='运行前导入映射文件（CSV或JSONL，可重复）')
+        command.add_argument('--export-mapping', metavar='PATH',
+                             help='运行后导出映射文件（.csv 为CSV，其它为JSONL）')
+    subparsers.choices['sync'].add_argument('--trace-memory', action='store_true',
+                                            help='用 tracemalloc 在各阶段结束时快照内存，结果附在报告中')
+    subparsers.choices['sync'].add_argument('--reclaim-assets', action='store_true',
+                                            help='转存并校验通过后分批删除base中不再被引用的原素材（覆盖 SYNC_RECLAIM_ASSETS，撤销记录见统计目录）')
+    add_scope_arguments(subparsers.add_parser('plan', help='统计待转存的图片，不做修改'))
+    bench = subparsers.add_parser('bench', help='抽样测量下载吞吐，不上传不写回（故障注入见 seatable_image_sync_bench.py）')
+    add_scope_arguments(bench)
+    bench.add_argument('--sample', type=int, default=20, help='抽样图片数')
+    add_scope_arguments(subparsers.add_parser('daemon', help='守护模式：接收webhook或轮询变更'))
+    report = subparsers.add_parser('report', help='查看运行趋势')
+    report.add_argument('--limit', type=int, default=20, help='显示最近多少次运行')
+    return parser
+
+def scope_from_args(args: argparse.Namespace) -> SyncScope:
+    """根据命令行参数生成同步范围"""
+    return SyncScope(
+        bases=args.bases,
+        exclude_bases=args.exclude_bases,
+        tables=args.tables,
+        exclude_tables=args.exclude_tables,
+        columns=args.columns,
+        exclude_columns=args.exclude_columns,
+        time_budget=args.time_budget,
+        full_audit=args.full_audit
+    )
+
+def cli(argv: Optional[List[str]] = None):
+    """命令行入口"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        argv = ['daemon' if os.getenv('SYNC_MODE') == 'daemon' else 'sync']
+    args = build_arg_parser().parse_args(argv)
+
+    if args.command == 'report':
+        show_run_history(args.limit)
+        return
+
+    if not check_environment():
+        return
+    config = Config()
+    if args.concurrency > 0:
+        scheduler_config = config.config['scheduler']
+        scheduler_config['max_concurrency'] = args.concurrency
+        scheduler_config['initial_concurrency'] = min(scheduler_config['initial_concurrency'], args.concurrency)
+        scheduler_config['min_concurrency'] = min(scheduler_config['min_concurrency'], args.concurrency)
+    if args.table_concurrency > 0:
+        config.config['scheduler']['table_concurrency'] = args.table_concurrency
+    scope = scope_from_args(args)
+    if not scope.time_budget:
+        scope.time_budget = config.config['scheduler']['time_budget']
+    if getattr(args, 'reclaim_assets', False):
+        config.config['reclaim']['enabled'] = True
+    if args.command in ('sync', 'retry'):
+        mapping_config = config.config['mapping']
+        mapping_config['import'] = args.import_mapping or mapping_config['import']
+        mapping_config['export'] = args.export_mapping or mapping_config['export']
+
+    if args.command in ('sync', 'retry') and args.profile:
+        run_profiled(args.command, config, scope, getattr(args, 'trace_memory', False))
+    elif args.command == 'retry':
+        run_retry_command(config, scope)
+    elif args.command == 'plan':
+        run_plan(config, scope)
+    elif args.command == 'bench':
+        run_bench(config, scope, args.sample)
+    elif args.command == 'daemon':
+        run_daemon(config, scope)
+    else:
+        run_sync(config, scope, args.trace_memory)
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    cli()
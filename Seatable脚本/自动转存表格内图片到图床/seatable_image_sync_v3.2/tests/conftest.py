@@ -0,0 +1,114 @@
+import importlib.util
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+SYNC_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'seatable_image_sync_v3.2.py')
+DTABLE_UUID = '12345678-1234-1234-1234-123456789abc'
+
+
+def load_sync_module():
+    """按路径加载同步脚本（文件名含点号，不能直接 import）"""
+    if 'seatable_image_sync' in sys.modules:
+        return sys.modules['seatable_image_sync']
+    spec = importlib.util.spec_from_file_location('seatable_image_sync', SYNC_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+sync = load_sync_module()
+
+
+class FakeBase:
+    """只实现同步用到的接口，表格数据放在内存里"""
+    def __init__(self, tables, image_columns=('图片',)):
+        self.tables = tables  # 表名 -> 行列表
+        self.image_columns = list(image_columns)
+        self.dtable_uuid = DTABLE_UUID
+
+    def get_metadata(self):
+        return {'tables': [{'_id': name[:4], 'name': name,
+                            'columns': [{'name': column, 'type': 'image'} for column in self.image_columns]}
+                           for name in self.tables]}
+
+    def list_rows(self, table_name, start=0, limit=100):
+        return self.tables[table_name][start:start + limit]
+
+    def get_row(self, table_name, row_id):
+        return next((row for row in self.tables[table_name] if row['_id'] == row_id), None)
+
+    def update_row(self, table_name, row_id, row_data):
+        self.get_row(table_name, row_id).update(row_data)
+
+    def query(self, sql, convert=True, parameters=None):
+        name = sql.split('`')[1]
+        rows = self.tables[name]
+        if 'WHERE _mtime > ?' in sql:
+            mtime, _, last_id = parameters
+            limit = int(sql.rsplit('LIMIT', 1)[1])
+            return sorted((row for row in rows if (row['_mtime'], row['_id']) > (mtime, last_id)),
+                          key=lambda row: (row['_mtime'], row['_id']))[:limit]
+        return [{'COUNT(*)': len(rows), 'MAX(_mtime)': max((row['_mtime'] for row in rows), default=None)}]
+
+
+class FakeManager(sync.SeaTableManager):
+    """不连接SeaTable的管理器"""
+    fake_base = None
+
+    def _init_base(self):
+        return self.fake_base
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    """所有落盘路径都指向临时目录的配置"""
+    monkeypatch.setattr(sync, 'TEMP_DIR', str(tmp_path / 'temp'))
+    monkeypatch.setattr(sync, 'FAILED_FILE', str(tmp_path / 'failed.json'))
+    os.makedirs(sync.TEMP_DIR)
+    config = sync.Config(bases=[{'name': 'demo', 'token': 'token'}])
+    config.config['cache']['max_bytes'] = 0
+    config.config['phash']['enabled'] = False
+    config.config['verify']['sample_rate'] = 0
+    config.config['report']['dir'] = str(tmp_path / 'reports')
+    config.config['http']['timeout'] = 5
+    config.config['scheduler']['audit_hours'] = 24
+    return config
+
+
+@pytest.fixture
+def base(monkeypatch):
+    """管理器连接到的内存base，默认一个空表"""
+    fake_base = FakeBase({'素材': []})
+    monkeypatch.setattr(FakeManager, 'fake_base', fake_base)
+    return fake_base
+
+
+@pytest.fixture
+def context(config, base, tmp_path):
+    """使用临时运行历史库、不连接SeaTable的同步上下文"""
+    context = sync.SyncContext(config)
+    context.manager_class = FakeManager
+    context.api_quota = sync.ApiQuota(daily_budget=0, db_path=str(tmp_path / 'runs.db'))
+    context._fingerprint_store = sync.RunHistoryStore(str(tmp_path / 'runs.db'))
+    return context
+
+
+@pytest.fixture
+def http_server():
+    """在本机启动一个HTTP服务，返回 (服务, 根URL)"""
+    servers = []
+
+    def start(handler):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,58 @@
+import pytest
+
+from conftest import DTABLE_UUID, FakeManager, sync
+
+
+def test_api_quota_counts_calls_and_persists_daily_usage(tmp_path, monkeypatch):
+    monkeypatch.setattr(sync, 'QUOTA_MAX_DELAY', 1.0)
+    db_path = str(tmp_path / 'runs.db')
+    quota = sync.ApiQuota(daily_budget=10, slowdown=0.5, db_path=db_path)
+    delays = [quota.record('base', '示例', 'list_rows') for _ in range(4)]
+    quota.record('base', '示例', 'update_row')
+    assert delays == [0.0] * 4
+    assert quota.totals() == {'list_rows': 4, 'update_row': 1}
+    quota.save()
+
+    later = sync.ApiQuota(daily_budget=10, slowdown=0.5, db_path=db_path)
+    assert later.usage('base') == 5
+    assert later.record('base', '示例', 'list_rows') == pytest.approx(0.2)  # 超过放慢阈值后线性增加
+    assert not later.is_exhausted('base')
+    for _ in range(4):
+        later.record('base', '示例', 'list_rows')
+    assert later.is_exhausted('base')
+    assert later.usage('other') == 0
+
+
+@pytest.fixture
+def run_metrics(monkeypatch):
+    run_metrics = sync.RunMetrics()
+    monkeypatch.setattr(sync, 'metrics', run_metrics)
+    return run_metrics
+
+
+@pytest.mark.parametrize('bases,expected', [
+    ([{'name': 'demo', 'token': 'token'}], 'demo'),
+    ([{'token': 'token'}], '未命名1'),  # 元数据中没有名称时按序号命名
+])
+def test_metadata_call_is_metered_under_resolved_name(context, run_metrics, bases, expected):
+    context.config.config['seatable']['bases'] = bases
+    [(manager, _)] = list(context.iter_bases())
+
+    assert manager.base_name == expected
+    assert set(run_metrics.bases) == {expected}
+    assert run_metrics.bases[expected]['api_calls'] == 1
+    assert context.api_quota.names == {DTABLE_UUID: expected}
+    assert context.api_quota.totals() == {'get_metadata': 1}
+
+
+def test_manager_is_closed_when_metadata_fails(context, run_metrics, monkeypatch):
+    closed = []
+
+    def get_metadata():
+        raise ConnectionError(500, 'boom')
+    monkeypatch.setattr(FakeManager.fake_base, 'get_metadata', get_metadata)
+    monkeypatch.setattr(FakeManager, 'close', lambda self: closed.append(self.base_name))
+
+    assert list(context.iter_bases()) == []
+    assert closed == ['demo']
+    assert run_metrics.bases == {}
@@ -0,0 +1,68 @@
+import importlib.util
+import os
+import shutil
+import time
+
+import pytest
+
+from conftest import sync
+
+BENCH_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'seatable_image_sync_bench.py')
+
+
+def load_bench_module():
+    """按路径加载基准脚本，与测试共用已加载的同步脚本"""
+    spec = importlib.util.spec_from_file_location('seatable_image_sync_bench', BENCH_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+bench = load_bench_module()
+
+
+@pytest.fixture
+def server():
+    server = bench.SimulatedServer(bench.FaultSchedule(), bases=2, tables=2, rows=3, image_bytes=2048, timeout=2)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def bench_config(server, tmp_path, monkeypatch):
+    """失败记录和指纹库都放在临时目录"""
+    monkeypatch.setattr(sync, 'TEMP_DIR', str(tmp_path / 'temp'))
+    monkeypatch.setattr(sync, 'FAILED_FILE', str(tmp_path / 'failed.json'))
+    monkeypatch.setattr(bench.SimulatedContext, 'runs_db', str(tmp_path / 'runs.db'))
+    os.makedirs(sync.TEMP_DIR)
+    config = bench.simulated_config(server, bench.build_arg_parser().parse_args(['--timeout', '2']))
+    yield config
+    shutil.rmtree(config.config['report']['dir'], ignore_errors=True)
+
+
+def test_passes_drain_failed_record_file(server, bench_config, monkeypatch):
+    # 第一轮各base第一个表格的资源下载返回404，记录失败并写入失败记录文件；之后恢复正常
+    handler = server.httpd.RequestHandlerClass
+    do_get = handler.do_GET
+
+    def missing_first_table(self):
+        if self.path.split('/')[-1].startswith('t0-'):
+            self._send(404, b'{}')
+        else:
+            do_get(self)
+    monkeypatch.setattr(handler, 'do_GET', missing_first_table)
+    deadline = time.monotonic() + 60
+
+    first = bench.run_passes(server, bench_config, deadline, 1)[0]
+    broken = sum(len(row['图片']) for tables in server.data.values() for row in tables['表0'])
+    assert first['failed'] == len(sync.load_failed_records()) == broken
+    assert first['done'] == first['total'] - broken
+
+    monkeypatch.setattr(handler, 'do_GET', do_get)
+    passes = bench.run_passes(server, bench_config, deadline, 3)
+    assert [result['failed'] for result in passes] == [0]
+    assert sync.load_failed_records() == []
+    assert passes[0]['done'] == passes[0]['total']
+
+    # 没有遗留失败的base保存了指纹，下一轮整体跳过
+    assert bench.run_passes(server, bench_config, deadline, 1)[0]['unchanged'] == len(server.tokens)
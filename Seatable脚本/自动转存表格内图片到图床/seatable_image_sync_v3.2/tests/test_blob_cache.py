@@ -0,0 +1,80 @@
+import os
+
+from conftest import sync
+
+
+def put(cache, tmp_path, url, data, ext='.png'):
+    source = tmp_path / f'download{ext}'
+    source.write_bytes(data)
+    path, digest = cache.put(url, str(source), 'image/png')
+    cache.release(digest)
+    return path, digest
+
+
+def test_blob_cache_evicts_least_recently_used(tmp_path):
+    cache = sync.BlobCache(str(tmp_path / 'cache'), max_bytes=250)
+    put(cache, tmp_path, 'u1', b'a' * 100)
+    put(cache, tmp_path, 'u2', b'b' * 100)
+    assert cache.get('u1')  # u1 变为最近使用
+    cache.release(cache.get('u1')[1])
+    put(cache, tmp_path, 'u3', b'c' * 100)
+
+    assert cache.cached_size('u2') is None
+    assert cache.cached_size('u1') == 100
+    assert cache.cached_size('u3') == 100
+    assert cache.total_size == 200
+
+
+def test_blob_cache_keeps_pinned_files(tmp_path):
+    cache = sync.BlobCache(str(tmp_path / 'cache'), max_bytes=150)
+    source = tmp_path / 'a.png'
+    source.write_bytes(b'a' * 100)
+    path, digest = cache.put('u1', str(source), 'image/png')  # 未释放，保持锁定
+    put(cache, tmp_path, 'u2', b'b' * 100)
+
+    assert os.path.exists(path)
+    assert cache.cached_size('u1') == 100
+    assert cache.cached_size('u2') is None
+    cache.release(digest)
+    assert cache.total_size <= 150
+
+
+def test_blob_cache_readds_lost_file_without_double_counting(tmp_path):
+    cache = sync.BlobCache(str(tmp_path / 'cache'), max_bytes=1000)
+    path, _ = put(cache, tmp_path, 'u1', b'a' * 100)
+    os.unlink(path)
+    path, _ = put(cache, tmp_path, 'u2', b'a' * 100, ext='.jpg')
+
+    assert cache.total_size == 100
+    assert path.endswith('.jpg') and os.path.exists(path)
+
+
+def test_blob_cache_forgets_urls_of_evicted_content(tmp_path):
+    cache = sync.BlobCache(str(tmp_path / 'cache'), max_bytes=150)
+    put(cache, tmp_path, 'u1', b'a' * 100)
+    put(cache, tmp_path, 'u1-copy', b'a' * 100)
+    put(cache, tmp_path, 'u2', b'b' * 100)
+
+    assert cache.get('u1') is None
+    assert cache.get('u1-copy') is None
+    assert cache.cached_size('u2') == 100
+
+
+def test_blob_cache_index_survives_restart(tmp_path):
+    cache = sync.BlobCache(str(tmp_path / 'cache'), max_bytes=1000)
+    path, digest = put(cache, tmp_path, 'u1', b'a' * 100)
+    cache.save()
+
+    reloaded = sync.BlobCache(str(tmp_path / 'cache'), max_bytes=1000)
+    assert reloaded.get('u1') == (path, digest, 'image/png')
+    assert reloaded.total_size == 100
+    assert reloaded.hits == 1
+
+
+def test_blob_cache_skips_files_over_capacity(tmp_path):
+    cache = sync.BlobCache(str(tmp_path / 'cache'), max_bytes=50)
+    source = tmp_path / 'big.png'
+    source.write_bytes(b'a' * 100)
+    assert cache.put('u1', str(source), 'image/png') is None
+    assert source.exists()  # 调用方仍负责清理原文件
+    assert cache.total_size == 0
@@ -0,0 +1,50 @@
+import time
+
+from conftest import sync
+
+
+def test_scope_expires_after_time_budget():
+    scope = sync.SyncScope(time_budget=60, started_at=time.time() - 61)
+    assert scope.is_expired()
+    assert not scope.covers_all()  # 提前结束的运行不算完整处理
+
+    assert not sync.SyncScope(time_budget=60).is_expired()
+    assert not sync.SyncScope(time_budget=0, started_at=0).is_expired()  # 0 表示不限制
+
+
+def test_signal_expires_scope():
+    scope = sync.SyncScope()
+    scope.expire()
+    assert scope.is_expired()
+
+
+def test_cheapest_and_most_valuable_images_go_first(context):
+    manager = context.create_manager('token', '示例')
+    manager.image_history.add_success_record('https://a/done.png', 'https://bed/done.png')
+    manager.previous_failures = {'https://a/failed.png'}
+    images = {
+        'done': 'https://a/done.png',
+        'small': {'url': 'https://a/small.png', 'size': 10 * 1024},
+        'unknown': 'https://a/unknown.png',
+        'failed': {'url': 'https://a/failed.png', 'size': 1024},
+    }
+
+    order = sorted(images, key=lambda name: manager.estimate_cost(images[name]))
+    assert order == ['done', 'small', 'unknown', 'failed']
+    assert manager.estimate_cost(images['unknown']) == sync.UNKNOWN_IMAGE_COST
+
+
+def test_manager_stops_taking_work_once_budget_expires(context):
+    manager = context.create_manager('token', '示例')
+    assert not manager.out_of_budget()
+    context.scope.expire()
+    assert manager.out_of_budget()
+
+
+def test_fresh_rows_use_the_fresh_lane(context):
+    manager = context.create_manager('token', '示例')
+    manager.fresh_seconds = 3600
+    now = sync.datetime.now(sync.timezone.utc).isoformat()
+    assert manager.get_row_lane({'_mtime': now}) == sync.LANE_FRESH
+    assert manager.get_row_lane({'_mtime': '2000-01-01T00:00:00Z'}) == sync.LANE_BACKFILL
+    assert manager.get_row_lane({}) == sync.LANE_BACKFILL
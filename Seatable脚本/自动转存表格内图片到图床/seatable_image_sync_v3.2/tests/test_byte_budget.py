@@ -0,0 +1,52 @@
+import threading
+
+from conftest import sync
+
+
+def reserve_in_thread(budget, size):
+    """在后台线程预留，返回 (线程, 预留完成事件, 结果列表)"""
+    done = threading.Event()
+    result = []
+    thread = threading.Thread(target=lambda: (result.append(budget.reserve(size)), done.set()))
+    thread.start()
+    return thread, done, result
+
+
+def test_reserve_waits_until_bytes_are_released():
+    budget = sync.ByteBudget(100)
+    first = budget.reserve(60)
+    thread, done, _ = reserve_in_thread(budget, 60)
+
+    assert not done.wait(0.2)
+    first.release()
+    assert done.wait(2)
+    thread.join()
+    snapshot = budget.snapshot()
+    assert snapshot['in_use'] == 60
+    assert snapshot['peak'] == 60
+    assert snapshot['waits'] == 1
+
+
+def test_oversized_file_runs_alone():
+    budget = sync.ByteBudget(100)
+    big = budget.reserve(500)  # 没有其它占用时放行，按总预算计
+    assert budget.snapshot()['in_use'] == 100
+    thread, done, _ = reserve_in_thread(budget, 1)
+    assert not done.wait(0.2)
+    big.release()
+    assert done.wait(2)
+    thread.join()
+
+
+def test_resize_to_actual_size_wakes_waiters():
+    budget = sync.ByteBudget(100)
+    reservation = budget.reserve(100)  # 大小未知时按上限预留
+    thread, done, _ = reserve_in_thread(budget, 50)
+    assert not done.wait(0.2)
+
+    reservation.resize(30)  # 拿到 Content-Length 后缩小
+    assert done.wait(2)
+    thread.join()
+    assert budget.snapshot()['in_use'] == 80
+    reservation.release()
+    assert budget.snapshot()['in_use'] == 50
@@ -0,0 +1,130 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import seatable_api.main
+
+from conftest import sync
+
+
+class AuthedBase:
+    """已认证base的最小替身：SeaTable各服务地址"""
+    server_url = 'https://cloud.seatable.io'
+    dtable_server_url = 'https://cloud.seatable.io/dtable-server/'
+    dtable_db_url = 'https://cloud.seatable.io/dtable-db/'
+
+    def list_rows(self, table_name):
+        if not self.server_url.startswith('http://127.'):
+            return []
+        # 和 seatable-api 4.x 一样直接调用模块级 requests
+        response = seatable_api.main.requests.get(f'{self.server_url}/rows', params={'table_name': table_name})
+        return response.json()['rows']
+
+
+class RowsApi(BaseHTTPRequestHandler):
+    """返回空行列表，记录每个请求来自的客户端端口（同一连接端口相同）"""
+    protocol_version = 'HTTP/1.1'
+    ports = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        RowsApi.ports.append(self.client_address[1])
+        body = json.dumps({'rows': []}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    transport = sync.HttpTransport(default_pool_size=2)
+    monkeypatch.setattr(sync, 'http_transport', transport)
+    yield transport
+    transport.close()
+
+
+def in_threads(count, func):
+    """在count个线程里各调用一次func，返回结果列表"""
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def run(index):
+        barrier.wait()  # 线程同时存活，线程ID不会复用
+        results[index] = func()
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_each_thread_gets_its_own_client(transport):
+    base = AuthedBase()
+    pool = sync.SeaTableClientPool(base, pool_size=4)
+    clients = in_threads(4, lambda: pool.client)
+    assert len({id(client) for client in clients}) == 4
+    assert all(client is not base and client.dtable_server_url == base.dtable_server_url for client in clients)
+    assert pool.size == 4
+
+
+def test_client_is_reused_within_a_thread(transport):
+    pool = sync.SeaTableClientPool(AuthedBase(), pool_size=2)
+    assert pool.client is pool.client
+    assert pool.size == 1
+
+
+def test_metered_clients_count_calls_per_thread(transport):
+    calls = []
+    pool = sync.SeaTableClientPool(AuthedBase(), pool_size=3, on_call=calls.append)
+    in_threads(3, lambda: pool.client.list_rows('素材'))
+    assert calls == ['list_rows'] * 3
+    assert pool.size == 3
+
+
+def test_pool_sizes_transport_for_each_seatable_host(transport):
+    sync.SeaTableClientPool(AuthedBase(), pool_size=6)
+    assert transport.adapter_for('https://cloud.seatable.io/api/v2.1/')._pool_maxsize == 6
+    assert transport.adapter_for('https://cloud.seatable.io/dtable-server/api/v1/')._pool_maxsize == 6
+    assert transport.adapter_for('https://cloud.seatable.io/dtable-db/api/v1/query/')._pool_maxsize == 6
+    assert transport.adapter_for('https://files.example.com/x')._pool_maxsize == 2  # 未登记的主机按默认大小
+
+
+def test_each_thread_gets_its_own_sized_session(transport):
+    pool = sync.SeaTableClientPool(AuthedBase(), pool_size=5)
+    sessions = in_threads(3, lambda: pool.thread_session)
+    assert len({id(session) for session in sessions}) == 3
+    assert all(session.get_adapter('https://cloud.seatable.io/')._pool_maxsize == 5 for session in sessions)
+    pool.close()
+
+
+@pytest.fixture
+def local_base(http_server, transport):
+    RowsApi.ports = []
+    base = AuthedBase()
+    base.server_url = http_server(RowsApi)
+    return base
+
+
+def test_sdk_calls_reuse_the_thread_session(local_base):
+    pool = sync.SeaTableClientPool(local_base, pool_size=2)
+
+    def list_twice():
+        pool.client.list_rows('素材')
+        pool.client.list_rows('素材')
+    in_threads(2, list_twice)
+    assert len(RowsApi.ports) == 4
+    assert len(set(RowsApi.ports)) == 2  # 每个线程一个keep-alive连接，第二次调用复用
+    pool.close()
+
+
+def test_sdk_calls_outside_the_pool_are_unchanged(local_base):
+    sync.SeaTableClientPool(local_base, pool_size=2)
+    assert seatable_api.main.requests is sync.sdk_requests
+    local_base.list_rows('素材')
+    local_base.list_rows('素材')
+    assert len(set(RowsApi.ports)) == 2  # 未绑定会话时照旧每次新建连接
@@ -0,0 +1,209 @@
+import json
+import threading
+import time
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+import pytest
+
+from conftest import DTABLE_UUID, FakeManager, sync
+
+LATER = '2999-01-01T00:00:00.000+00:00'
+
+
+@pytest.fixture
+def daemon(config, context, base):
+    """只连接内存base的守护进程，webhook监听随机端口，默认不轮询"""
+    base.image_columns = ['图片', '封面']
+    base.tables['素材'] = [{'_id': 'r1', '_mtime': '2000-01-01T00:00:00.000+00:00', '图片': []}]
+    config.config['daemon'].update(host='127.0.0.1', port=0, poll_interval=0, batch_window=0.3,
+                                   webhook_token='secret')
+    daemon = sync.SyncDaemon(config)
+    daemon.context = context
+    return daemon
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    """记录提交给调度器的 (表, 列, 行ID)，不实际转存"""
+    calls = []
+    monkeypatch.setattr(FakeManager, 'submit_row',
+                        lambda self, table_name, column_name, row, lane=None: calls.append(
+                            (table_name, column_name, row['_id'])))
+    return calls
+
+
+@pytest.fixture
+def running(daemon, monkeypatch):
+    """在后台线程运行守护进程，返回 (根URL, 已处理的批次)"""
+    batches = []
+    processed = threading.Event()
+    process_batch = daemon.process_batch
+
+    def record(batch):
+        batches.append(batch)
+        try:
+            process_batch(batch)
+        finally:
+            processed.set()
+
+    monkeypatch.setattr(daemon, 'process_batch', record)
+    thread = threading.Thread(target=daemon.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while daemon.server is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield f'http://127.0.0.1:{daemon.server.server_address[1]}', batches, processed
+    daemon.stop()
+    thread.join(timeout=5)
+
+
+def post(url, payload, headers=None):
+    request = Request(url, data=json.dumps(payload).encode(), method='POST',
+                      headers=dict({'Content-Type': 'application/json'}, **(headers or {})))
+    try:
+        with urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def event(row_id, column='图片'):
+    return {'data': {'dtable_uuid': DTABLE_UUID.replace('-', ''), 'table_name': '素材', 'row_id': row_id,
+                     'row_data': [{'column_name': column, 'column_type': 'image'}]}}
+
+
+def test_webhook_rejects_missing_or_wrong_token(running):
+    url, batches, _ = running
+    assert post(url + '/', event('r1'))[0] == 401
+    assert post(url + '/?token=wrong', event('r1'))[0] == 403
+    assert post(url + '/', event('r1'), {'X-Sync-Token': 'wrong'})[0] == 403
+    time.sleep(0.5)
+    assert batches == []
+
+
+def test_webhook_events_are_debounced_into_one_batch(running, submitted, base):
+    url, batches, processed = running
+    base.tables['素材'].append({'_id': 'r2', '_mtime': LATER, '图片': []})
+    assert post(url + '/?token=secret', event('r1')) == (200, {'queued': 1})
+    assert post(url + '/', event('r1', '封面'), {'X-Sync-Token': 'secret'}) == (200, {'queued': 1})
+    assert post(url + '/?token=secret', event('r2')) == (200, {'queued': 1})
+
+    assert processed.wait(5)
+    assert len(batches) == 1
+    assert sorted(submitted) == [('素材', '图片', 'r1'), ('素材', '图片', 'r2'), ('素材', '封面', 'r1')]
+
+
+def test_unknown_base_is_ignored(running):
+    url, _, _ = running
+    payload = event('r1')
+    payload['data']['dtable_uuid'] = 'ffffffff'
+    assert post(url + '/?token=secret', payload) == (200, {'queued': 0})
+
+
+def test_poll_queues_rows_changed_since_last_mark(daemon, base, submitted):
+    daemon.start_managers()
+    base.tables['素材'].append({'_id': 'r2', '_mtime': LATER, '图片': []})
+
+    daemon.poll_once()
+    batch = daemon.batcher.next_batch(timeout=0)
+    assert [key[2] for key, _ in batch] == ['r2']
+    assert daemon._poll_marks[(str(base.dtable_uuid), '素材')] == (LATER, 'r2')
+
+    daemon.poll_once()  # 标记已前移，不再重复入队
+    assert len(daemon.batcher) == 0
+
+    daemon.process_batch(batch)
+    assert sorted(submitted) == [('素材', '图片', 'r2'), ('素材', '封面', 'r2')]
+
+
+def test_batcher_merges_changes_of_same_row():
+    batcher = sync.ChangeBatcher(window=0.05, max_size=10)
+    batcher.add('b', 't', 'r1', columns=['图片'])
+    batcher.add('b', 't', 'r1', columns=['封面'])
+    batcher.add('b', 't', 'r2')
+
+    batch = dict(batcher.next_batch(timeout=0))
+    assert batch[('b', 't', 'r1')]['columns'] == {'图片', '封面'}
+    assert batch[('b', 't', 'r2')]['all_columns']
+    assert batcher.next_batch(timeout=0) == []
+
+
+def test_metadata_error_skips_row_without_stopping(daemon, base, submitted, monkeypatch):
+    daemon.start_managers()
+    monkeypatch.setattr(type(base), 'get_metadata', lambda self: 1 / 0)
+    daemon.batcher.add(str(base.dtable_uuid), '新表', 'x1')
+    daemon.batcher.add(str(base.dtable_uuid), '素材', 'r1')
+    daemon.process_batch(daemon.batcher.next_batch(timeout=0))
+    assert sorted(submitted) == [('素材', '图片', 'r1'), ('素材', '封面', 'r1')]
+
+
+def test_failing_batch_does_not_stop_the_daemon(running, monkeypatch):
+    url, batches, processed = running
+    monkeypatch.setattr(sync.SyncContext, 'reset_processing_logs', lambda self: 1 / 0)
+    assert post(url + '/?token=secret', event('r1')) == (200, {'queued': 1})
+    assert processed.wait(5)
+    processed.clear()
+    assert post(url + '/?token=secret', event('r1')) == (200, {'queued': 1})
+    assert processed.wait(5)  # 出错后仍继续处理下一批
+    assert len(batches) == 2
+
+
+def test_failures_are_saved_and_retried(daemon, base, monkeypatch):
+    asset = 'https://cloud.seatable.io/workspace/1/asset/images/a.png'
+    base.tables['素材'][0]['图片'] = [asset]
+    outcome = {'url': None}
+    monkeypatch.setattr(FakeManager, 'process_image', lambda self, url: outcome['url'])
+    daemon.start_managers()
+
+    daemon.batcher.add(str(base.dtable_uuid), '素材', 'r1', columns=['图片'])
+    daemon.process_batch(daemon.batcher.next_batch(timeout=0))
+    assert [record['url'] for record in sync.load_failed_records()] == [asset]
+    assert daemon.context.processing_logs['failure_count'] == 0  # 日志已清空，失败记录仍保留
+
+    daemon.retry_failures()  # 仍失败：放回并保留，不重复
+    assert [record['url'] for record in sync.load_failed_records()] == [asset]
+
+    outcome['url'] = 'https://bed/a.png'
+    daemon.retry_failures()
+    assert sync.load_failed_records() == []
+    assert base.tables['素材'][0]['图片'] == ['https://bed/a.png']
+
+
+def test_saved_failures_are_picked_up_on_start(daemon, config):
+    saved = {'url': 'u', 'error': 'x', 'base_name': 'demo', 'table_name': '素材', 'row_id': 'r1',
+             'row_data': '', 'column_name': '图片'}
+    sync.save_failed_records([saved], sync.SyncScope())
+    daemon.start_managers()
+    assert daemon.context.image_history.get_failed_records() == [saved]
+
+
+def test_poll_pages_through_rows_sharing_one_mtime(daemon, base, monkeypatch):
+    monkeypatch.setattr(sync, 'DAEMON_BATCH_SIZE', 2)
+    daemon.start_managers()
+    base.tables['素材'] += [{'_id': f'r{i}', '_mtime': LATER, '图片': []} for i in range(2, 7)]
+
+    daemon.poll_once()
+    assert sorted(key[2] for key, _ in daemon.batcher.next_batch(timeout=0)) == ['r2', 'r3', 'r4', 'r5', 'r6']
+    base.tables['素材'].append({'_id': 'r7', '_mtime': LATER, '图片': []})  # 同一时间戳、排在标记之后
+    daemon.poll_once()
+    assert [key[2] for key, _ in daemon.batcher.next_batch(timeout=0)] == ['r7']
+
+
+def test_poll_skips_rows_changed_only_by_own_write_back(daemon, base, monkeypatch):
+    asset = 'https://cloud.seatable.io/workspace/1/asset/images/a.png'
+    base.tables['素材'].append({'_id': 'r2', '_mtime': LATER, '图片': [asset], '封面': []})
+    monkeypatch.setattr(FakeManager, 'process_image', lambda self, url: 'https://bed/a.png')
+    daemon.start_managers()
+
+    daemon.poll_once()
+    daemon.process_batch(daemon.batcher.next_batch(timeout=0))
+    assert base.tables['素材'][1]['图片'] == ['https://bed/a.png']
+
+    base.tables['素材'][1]['_mtime'] = '2999-01-01T00:00:01.000+00:00'  # 回写使_mtime前移
+    daemon.poll_once()
+    assert len(daemon.batcher) == 0
+
+    base.tables['素材'][1].update(_mtime='2999-01-01T00:00:02.000+00:00', 图片=['https://bed/a.png', asset])  # 用户再次修改
+    daemon.poll_once()
+    assert [key[2] for key, _ in daemon.batcher.next_batch(timeout=0)] == ['r2']
@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from conftest import sync
+
+Image = pytest.importorskip('PIL.Image')
+
+
+@pytest.fixture
+def images(tmp_path):
+    """原图、缩小并重新压缩的同一张图、水平翻转后的另一张图"""
+    original = Image.effect_mandelbrot((256, 256), (-2.0, -1.5, 1.0, 1.5), 100).convert('RGB')
+    paths = {
+        'original': tmp_path / 'original.png',
+        'resized': tmp_path / 'resized.jpg',
+        'different': tmp_path / 'different.png',
+    }
+    original.save(paths['original'])
+    original.resize((96, 96)).save(paths['resized'], quality=60)
+    original.transpose(Image.FLIP_LEFT_RIGHT).save(paths['different'])
+    return {name: str(path) for name, path in paths.items()}
+
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def test_dhash_tolerates_resize_and_recompression(images):
+    original = sync.PerceptualIndex.dhash(images['original'])
+    resized = sync.PerceptualIndex.dhash(images['resized'])
+    different = sync.PerceptualIndex.dhash(images['different'])
+
+    assert distance(original, resized) <= sync.PHASH_MAX_DISTANCE
+    assert distance(original, different) > sync.PHASH_MAX_DISTANCE
+
+
+def test_dhash_returns_none_for_undecodable_file(tmp_path):
+    path = tmp_path / 'broken.png'
+    path.write_bytes(b'\x89PNG\r\n\x1a\n' + b'\x00' * 32)
+    assert sync.PerceptualIndex.dhash(str(path)) is None
+
+
+def test_index_finds_nearest_and_ignores_duplicates(tmp_path, images):
+    db_path = str(tmp_path / 'phash.db')
+    index = sync.PerceptualIndex(db_path=db_path, audit_file=str(tmp_path / 'audit.jsonl'))
+    value = sync.PerceptualIndex.dhash(images['original'])
+    index.add(value, 'https://bed/a.png', 'source-a')
+    index.add(value, 'https://bed/b.png', 'source-b')  # 相同哈希不重复登记
+
+    resized = sync.PerceptualIndex.dhash(images['resized'])
+    assert index.find(resized) == ('https://bed/a.png', distance(value, resized))
+    assert index.find(sync.PerceptualIndex.dhash(images['different'])) is None
+
+    reloaded = sync.PerceptualIndex(db_path=db_path, audit_file=str(tmp_path / 'audit.jsonl'))
+    assert reloaded.find(value) == ('https://bed/a.png', 0)
+    reloaded.remove('https://bed/a.png')
+    assert reloaded.find(value) is None
+
+
+def flip(value, bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+@pytest.mark.parametrize('max_distance', [0, 4, 10])
+def test_banded_lookup_matches_brute_force(tmp_path, max_distance):
+    rng = random.Random(max_distance)
+    index = sync.PerceptualIndex(db_path=str(tmp_path / 'phash.db'), max_distance=max_distance)
+    stored = {}
+    for i in range(300):
+        value = rng.getrandbits(64)
+        stored[value] = f'https://bed/{i}.png'
+        index.add(value, stored[value], f'source-{i}')
+
+    for value in rng.sample(sorted(stored), 50):
+        # 翻转不超过阈值的位数一定能找到，超过阈值的（在随机数据中）找不到
+        near = flip(value, rng.sample(range(64), max_distance))
+        assert index.find(near) == (stored[value], max_distance)
+        far = flip(value, rng.sample(range(64), max_distance + 1))
+        expected = min(((bin(far ^ other).count('1'), url) for other, url in stored.items()), default=None)
+        found = index.find(far)
+        assert found == ((expected[1], expected[0]) if expected[0] <= max_distance else None)
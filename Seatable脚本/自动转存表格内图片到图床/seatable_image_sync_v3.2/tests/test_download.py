@@ -0,0 +1,102 @@
+import os
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from conftest import sync
+
+BODY = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 800
+
+
+def make_handler(range_status=206, content_range='bytes {start}-{end}/{total}', first_bytes=len(BODY) // 2,
+                 range_bytes=None):
+    """第一次请求只发送 first_bytes 字节后断开，带Range的请求按参数回应（range_bytes 限制续传发送的字节数）"""
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            range_header = self.headers.get('Range')
+            requests_seen.append(range_header)
+            self.close_connection = True
+            if not range_header:
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(BODY)))
+                self.end_headers()
+                self.wfile.write(BODY[:first_bytes])
+                return
+            start = int(range_header[len('bytes='):].rstrip('-'))
+            body = BODY[start:] if range_status == 206 else BODY
+            self.send_response(range_status)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(body)))
+            if range_status == 206:
+                self.send_header('Content-Range', content_range.format(start=start, end=len(BODY) - 1, total=len(BODY)))
+            self.end_headers()
+            self.wfile.write(body[:range_bytes])
+
+    return Handler, requests_seen
+
+
+def download(context, http_server, monkeypatch, handler):
+    url = http_server(handler) + '/image.png'
+    manager = context.create_manager('token', '示例')
+    monkeypatch.setattr(manager, '_get_download_link', lambda image_url: url)
+    return manager._download_image(url)
+
+
+def read_and_remove(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    os.unlink(path)
+    return data
+
+
+def test_interrupted_download_resumes_with_range(context, http_server, monkeypatch):
+    handler, seen = make_handler()
+    path = download(context, http_server, monkeypatch, handler)
+
+    assert path and read_and_remove(path) == BODY
+    assert seen[0] is None
+    # 从已写入文件的位置续传（中断时读到一半的分块不会写入）
+    assert 0 < int(seen[1][len('bytes='):].rstrip('-')) <= len(BODY) // 2
+
+
+def test_server_ignoring_range_restarts_from_scratch(context, http_server, monkeypatch):
+    handler, seen = make_handler(range_status=200)
+    path = download(context, http_server, monkeypatch, handler)
+
+    assert path and read_and_remove(path) == BODY
+    assert len(seen) == 2
+
+
+@pytest.mark.parametrize('content_range', ['bytes 0-{end}/{total}', ''])
+def test_mismatched_content_range_fails_without_leftovers(context, http_server, monkeypatch, content_range):
+    handler, seen = make_handler(content_range=content_range)
+
+    assert download(context, http_server, monkeypatch, handler) is None
+    assert len(seen) == 2
+    assert os.listdir(sync.TEMP_DIR) == []
+
+
+def test_interruption_inside_file_header_is_resumed(context, http_server, monkeypatch):
+    handler, seen = make_handler(first_bytes=sync.SNIFF_SIZE // 2)
+    path = download(context, http_server, monkeypatch, handler)
+
+    # 文件头没读完就断开：以前直接失败，现在同样续传
+    assert path and read_and_remove(path) == BODY
+    assert len(seen) == 2
+
+
+def test_gives_up_after_resume_attempts(context, http_server, monkeypatch):
+    # 第一次读到一个完整分块后断开，之后每次续传都在分块内断开，没有进展
+    handler, seen = make_handler(first_bytes=sync.DOWNLOAD_CHUNK_SIZE + 100, range_bytes=100)
+
+    assert download(context, http_server, monkeypatch, handler) is None
+    assert seen[1:] == [f'bytes={sync.DOWNLOAD_CHUNK_SIZE}-'] * sync.DOWNLOAD_RESUME_ATTEMPTS
+    assert os.listdir(sync.TEMP_DIR) == []
@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from conftest import DTABLE_UUID, FakeManager, sync
+
+ASSET_ROOT = f'https://cloud.seatable.io/workspace/1/asset/{DTABLE_UUID}/images'
+BODY = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 1024
+
+
+class FaultyHost(BaseHTTPRequestHandler):
+    """资源下载（GET /files/名称）和图床上传（POST /upload），按方法依次取出预定的故障"""
+    protocol_version = 'HTTP/1.1'
+    schedule = {}  # 方法 -> 故障列表，取完后正常响应
+    seen = []  # (方法, 故障)
+    bytes_sent = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _next_fault(self, method):
+        with self.lock:
+            faults = self.schedule.get(method)
+            fault = faults.pop(0) if faults else None
+            self.seen.append((method, fault))
+        return fault
+
+    def _send(self, status, body, fault=None, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if fault == 'truncate':
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        if fault == 'drip':
+            step = len(body) // 8 + 1
+            for offset in range(0, len(body), step):
+                self.wfile.write(body[offset:offset + step])
+                self.wfile.flush()
+                time.sleep(0.05)
+        else:
+            self.wfile.write(body)
+        with self.lock:
+            FaultyHost.bytes_sent += len(body)
+
+    def _begin(self, method):
+        """注入断连和限流，返回 (故障, 是否已处理完毕)"""
+        fault = self._next_fault(method)
+        if fault == 'reset':
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return fault, True
+        if fault == '429':
+            self._send(429, b'{}', headers={'Retry-After': '1'})
+            return fault, True
+        return fault, False
+
+    def do_GET(self):
+        fault, handled = self._begin('GET')
+        if handled:
+            return
+        start = int(self.headers.get('Range', 'bytes=0-')[len('bytes='):].rstrip('-'))
+        headers = {'Content-Type': 'image/png'}
+        if start:
+            headers['Content-Range'] = f'bytes {start}-{len(BODY) - 1}/{len(BODY)}'
+        self._send(206 if start else 200, BODY[start:], fault, headers)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        fault, handled = self._begin('POST')
+        if handled:
+            return
+        with self.lock:
+            number = sum(1 for method, fault in self.seen if method == 'POST' and fault is None)
+        self._send(200, json.dumps({'url': f'https://bed.example/{number}.png'}).encode(), fault)
+
+
+@pytest.fixture
+def host(http_server, config, monkeypatch):
+    """按故障计划响应的下载和图床服务，返回设置故障计划的函数"""
+    FaultyHost.seen = []
+    FaultyHost.bytes_sent = 0
+    root = http_server(FaultyHost)
+    config.config['image_bed']['upload_api'] = f'{root}/upload'
+    monkeypatch.setattr(FakeManager, '_get_download_link',
+                        lambda self, image_url: f"{root}/files/{os.path.basename(image_url)}")
+
+    def schedule(get=(), post=()):
+        FaultyHost.schedule = {'GET': list(get), 'POST': list(post)}
+    schedule()
+    return schedule
+
+
+@pytest.fixture
+def manager(context, host):
+    manager = context.create_manager('token', '示例')
+    yield manager
+    manager.close()
+
+
+def faults_seen(method):
+    return [fault for seen_method, fault in FaultyHost.seen if seen_method == method]
+
+
+def test_throttle_burst_on_upload_backs_off_and_succeeds(manager, host):
+    host(post=['429', '429'])
+    throttled = manager.concurrency.upload.snapshot()['throttled']
+    assert manager.process_image(f'{ASSET_ROOT}/a.png') == 'https://bed.example/1.png'
+    assert faults_seen('POST') == ['429', '429', None]
+    assert manager.concurrency.upload.snapshot()['throttled'] > throttled  # 限流时降低上传并发
+
+
+@pytest.mark.parametrize('fault,requests', [
+    ('reset', 2),  # 未收到响应就断开：传输层重试
+    ('429', 2),  # 下载限流：传输层按 Retry-After 重试
+    ('truncate', 2),  # 内容截断：按Range续传剩余部分
+    ('drip', 1),  # 慢速发送但未超时：正常完成
+])
+def test_download_faults_recover(manager, host, fault, requests):
+    host(get=[fault])
+    path = manager._download_image(f'{ASSET_ROOT}/a.png')
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+    os.unlink(path)
+    assert faults_seen('GET') == [fault] + [None] * (requests - 1)
+
+
+def test_scheduled_faults_converge_with_bounded_waste(context, manager, host, base):
+    rows = 8
+    base.tables['素材'] = [{'_id': f'r{i}', '图片': [f'{ASSET_ROOT}/{i}.png']} for i in range(rows)]
+    host(get=['reset', 'truncate', '429', 'drip', 'truncate'], post=['429', 'reset'])
+
+    start = time.monotonic()
+    manager.process_tables(['素材'], max_workers=1)
+    assert time.monotonic() - start < 30
+
+    assert all(row['图片'][0].startswith('https://bed.example/') for row in base.tables['素材'])
+    assert (manager.processing_logs['success_count'], manager.processing_logs['failure_count']) == (rows, 0)
+    assert context.image_history.get_failed_records() == []
+    # 截断的响应从已收到的完整分块处续传，每次截断最多浪费一个分块
+    truncations = faults_seen('GET').count('truncate')
+    assert FaultyHost.bytes_sent - rows * len(BODY) <= truncations * sync.DOWNLOAD_CHUNK_SIZE
@@ -0,0 +1,83 @@
+import time
+
+from conftest import sync
+
+
+def synced_manager(context, base):
+    """完整处理一次base并保存指纹，返回 (管理器, 元数据)"""
+    base.tables['素材'] = [{'_id': 'r1', '_mtime': '2024-01-01T00:00:00'}]
+    manager = context.create_manager('token', '示例')
+    metadata = base.get_metadata()
+    context.mark_base_synced(manager, metadata)
+    context.save_fingerprints([])
+    return manager, metadata
+
+
+def test_unchanged_base_is_skipped(context, base):
+    manager, metadata = synced_manager(context, base)
+    assert context.is_base_unchanged(manager, metadata)
+
+
+def test_new_row_invalidates_fingerprint(context, base):
+    manager, metadata = synced_manager(context, base)
+    base.tables['素材'].append({'_id': 'r2', '_mtime': '2024-01-01T00:00:00'})
+    assert not context.is_base_unchanged(manager, metadata)
+
+
+def test_edited_row_invalidates_fingerprint(context, base):
+    manager, metadata = synced_manager(context, base)
+    base.tables['素材'][0]['_mtime'] = '2024-01-02T00:00:00'
+    assert not context.is_base_unchanged(manager, metadata)
+
+
+def test_full_audit_and_audit_interval_force_check(context, base, monkeypatch):
+    manager, metadata = synced_manager(context, base)
+    context.scope.full_audit = True
+    assert not context.is_base_unchanged(manager, metadata)
+
+    context.scope.full_audit = False
+    audited_at = time.time()
+    monkeypatch.setattr(sync.time, 'time', lambda: audited_at + context.audit_seconds + 1)
+    assert not context.is_base_unchanged(manager, metadata)
+
+
+def test_fingerprint_not_saved_for_base_with_failures(context, base):
+    base.tables['素材'] = [{'_id': 'r1', '_mtime': '2024-01-01T00:00:00'}]
+    manager = context.create_manager('token', '示例')
+    metadata = base.get_metadata()
+    context.mark_base_synced(manager, metadata)
+    context.save_fingerprints([{'base_name': '示例', 'url': 'u'}])
+    assert not context.is_base_unchanged(manager, metadata)
+
+
+def test_scoped_run_does_not_record_fingerprint(context, base):
+    context.scope.tables = ['素材']
+    base.tables['素材'] = [{'_id': 'r1', '_mtime': '2024-01-01T00:00:00'}]
+    manager = context.create_manager('token', '示例')
+    context.mark_base_synced(manager, base.get_metadata())
+    assert context.pending_fingerprints == {}
+
+
+def test_fingerprint_covers_only_tables_with_image_columns(context, base):
+    base.tables['素材'] = [{'_id': 'r1', '_mtime': '2024-01-01T00:00:00'}]
+    manager = context.create_manager('token', '示例')
+    fingerprint = manager.schema_fingerprint(base.get_metadata())
+    base.image_columns = []  # 没有图片列的表格不查询、不计入指纹
+    assert manager.schema_fingerprint(base.get_metadata()) != fingerprint
+    assert manager.schema_fingerprint(base.get_metadata()) == manager.schema_fingerprint({'tables': []})
+
+
+def test_query_failure_falls_back_to_full_check(context, base, monkeypatch):
+    manager = context.create_manager('token', '示例')
+    monkeypatch.setattr(type(base), 'query', lambda *args, **kwargs: 1 / 0)
+    assert manager.schema_fingerprint(base.get_metadata()) is None
+
+
+def test_fingerprint_costs_one_query_per_image_table(context, base, monkeypatch):
+    base.tables.update({'素材': [], '商品': [], '订单': []})
+    manager = context.create_manager('token', '示例')
+    queries = []
+    query = type(base).query
+    monkeypatch.setattr(type(base), 'query', lambda self, sql, **kwargs: queries.append(sql) or query(self, sql, **kwargs))
+    manager.schema_fingerprint(base.get_metadata())
+    assert len(queries) == 3
@@ -0,0 +1,52 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import sync
+
+
+def test_concurrent_transfers_of_same_url_run_once():
+    registry = sync.InFlightRegistry()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def transfer():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'https://bed/x.png'
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(registry.run, 'u', transfer)
+        assert started.wait(2)
+        followers = [executor.submit(registry.run, 'u', transfer) for _ in range(3)]
+        assert registry.active_count == 1
+        time.sleep(0.2)  # 等其它请求进入等待
+        release.set()
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert len(calls) == 1
+    assert results[0] == ('https://bed/x.png', False)
+    assert results[1:] == [('https://bed/x.png', True)] * 3
+    assert registry.active_count == 0
+
+
+def test_failed_transfer_releases_waiters_and_allows_retry():
+    registry = sync.InFlightRegistry()
+
+    def fail():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        registry.run('u', fail)
+    assert registry.active_count == 0
+    assert registry.run('u', lambda: 'ok') == ('ok', False)
+
+
+def test_different_urls_do_not_share():
+    registry = sync.InFlightRegistry()
+    assert registry.run('a', lambda: 'A') == ('A', False)
+    assert registry.run('b', lambda: 'B') == ('B', False)
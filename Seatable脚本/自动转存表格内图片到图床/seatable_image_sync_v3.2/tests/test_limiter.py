@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from conftest import sync
+
+
+def test_limiter_increases_additively_when_healthy():
+    limiter = sync.AdaptiveLimiter('测试', 2, 1, 4, latency_target=1.0)
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(0.01)
+    assert limiter.limit == 4  # 不超过上限
+
+
+def test_limiter_halves_on_throttle_once_per_cooldown():
+    limiter = sync.AdaptiveLimiter('测试', 8, 1, 12, latency_target=100.0, cooldown=0.0)
+    limiter.on_throttle(429)
+    limiter.cooldown = 60.0
+    limiter.on_throttle(503)  # 冷却时间内不再减半
+    assert limiter.limit == 4
+    assert limiter.snapshot()['throttled'] == 2
+
+    limiter.cooldown = 0.0
+    for _ in range(5):
+        limiter.on_throttle(503)
+    assert limiter.limit == 1  # 不低于下限
+
+
+def test_limiter_does_not_grow_when_latency_misses_target():
+    limiter = sync.AdaptiveLimiter('测试', 2, 1, 8, latency_target=0.5)
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(2.0)
+    assert limiter.limit < 4
+
+
+def test_limiter_blocks_acquire_at_limit():
+    limiter = sync.AdaptiveLimiter('测试', 1, 1, 1, latency_target=1.0)
+    limiter.acquire()
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+    waiter.start()
+
+    assert not acquired.wait(0.2)
+    limiter.release(0.01)
+    assert acquired.wait(2)
+    waiter.join()
+    assert limiter.snapshot()['peak'] == 1
+
+
+def test_slot_reports_throttle_status_and_errors():
+    limiter = sync.AdaptiveLimiter('测试', 4, 1, 8, latency_target=1.0, cooldown=0.0)
+    with limiter.slot() as outcome:
+        outcome['status'] = 429
+    assert limiter.limit == 2
+
+    with pytest.raises(ValueError):
+        with limiter.slot():
+            raise ValueError('boom')
+    snapshot = limiter.snapshot()
+    assert snapshot['errors'] == 1
+    assert snapshot['in_flight'] == 0
@@ -0,0 +1,59 @@
+import pytest
+
+from conftest import sync
+
+
+def history_with_records():
+    history = sync.ImageHistory()
+    history.set_content('https://a/1.png', 'hash1', 100)
+    history.add_success_record('https://a/1.png', 'https://bed/1.png', '示例', '素材', '图片')
+    history.add_success_record('https://a/2.png', 'https://bed/2.png', '示例', '素材', '图片')
+    history.add_failed_record('https://a/3.png', 'boom', '示例', '素材', 'r3')
+    return history
+
+
+@pytest.mark.parametrize('name', ['mapping.csv', 'mapping.jsonl'])
+def test_mapping_round_trip(tmp_path, name):
+    path = str(tmp_path / name)
+    assert history_with_records().export_mapping(path) == 2  # 失败记录不导出
+
+    imported = sync.ImageHistory()
+    assert imported.import_mapping(path) == 2
+    assert imported.get_record('https://a/1.png') == 'https://bed/1.png'
+    assert imported.get_record('https://a/3.png') is None
+    assert imported.current_records['https://a/1.png']['content_hash'] == 'hash1'
+    assert imported.current_records['https://a/1.png']['size'] == 100
+
+
+def test_import_does_not_override_existing_records(tmp_path):
+    path = str(tmp_path / 'mapping.jsonl')
+    history_with_records().export_mapping(path)
+    history = sync.ImageHistory()
+    history.add_success_record('https://a/1.png', 'https://bed/newer.png')
+
+    assert history.import_mapping(path) == 1
+    assert history.get_record('https://a/1.png') == 'https://bed/newer.png'
+
+
+def test_context_imports_configured_mappings(config, tmp_path):
+    path = str(tmp_path / 'mapping.csv')
+    history_with_records().export_mapping(path)
+    config.config['mapping']['import'] = [path, str(tmp_path / 'missing.csv')]
+
+    context = sync.SyncContext(config)
+    assert context.image_history.get_record('https://a/2.png') == 'https://bed/2.png'
+
+
+def test_malformed_lines_are_skipped(tmp_path):
+    path = tmp_path / 'mapping.jsonl'
+    history_with_records().export_mapping(str(path))
+    lines = path.read_text(encoding='utf-8').splitlines()
+    path.write_text('\n'.join([lines[0], '{"original_url": "https://a/x.png", "new_u', '[1, 2]',
+                               '{"original_url": "https://a/y.png", "new_url": "https://bed/y.png", "size": "big"}',
+                               lines[1]]) + '\n', encoding='utf-8')
+
+    history = sync.ImageHistory()
+    assert history.import_mapping(str(path)) == 2
+    assert history.get_record('https://a/1.png') == 'https://bed/1.png'
+    assert history.get_record('https://a/2.png') == 'https://bed/2.png'
+    assert history.get_record('https://a/y.png') is None
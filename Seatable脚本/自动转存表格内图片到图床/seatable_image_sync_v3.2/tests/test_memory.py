@@ -0,0 +1,47 @@
+import tracemalloc
+
+import pytest
+
+from conftest import sync
+
+
+@pytest.fixture(autouse=True)
+def stop_tracing():
+    yield
+    tracemalloc.stop()
+
+
+def test_tracer_records_snapshots_and_growth():
+    tracer = sync.MemoryTracer(top=5)
+    tracer.start()
+    assert tracemalloc.is_tracing()
+    tracer.snapshot('Base 示例')
+    held = [bytearray(1024) for _ in range(200)]  # 两次快照之间新增约200KB
+    tracer.snapshot('主处理完成')
+    tracer.stop()
+    assert not tracemalloc.is_tracing()
+
+    assert [phase['label'] for phase in tracer.phases] == ['Base 示例', '主处理完成']
+    assert tracer.phases[0]['growth'] == []
+    assert any('test_memory.py' in line for line in tracer.phases[1]['growth'])
+    report = tracer.format_report()
+    assert '[主处理完成]' in report and '分配最多的位置' in report
+    assert len(held) == 200
+
+
+def test_tracer_is_noop_without_tracing():
+    tracer = sync.MemoryTracer()
+    tracer.snapshot('主处理完成')
+    tracer.stop()
+    assert tracer.phases == []
+    assert tracer.format_report() == ''
+
+
+@pytest.mark.parametrize('trace_memory', [False, True])
+def test_sync_starts_and_stops_tracing_only_when_enabled(monkeypatch, trace_memory):
+    seen = []
+    monkeypatch.setattr(sync, 'main', lambda config, scope, tracer: seen.append((tracer, tracemalloc.is_tracing())))
+    sync.run_sync(None, None, trace_memory=trace_memory)
+    tracer, tracing = seen[0]
+    assert (tracer is not None, tracing) == (trace_memory, trace_memory)
+    assert not tracemalloc.is_tracing()
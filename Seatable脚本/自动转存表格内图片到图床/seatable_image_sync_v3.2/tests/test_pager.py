@@ -0,0 +1,68 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import sync
+
+
+class PagedClient:
+    """按 start/limit 分页返回行，记录每次请求的起始位置"""
+    def __init__(self, total, delay=0.0, fail_at=None):
+        self.rows = [{'_id': f'r{i}'} for i in range(total)]
+        self.delay = delay
+        self.fail_at = fail_at
+        self.starts = []
+
+    def list_rows(self, table_name, start=0, limit=100):
+        self.starts.append(start)
+        if start == self.fail_at:
+            raise RuntimeError('list_rows failed')
+        time.sleep(self.delay)
+        return self.rows[start:start + limit]
+
+
+def pager(client, **kwargs):
+    return sync.RowPager(SimpleNamespace(base_name='示例', client=client), '素材', **kwargs)
+
+
+def test_pager_yields_every_page_in_order():
+    client = PagedClient(25)
+    with pager(client, page_size=10, lookahead=2) as pages:
+        ids = [row['_id'] for page in pages for row in page]
+    assert ids == [f'r{i}' for i in range(25)]
+    assert client.starts == [0, 10, 20]
+
+
+def test_pager_reads_ahead_at_most_lookahead_pages():
+    client = PagedClient(100)
+    with pager(client, page_size=10, lookahead=2):
+        time.sleep(0.3)  # 不消费，预读线程最多放满队列后再多读一页等待放入
+        assert len(client.starts) == 3
+
+
+def test_pager_overlaps_fetching_with_processing():
+    client = PagedClient(40, delay=0.1)
+    started = time.monotonic()
+    with pager(client, page_size=10, lookahead=2) as pages:
+        for _ in pages:
+            time.sleep(0.1)  # 模拟处理一页图片
+    # 串行需要约 0.8 秒（4 页读取 + 4 页处理），预读时读取与处理重叠
+    assert time.monotonic() - started < 0.7
+
+
+def test_pager_raises_fetch_errors_in_consumer():
+    client = PagedClient(30, fail_at=10)
+    with pytest.raises(RuntimeError):
+        with pager(client, page_size=10) as pages:
+            for _ in pages:
+                pass
+
+
+def test_closing_early_stops_background_fetch():
+    client = PagedClient(1000)
+    with pager(client, page_size=10, lookahead=1) as pages:
+        next(iter(pages))
+    fetched = len(client.starts)
+    time.sleep(0.2)
+    assert len(client.starts) == fetched < 100
@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+
+import pytest
+
+from conftest import sync
+
+STAGES = ['list_rows', 'download_file', 'upload', 'update_row', 'report']
+
+
+@pytest.fixture
+def run_metrics(monkeypatch):
+    run_metrics = sync.RunMetrics()
+    monkeypatch.setattr(sync, 'metrics', run_metrics)
+    return run_metrics
+
+
+def busy(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def job(run_metrics):
+    """依次经过每个阶段的短任务"""
+    for stage in STAGES:
+        with run_metrics.stage('示例', stage):
+            busy(0.05)
+
+
+def test_profile_writes_collapsed_stacks_and_per_thread_files(run_metrics, tmp_path):
+    profiler = sync.SamplingProfiler(interval=0.002, output_dir=str(tmp_path / 'profiles'))
+    profiler.start()
+    worker = threading.Thread(target=job, args=(run_metrics,), name='sync-worker')
+    worker.start()
+    worker.join()
+    run_dir = profiler.stop()
+
+    assert os.path.dirname(run_dir) == str(tmp_path / 'profiles')
+    with open(os.path.join(run_dir, 'collapsed.txt')) as f:
+        lines = f.read().splitlines()
+    worker_lines = [line for line in lines if line.startswith('sync-worker;')]
+    for stage in STAGES:
+        assert any(f';stage:{stage};' in line for line in worker_lines), stage
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)  # 折叠栈格式：栈 采样数
+
+    files = sorted(os.listdir(run_dir))
+    assert 'thread-sync-worker.txt' in files
+    with open(os.path.join(run_dir, 'thread-sync-worker.txt')) as f:
+        report = f.read()
+    assert all(stage in report for stage in STAGES)
+    assert set(STAGES) <= set(profiler.stage_summary())
+
+
+def test_profile_output_sits_next_to_the_stats_file():
+    assert os.path.dirname(sync.PROFILE_DIR) == os.path.dirname(sync.RUNS_DB)
+
+
+def test_profile_without_samples_writes_nothing(tmp_path):
+    profiler = sync.SamplingProfiler(interval=10, output_dir=str(tmp_path / 'profiles'))
+    profiler.start()
+    assert profiler.stop() is None
+    assert not os.path.exists(tmp_path / 'profiles')
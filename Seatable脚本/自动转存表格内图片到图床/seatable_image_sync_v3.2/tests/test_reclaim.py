@@ -0,0 +1,180 @@
+import json
+import os
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from conftest import DTABLE_UUID, FakeManager, sync
+
+ASSET_ROOT = f'https://cloud.seatable.io/workspace/1/asset/{DTABLE_UUID}/images'
+
+
+class FakeVerifier:
+    """除 bad 链接外全部视为可用，记录是否强制校验"""
+    def __init__(self):
+        self.calls = []
+
+    def verify_all(self, urls, force=False):
+        self.calls.append((sorted(urls), force))
+        return {url: 'bad' not in url for url in urls}
+
+
+@pytest.fixture
+def reclaimer(tmp_path, monkeypatch):
+    monkeypatch.setattr(sync.time, 'sleep', lambda seconds: None)
+    return sync.AssetReclaimer(FakeVerifier(), batch_size=2, batch_delay=5.0, undo_file=str(tmp_path / 'undo.jsonl'))
+
+
+@pytest.fixture
+def deleted(monkeypatch):
+    """记录删除调用的路径，路径含 locked 时删除失败"""
+    deleted = []
+
+    def delete_asset(self, path):
+        deleted.append(path)
+        return 'locked' not in path
+    monkeypatch.setattr(FakeManager, 'delete_asset', delete_asset)
+    return deleted
+
+
+@pytest.fixture
+def manager(context, base):
+    base.tables['素材'] = [
+        {'_id': 'r1', '图片': ['https://bed/a.png']},
+        {'_id': 'r2', '图片': ['https://bed/c.png'], '备注': f'见 {ASSET_ROOT}/c.png'},  # 处理范围外的列仍在引用
+    ]
+    return context.create_manager('token', 'demo')
+
+
+def undo_lines(reclaimer):
+    if not os.path.exists(reclaimer.undo_file):
+        return []
+    with open(reclaimer.undo_file, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def add_assets(reclaimer, manager, *names):
+    for name in names:
+        reclaimer.add(manager, f'{ASSET_ROOT}/{name}.png', f'https://bed/{name}.png', '素材', 'r1', '图片')
+
+
+def test_only_fully_replaced_and_verified_assets_are_deleted(reclaimer, manager, base, deleted):
+    add_assets(reclaimer, manager, 'a', 'bad', 'c', 'd', 'e')
+    reclaimer.block(f'{ASSET_ROOT}/d.png')  # 另一行回写失败
+    reclaimer.add(manager, 'https://other.site/x.png', 'https://bed/x.png', '素材', 'r1', '图片')  # 不属于base的素材
+    reclaimer.allow(manager, base.get_metadata())
+
+    reclaimer.run(failed_urls={f'{ASSET_ROOT}/e.png'})
+    assert deleted == ['images/a.png']
+    assert (reclaimer.deleted, reclaimer.failed, reclaimer.unverified) == (1, 0, 1)
+    assert reclaimer.verifier.calls == [(['https://bed/a.png', 'https://bed/bad.png'], True)]
+    assert [(line['path'], line['action']) for line in undo_lines(reclaimer)] == [('images/a.png', 'delete')]
+
+
+def test_undo_is_written_before_each_batch_is_deleted(reclaimer, manager, base, monkeypatch):
+    add_assets(reclaimer, manager, 'a', 'b', 'd', 'e', 'f')
+    reclaimer.allow(manager, base.get_metadata())
+    seen = []  # 每次删除时撤销文件中已有的路径
+    monkeypatch.setattr(FakeManager, 'delete_asset',
+                        lambda self, path: seen.append((path, [line['path'] for line in undo_lines(reclaimer)])) or True)
+    sleeps = []
+    monkeypatch.setattr(sync.time, 'sleep', sleeps.append)
+
+    reclaimer.run(failed_urls=set())
+    assert seen == [
+        ('images/a.png', ['images/a.png', 'images/b.png']),
+        ('images/b.png', ['images/a.png', 'images/b.png']),
+        ('images/d.png', ['images/a.png', 'images/b.png', 'images/d.png', 'images/e.png']),
+        ('images/e.png', ['images/a.png', 'images/b.png', 'images/d.png', 'images/e.png']),
+        ('images/f.png', ['images/a.png', 'images/b.png', 'images/d.png', 'images/e.png', 'images/f.png']),
+    ]
+    assert sleeps == [5.0, 5.0]  # 批次之间限速
+    assert len(reclaimer.verifier.calls) == 3
+    line = undo_lines(reclaimer)[0]
+    assert (line['original_url'], line['new_url'], line['row_id']) == (f'{ASSET_ROOT}/a.png', 'https://bed/a.png', 'r1')
+
+
+def test_failed_delete_is_recorded_as_kept(reclaimer, manager, base, deleted):
+    add_assets(reclaimer, manager, 'a', 'locked')
+    reclaimer.allow(manager, base.get_metadata())
+
+    reclaimer.run(failed_urls=set())
+    assert deleted == ['images/a.png', 'images/locked.png']
+    assert (reclaimer.deleted, reclaimer.failed) == (1, 1)
+    assert [(line['path'], line['action']) for line in undo_lines(reclaimer)][-1] == ('images/locked.png', 'kept')
+
+
+def test_exhausted_budget_stops_reclaiming(reclaimer, manager, base, deleted, monkeypatch):
+    add_assets(reclaimer, manager, 'a', 'b', 'd')
+    reclaimer.allow(manager, base.get_metadata())
+    monkeypatch.setattr(FakeManager, 'out_of_budget', lambda self: len(deleted) >= 1)
+
+    reclaimer.run(failed_urls=set())
+    assert deleted == ['images/a.png']
+    assert [(line['path'], line['action']) for line in undo_lines(reclaimer)] == [
+        ('images/a.png', 'delete'), ('images/b.png', 'delete'), ('images/b.png', 'kept')]
+
+
+def test_nothing_is_deleted_for_bases_not_fully_processed(reclaimer, manager, deleted):
+    add_assets(reclaimer, manager, 'a')
+    reclaimer.run(failed_urls=set())
+    assert deleted == []
+    assert reclaimer.verifier.calls == []
+
+
+def test_failed_row_write_blocks_asset(reclaimer, manager, base, deleted):
+    update = sync.RowUpdate(manager, '素材', '图片', 'r1', 'r1', [f'{ASSET_ROOT}/a.png'])
+    update.new_images = ['https://bed/a.png']
+    reclaimer.note_row(update, committed=False)
+    reclaimer.add(manager, f'{ASSET_ROOT}/a.png', 'https://bed/a.png', '素材', 'r2', '图片')
+    reclaimer.allow(manager, base.get_metadata())
+
+    reclaimer.run(failed_urls=set())
+    assert deleted == []
+
+
+class AssetApi(BaseHTTPRequestHandler):
+    """素材删除接口：按 statuses 依次返回状态码，记录请求"""
+    statuses = []
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_DELETE(self):
+        query = parse_qs(urlparse(self.path).query)
+        AssetApi.requests.append((urlparse(self.path).path, query['path'][0], self.headers['Authorization']))
+        status = AssetApi.statuses.pop(0)
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+
+@pytest.mark.parametrize('statuses,result', [
+    ([200], True),
+    ([404], True),  # 已不存在
+    ([429, 200], True),  # 限流后重试
+    ([403], False),
+    ([503, 503, 503], False),
+])
+def test_delete_asset_calls_api_with_token(context, base, http_server, monkeypatch, statuses, result):
+    monkeypatch.setattr(sync.time, 'sleep', lambda seconds: None)
+    base.server_url = http_server(AssetApi)
+    AssetApi.statuses = list(statuses)
+    AssetApi.requests = []
+    manager = context.create_manager('token', 'demo')
+
+    assert manager.delete_asset('images/a b.png') is result
+    assert AssetApi.requests == [(sync.ASSET_DELETE_API, '/images/a b.png', 'Token token')] * len(statuses)
+    assert context.api_quota.calls[manager.base_key]['delete_asset'] == len(statuses)  # 计入API配额
+
+
+def test_reclaimer_is_opt_in(config):
+    assert sync.create_asset_reclaimer(config, None) is None
+    config.config['reclaim']['enabled'] = True
+    reclaimer = sync.create_asset_reclaimer(config, None)
+    assert isinstance(reclaimer.verifier, sync.UploadVerifier)  # 未开启校验时单独建一个，删除前必须校验
@@ -0,0 +1,67 @@
+import json
+import os
+
+from conftest import sync
+
+
+def touch(path, mtime):
+    with open(path, 'w') as f:
+        f.write('{}\n')
+    os.utime(path, (mtime, mtime))
+
+
+def test_report_rotates_by_size(tmp_path):
+    writer = sync.ReportWriter(str(tmp_path), keep=5, max_bytes=200)
+    for i in range(20):
+        writer.write('success', {'url': f'https://example.com/{i}.png', 'new_url': 'https://bed/x.png'})
+    writer.close()
+
+    names = sorted(os.listdir(tmp_path))
+    assert len(names) > 1
+    assert all(sync.REPORT_NAME_PATTERN.match(name).group(1) == writer.stamp for name in names)
+    lines = []
+    for name in names:
+        with open(tmp_path / name, encoding='utf-8') as f:
+            lines += [json.loads(line) for line in f]
+    assert len(lines) == writer.records == 20
+    assert lines[0]['type'] == 'success'
+
+
+def test_report_keeps_newest_runs_whole(tmp_path):
+    # 文件名时间较晚但修改时间较早的运行先被清理，同一运行的拆分文件一起保留
+    touch(tmp_path / 'seatable_image_sync_20200101_000000.jsonl', 3000)
+    touch(tmp_path / 'seatable_image_sync_20200101_000000.1.jsonl', 3000)
+    touch(tmp_path / 'seatable_image_sync_20990101_000000.jsonl', 1000)
+    touch(tmp_path / 'seatable_image_sync_20100101_000000.jsonl', 2000)
+    touch(tmp_path / 'notes.jsonl', 0)
+
+    writer = sync.ReportWriter(str(tmp_path), keep=2)
+    writer.write('failure', {'url': 'u'})
+    writer.close()
+
+    assert sorted(os.listdir(tmp_path)) == sorted([
+        'notes.jsonl',
+        'seatable_image_sync_20200101_000000.jsonl',
+        'seatable_image_sync_20200101_000000.1.jsonl',
+        os.path.basename(writer.path),
+    ])
+
+
+def test_report_is_not_created_without_records(tmp_path):
+    writer = sync.ReportWriter(str(tmp_path / 'reports'))
+    writer.close()
+    assert not os.path.exists(tmp_path / 'reports')
+
+
+def test_manager_streams_results_into_report(context):
+    manager = context.create_manager('token', 'demo')
+    manager._log_success(sync.ImageTask('https://a/1.png', '素材', '图片', 'r1', 'demo'), 'https://bed/1.png')
+    manager._log_failure(sync.ImageTask('https://a/2.png', '素材', '图片', 'r2', 'demo'), '下载失败: 404')
+
+    # 每条记录立即落盘，运行中断也不会丢失
+    with open(context.report_writer.path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert [(record['type'], record['original_url']) for record in records] == [
+        ('success', 'https://a/1.png'), ('failure', 'https://a/2.png')]
+    assert records[1]['error'] == '下载失败: 404'
+    context.report_writer.close()
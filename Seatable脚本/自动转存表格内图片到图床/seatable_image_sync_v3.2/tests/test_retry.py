@@ -0,0 +1,45 @@
+import pytest
+
+from conftest import sync
+
+
+def record(base_name, url):
+    return {'url': url, 'error': 'x', 'base_name': base_name, 'table_name': '素材', 'row_id': 'r1',
+            'column_name': '图片'}
+
+
+@pytest.fixture
+def retried(monkeypatch):
+    """记录各管理器重试的URL，全部视为成功"""
+    calls = []
+
+    def retry_failed_images(self, records):
+        calls.append((self.base_name, [item['url'] for item in records]))
+        return {'total': len(records), 'success': len(records), 'failed': 0}
+
+    monkeypatch.setattr(sync.SeaTableManager, 'retry_failed_images', retry_failed_images)
+    return calls
+
+
+def test_retry_reuses_connected_managers(context, retried, monkeypatch):
+    manager = context.create_manager('token', '示例')
+    monkeypatch.setattr(context, 'create_manager', lambda *args: pytest.fail('不应重新连接'))
+
+    totals = sync.run_retry(context, [record('示例', 'a'), record('示例', 'b')], {'示例': manager})
+    assert totals == {'total': 2, 'success': 2, 'failed': 0}
+    assert retried == [('示例', ['a', 'b'])]
+
+
+def test_retry_connects_other_bases_and_skips_unknown(context, retried):
+    context.base_tokens['其它'] = 'token'
+    totals = sync.run_retry(context, [record('其它', 'a'), record('未配置', 'b')], {})
+    assert totals == {'total': 2, 'success': 1, 'failed': 1}
+    assert retried == [('其它', ['a'])]
+
+
+def test_failed_base_names():
+    history = sync.ImageHistory()
+    history.add_failed_record('u1', 'x', base_name='甲')
+    history.add_failed_record('u2', 'x', base_name='甲')
+    history.add_failed_record('u3', 'x', base_name='乙')
+    assert history.failed_base_names() == {'甲', '乙'}
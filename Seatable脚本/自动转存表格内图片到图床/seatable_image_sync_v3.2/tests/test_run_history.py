@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from conftest import sync
+
+
+@pytest.fixture
+def store(tmp_path):
+    return sync.RunHistoryStore(str(tmp_path / 'runs.db'))
+
+
+def run_metrics(**bases):
+    """按base名称 -> (成功数, 下载字节, API调用) 构造运行指标"""
+    run_metrics = sync.RunMetrics()
+    for base_name, (success, bytes_down, api_calls) in bases.items():
+        for _ in range(success):
+            run_metrics.add_image(base_name, True)
+        run_metrics.add_bytes(base_name, down=bytes_down)
+        for _ in range(api_calls):
+            run_metrics.add_api_call(base_name)
+        with run_metrics.stage(base_name, 'download_file'):
+            pass
+    return run_metrics
+
+
+def record(store, success, duration, **bases):
+    return store.record_run(1700000000, duration, {'images': success, 'success': success, 'failed': 0},
+                            run_metrics(**bases) if bases else sync.RunMetrics())
+
+
+def test_record_and_read_back(store):
+    run_id = record(store, 10, 5.0, 商品=(6, 600, 3), 素材=(4, 400, 2))
+    run = store.recent_runs(1)[0]
+    assert run['id'] == run_id
+    assert (run['images'], run['success'], run['duration']) == (10, 10, 5.0)
+    assert run['images_per_sec'] == 2.0
+    assert (run['bytes_down'], run['api_calls']) == (1000, 5)
+    assert 'download_file' in json.loads(run['stage_times'])
+
+    bases = store.run_bases(run_id)
+    assert [(base['base_name'], base['success'], base['bytes_down'], base['api_calls']) for base in bases] == [
+        ('商品', 6, 600, 3), ('素材', 4, 400, 2)]
+
+
+def test_recent_runs_are_newest_first(store):
+    ids = [record(store, 10, duration) for duration in (10.0, 20.0, 40.0)]
+    assert [run['id'] for run in store.recent_runs(2)] == ids[:0:-1]
+    assert [run['images_per_sec'] for run in store.recent_runs()] == [0.25, 0.5, 1.0]
+
+
+def test_baseline_needs_three_runs_with_migrations(store):
+    record(store, 10, 10.0)
+    record(store, 0, 10.0)  # 没有迁移的运行不计入基线
+    record(store, 10, 10.0)
+    last = record(store, 10, 10.0)
+    assert store.baseline(last) is None
+    assert store.baseline(last + 1) == 1.0
+
+
+@pytest.mark.parametrize('duration,flagged', [(25.0, True), (15.0, False)])
+def test_regression_against_threshold(store, duration, flagged):
+    for _ in range(3):
+        record(store, 10, 10.0)  # 基线 1 张/秒
+    record(store, 10, duration)
+    warning = store.check_regression(store.recent_runs(1)[0], threshold=0.5)
+    assert bool(warning) is flagged
+    assert ('⚠️' in store.format_trends()) is flagged
+
+
+def test_run_without_migrations_is_never_flagged(store):
+    for _ in range(3):
+        record(store, 10, 10.0)
+    record(store, 0, 100.0)
+    assert store.check_regression(store.recent_runs(1)[0]) is None
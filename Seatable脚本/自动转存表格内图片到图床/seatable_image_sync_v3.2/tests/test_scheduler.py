@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import deque
+
+from conftest import sync
+
+
+def task(url, lane=sync.LANE_BACKFILL, cost=0, callback=None):
+    return sync.ImageTask(url, '表', '图片', 'row', 'base', lane=lane, cost=cost, callback=callback)
+
+
+def test_queue_serves_lanes_by_priority_then_cost():
+    queue = sync.TaskQueue()
+    queue.put(task('backfill-big', cost=9))
+    queue.put(task('backfill-small', cost=1))
+    queue.put(task('retry', lane=sync.LANE_RETRY, cost=100))
+    queue.put(task('fresh', lane=sync.LANE_FRESH, cost=1000))
+    queue.put(task('backfill-small-later', cost=1))
+
+    order = [queue.get(timeout=0).url for _ in range(5)]
+    assert order == ['fresh', 'retry', 'backfill-small', 'backfill-small-later', 'backfill-big']
+    assert queue.get(timeout=0) is None
+
+
+def test_full_lane_blocks_producer_until_consumed():
+    queue = sync.TaskQueue(max_size=1)
+    queue.put(task('first'))
+    queue.put(task('other-lane', lane=sync.LANE_FRESH))  # 其它通道不受影响
+    done = threading.Event()
+    producer = threading.Thread(target=lambda: (queue.put(task('second')), done.set()))
+    producer.start()
+
+    assert not done.wait(0.2)
+    assert queue.get(timeout=0).url == 'other-lane'
+    assert not done.wait(0.2)
+    assert queue.get(timeout=0).url == 'first'
+    assert done.wait(2)
+    producer.join()
+
+
+def test_stopped_queue_releases_blocked_producer():
+    queue = sync.TaskQueue(max_size=1)
+    queue.put(task('first'))
+    results = []
+    producer = threading.Thread(target=lambda: results.append(queue.put(task('second'))))
+    producer.start()
+    queue.stop()
+    producer.join(timeout=3)
+    assert results == [False]
+
+
+def test_scheduler_runs_tasks_and_callbacks():
+    results = {}
+    scheduler = sync.TaskScheduler(sync.TaskQueue(), lambda t: t.url.upper(), workers=3)
+    for url in ('a', 'b', 'c'):
+        scheduler.submit(task(url, callback=lambda t, result: results.__setitem__(t.url, result)))
+    scheduler.wait_idle()
+    scheduler.stop()
+    assert results == {'a': 'A', 'b': 'B', 'c': 'C'}
+
+
+def test_scheduler_defers_work_once_budget_expires():
+    expired = threading.Event()
+    results = []
+    scheduler = sync.TaskScheduler(sync.TaskQueue(), lambda t: t.url, workers=1, is_expired=expired.is_set)
+    scheduler.submit(task('done', callback=lambda t, result: results.append(result)))
+    scheduler.wait_idle()
+    expired.set()
+
+    assert not scheduler.submit(task('late'))
+    scheduler.stop()
+    assert results == ['done']
+    assert scheduler.deferred == 1
+
+
+def test_stop_without_drain_finishes_pending_tasks_empty():
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def handler(t):
+        started.set()
+        release.wait(5)
+        return t.url
+
+    scheduler = sync.TaskScheduler(sync.TaskQueue(), handler, workers=1)
+    for url in ('running', 'pending-1', 'pending-2'):
+        scheduler.submit(task(url, callback=lambda t, result: results.append((t.url, result))))
+    assert started.wait(2)
+    stopper = threading.Thread(target=scheduler.stop, kwargs={'drain': False})
+    stopper.start()
+    while any(scheduler.task_queue.sizes().values()):  # 未开始的任务已被放弃后再放行正在执行的任务
+        time.sleep(0.01)
+    release.set()
+    stopper.join(timeout=10)
+
+    assert sorted(results) == [('pending-1', None), ('pending-2', None), ('running', 'running')]
+
+
+class PendingRow:
+    def __init__(self, done=False):
+        self.done = threading.Event()
+        if done:
+            self.done.set()
+
+
+def test_flush_row_updates_keeps_at_most_the_limit():
+    rows = deque([PendingRow(done=True), PendingRow(done=True), PendingRow(), PendingRow()])
+    sync.SeaTableManager._flush_row_updates(rows, keep=2)
+    assert len(rows) == 2  # 已完成的行及时释放
+
+    rows[0].done.set()
+    rows[1].done.set()
+    sync.SeaTableManager._flush_row_updates(rows, keep=0)
+    assert not rows
@@ -0,0 +1,45 @@
+import pytest
+
+from conftest import sync
+
+
+@pytest.mark.parametrize('header, ext', [
+    (b'\xff\xd8\xff\xe0\x00\x10JFIF', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR', '.png'),
+    (b'GIF89a\x01\x00\x01\x00', '.gif'),
+    (b'RIFF\x24\x00\x00\x00WEBPVP8 ', '.webp'),
+])
+def test_sniff_recognizes_image_magic_bytes(header, ext):
+    assert sync.ImageProcessor.sniff_image_type(header)[0] == ext
+
+
+@pytest.mark.parametrize('header', [b'', b'<!DOCTYPE html><html>', b'%PDF-1.7\n', b'RIFF\x24\x00\x00\x00WAVEfmt '])
+def test_sniff_rejects_non_images(header):
+    assert sync.ImageProcessor.sniff_image_type(header) is None
+
+
+@pytest.fixture
+def sniff_cache(monkeypatch):
+    monkeypatch.setattr(sync.ImageProcessor, '_sniff_cache', sync.OrderedDict())
+    return sync.ImageProcessor
+
+
+def test_sniffed_type_overrides_url_extension(sniff_cache):
+    sniff_cache.cache_sniff_result('https://example.com/a.jpg', ('.png', 'image/png'))
+    sniff_cache.cache_sniff_result('https://example.com/b.png', None)
+
+    assert sniff_cache.get_file_extension('https://example.com/a.jpg') == '.png'
+    assert not sniff_cache.is_valid_image_url('https://example.com/b.png')
+    assert sniff_cache.is_valid_image_url('https://example.com/c.webp')  # 未识别时按扩展名判断
+
+
+def test_sniff_cache_is_bounded(sniff_cache, monkeypatch):
+    monkeypatch.setattr(sync, 'SNIFF_CACHE_SIZE', 2)
+    sniff_cache.cache_sniff_result('a', ('.png', 'image/png'))
+    sniff_cache.cache_sniff_result('b', None)
+    sniff_cache.get_sniff_result('a')
+    sniff_cache.cache_sniff_result('c', None)
+
+    assert list(sniff_cache._sniff_cache) == ['a', 'c']
+    assert sniff_cache.is_known_non_image('c')
+    assert not sniff_cache.is_known_non_image('b')
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from conftest import FakeManager, sync
+
+ASSET_ROOT = 'https://cloud.seatable.io/workspace/1/asset/images'
+TABLES = ['商品', '素材', '订单', '封面']
+ROWS = 6
+
+
+@pytest.fixture
+def manager(context, base, monkeypatch):
+    base.tables = {table: [{'_id': f'{table}-{i}', '图片': [f'{ASSET_ROOT}/{table}-{i}.png']} for i in range(ROWS)]
+                   for table in TABLES}
+
+    def process_image(self, url):
+        time.sleep(0.01)  # 让不同表格的任务有机会交错
+        index = int(url.rsplit('-', 1)[1].split('.')[0])
+        if index % 3 == 0:
+            raise Exception(f'上传失败，状态码: 500 ({url})')
+        if index % 3 == 1:
+            return None
+        return url.replace(ASSET_ROOT, 'https://bed')
+    monkeypatch.setattr(FakeManager, 'process_image', process_image)
+    manager = context.create_manager('token', '示例')
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def active_tables(monkeypatch):
+    """记录同时在处理的表格数峰值"""
+    state = {'active': 0, 'peak': 0}
+    lock = threading.Lock()
+    process_table = FakeManager.process_table
+
+    def tracked(self, table_name):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        try:
+            time.sleep(0.05)  # 保证并发度能达到上限
+            process_table(self, table_name)
+        finally:
+            with lock:
+                state['active'] -= 1
+    monkeypatch.setattr(FakeManager, 'process_table', tracked)
+    return state
+
+
+@pytest.mark.parametrize('max_workers', [2, 3])
+def test_tables_run_concurrently_within_limit(manager, active_tables, max_workers):
+    manager.process_tables(TABLES, max_workers=max_workers)
+    assert active_tables['peak'] == max_workers
+
+
+def test_counters_roll_up_exactly_across_tables(manager, base, active_tables):
+    manager.process_tables(TABLES, max_workers=3)
+    logs = manager.processing_logs
+
+    per_table = ROWS // 3
+    assert set(logs['bases']['示例']['tables']) == set(TABLES)
+    for table in TABLES:
+        table_stats = logs['bases']['示例']['tables'][table]
+        assert (table_stats['total_rows'], table_stats['success_count'], table_stats['failure_count']) == (
+            ROWS, per_table, 2 * per_table)
+        assert [row['图片'][0].startswith('https://bed/') for row in base.tables[table]] == [
+            i % 3 == 2 for i in range(ROWS)]
+
+    assert logs['success_count'] == per_table * len(TABLES)
+    assert logs['failure_count'] == 2 * per_table * len(TABLES)
+    assert logs['failure_reasons'] == {
+        '上传失败，状态码: 500 (…': per_table * len(TABLES),
+        '下载或上传失败': per_table * len(TABLES),
+    }
+    assert sum(logs['failure_reasons'].values()) == logs['failure_count']
+    assert len(manager.image_history.get_failed_records()) == logs['failure_count']
+
+
+def test_tables_are_not_started_after_budget_expires(manager, active_tables):
+    manager.scope.expire()
+    manager.process_tables(TABLES, max_workers=2)
+    assert active_tables['peak'] == 0
+    assert manager.processing_logs['bases'] == {}
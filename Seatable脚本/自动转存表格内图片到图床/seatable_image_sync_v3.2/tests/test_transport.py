@@ -0,0 +1,167 @@
+import inspect
+from http.server import BaseHTTPRequestHandler
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from conftest import sync
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 保持长连接
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def transport():
+    transport = sync.HttpTransport(default_pool_size=2)
+    yield transport
+    transport.close()
+
+
+def test_requests_reuse_pooled_connections(transport, http_server):
+    url = http_server(OkHandler)
+    for _ in range(5):
+        assert transport.session.get(url + '/a').text == 'ok'
+
+    snapshot = transport.snapshot()
+    assert snapshot['requests'] == 5
+    assert snapshot['connections'] == 1
+    assert snapshot['reuse_rate'] == 0.8
+    assert snapshot['hosts'][transport.host_prefix(url)] == {'requests': 5, 'connections': 1}
+
+
+def test_configure_only_grows_pool(transport):
+    prefix = 'http://example.com/'
+    transport.configure(prefix, 2)
+    small = transport.adapter_for(prefix + 'x')
+    transport.configure(prefix, 8)
+    grown = transport.adapter_for(prefix + 'x')
+    assert grown is not small
+    assert grown._pool_maxsize == 8
+
+    transport.configure(prefix, 4)  # 不会缩小
+    assert transport.adapter_for(prefix + 'x') is grown
+
+
+def test_longest_prefix_wins(transport):
+    transport.configure('http://example.com/', 2)
+    transport.configure('http://example.com/dtable-db/', 6)
+    assert transport.adapter_for('http://example.com/dtable-db/api/v1/query')._pool_maxsize == 6
+    assert transport.adapter_for('http://example.com/api/v2.1/')._pool_maxsize == 2
+
+
+def test_unsupported_urllib3_falls_back_to_stock_adapter(http_server):
+    transport = sync.HttpTransport(dns_cache=False)
+    url = http_server(OkHandler) + '/'
+    assert transport.session.get(url).text == 'ok'
+    assert type(transport.adapter_for(url)) is sync.HTTPAdapter
+    assert transport.snapshot()['dns_misses'] == 0
+    transport.close()
+
+
+@pytest.mark.skipif(not sync.DNS_CACHE_SUPPORTED, reason='当前urllib3不支持DNS缓存')
+def test_dns_cache_is_used_for_new_connections(transport, http_server):
+    url = http_server(OkHandler).replace('127.0.0.1', 'localhost') + '/'
+    assert transport.session.get(url).text == 'ok'
+    assert isinstance(transport.adapter_for(url), sync.DnsCachedAdapter)
+    assert transport.snapshot()['dns_misses'] == 1
+
+
+def test_dns_cache_expires_and_evicts(monkeypatch):
+    lookups = []
+
+    def getaddrinfo(host, port, *args):
+        lookups.append(host)
+        return [(None, None, None, '', ('10.0.0.1', port))]
+    monkeypatch.setattr(sync.socket, 'getaddrinfo', getaddrinfo)
+    now = [100.0]
+    monkeypatch.setattr(sync.time, 'monotonic', lambda: now[0])
+
+    cache = sync.DnsCache(ttl=60, max_entries=2)
+    assert cache.resolve('A.example', 80) == ['10.0.0.1']
+    assert cache.resolve('a.example', 80) == ['10.0.0.1']  # 主机名不区分大小写
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    now[0] += 61
+    cache.resolve('a.example', 80)
+    assert cache.misses == 2
+
+    cache.resolve('b.example', 80)
+    cache.resolve('c.example', 80)  # 超出条目数时淘汰最久未用的 a
+    cache.resolve('a.example', 80)
+    assert lookups == ['A.example', 'a.example', 'b.example', 'c.example', 'a.example']
+
+
+def test_dns_cache_returns_empty_list_on_failure(monkeypatch):
+    def getaddrinfo(*args):
+        raise OSError('no such host')
+    monkeypatch.setattr(sync.socket, 'getaddrinfo', getaddrinfo)
+    assert sync.DnsCache().resolve('missing.example', 80) == []
+
+
+class ThrottledClient:
+    def __init__(self, status):
+        self.status = status
+
+    def list_rows(self, table_name):
+        raise ConnectionError(self.status, 'busy')
+
+
+@pytest.mark.parametrize('status,notified', [(429, [429]), (503, [503]), (404, [])])
+def test_metered_client_reports_throttling(status, notified):
+    calls, statuses = [], []
+    client = sync.MeteredClient(ThrottledClient(status), on_call=calls.append, on_status=statuses.append)
+    with pytest.raises(ConnectionError):
+        client.list_rows('素材')
+    assert calls == ['list_rows']
+    assert statuses == notified
+
+
+def test_client_pool_wraps_clients_for_throttle_feedback():
+    statuses = []
+    pool = sync.SeaTableClientPool(ThrottledClient(429), 2, on_status=statuses.append)
+    with pytest.raises(ConnectionError):
+        pool.client.list_rows('素材')
+    assert statuses == [429]
+
+
+def test_sdk_session_is_mounted_on_shared_transport(config, monkeypatch):
+    class SessionBase:
+        def __init__(self, token, server_url):
+            self.session = requests.Session()
+
+        def auth(self):
+            pass
+    monkeypatch.setattr(sync, 'Base', SessionBase)
+
+    base = sync.SeaTableManager._init_base(SimpleNamespace(config=config, api_token='token'))
+    adapter = base.session.get_adapter('https://cloud.seatable.io/api/')
+    assert isinstance(adapter, sync.TransportRouter)
+    assert adapter.transport is sync.http_transport
+
+
+def test_dns_cache_is_pinned_to_checked_urllib3_range():
+    # 覆盖的内部钩子只在 urllib3 2.x 上核对过，放宽范围前需要重新核对下面的签名
+    assert sync.DNS_CACHE_URLLIB3 == ((2, 0), (3, 0))
+    in_range = sync.DNS_CACHE_URLLIB3[0] <= sync.URLLIB3_VERSION < sync.DNS_CACHE_URLLIB3[1]
+    assert sync.DNS_CACHE_SUPPORTED is in_range
+
+
+@pytest.mark.skipif(not sync.DNS_CACHE_SUPPORTED, reason='当前urllib3不支持DNS缓存')
+def test_urllib3_hooks_match_overrides():
+    assert list(inspect.signature(sync.PoolManager._new_pool).parameters) == [
+        'self', 'scheme', 'host', 'port', 'request_context']
+    assert list(inspect.signature(sync.HTTPConnection._new_conn).parameters) == ['self']
+    assert list(inspect.signature(sync.HTTPAdapter.init_poolmanager).parameters) == [
+        'self', 'connections', 'maxsize', 'block', 'pool_kwargs']
+    assert sync.HTTPConnection('example.com')._dns_host == 'example.com'
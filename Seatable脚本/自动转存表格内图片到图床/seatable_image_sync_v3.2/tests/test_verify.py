@@ -0,0 +1,102 @@
+import threading
+from http.server import BaseHTTPRequestHandler
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import sync
+
+
+class ImageHostHandler(BaseHTTPRequestHandler):
+    """/ok 开头的链接可访问，其余返回404；记录每次请求的路径和Range头"""
+    protocol_version = 'HTTP/1.1'
+    seen = []
+
+    def do_GET(self):
+        type(self).seen.append((self.path, self.headers.get('Range')))
+        status = 206 if self.path.startswith('/ok') else 404
+        self.send_response(status)
+        self.send_header('Content-Length', '1')
+        self.end_headers()
+        self.wfile.write(b'x')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def host(http_server):
+    ImageHostHandler.seen = []
+    return http_server(ImageHostHandler)
+
+
+def test_verify_checks_with_single_byte_range(host):
+    verifier = sync.UploadVerifier(sample_rate=1.0, workers=2, timeout=5)
+    results = verifier.verify_all([host + '/ok/1.png', host + '/missing.png'])
+    assert results == {host + '/ok/1.png': True, host + '/missing.png': False}
+    assert {range_header for _, range_header in ImageHostHandler.seen} == {'bytes=0-0'}
+    assert verifier.snapshot() == {'checked': 2, 'failed': 1, 'sampled_out': 0}
+
+
+def test_each_url_is_checked_once(host):
+    verifier = sync.UploadVerifier(sample_rate=1.0, workers=2, timeout=5)
+    for _ in range(3):
+        verifier.verify_all([host + '/ok/1.png', host + '/ok/1.png'])
+    assert len(ImageHostHandler.seen) == 1
+
+
+
+def test_results_are_bounded_least_recently_used_first(host):
+    verifier = sync.UploadVerifier(sample_rate=1.0, workers=2, timeout=5, cache_size=2)
+    verifier.verify_all([host + '/ok/1.png'])
+    verifier.verify_all([host + '/ok/2.png'])
+    verifier.verify_all([host + '/ok/1.png'])  # 命中缓存并变为最近使用
+    verifier.verify_all([host + '/ok/3.png'])  # 淘汰 2
+    assert list(verifier._results) == [host + '/ok/1.png', host + '/ok/3.png']
+    verifier.verify_all([host + '/ok/2.png'])
+    assert [path for path, _ in ImageHostHandler.seen] == ['/ok/1.png', '/ok/2.png', '/ok/3.png', '/ok/2.png']
+
+def test_sampled_out_urls_pass_until_forced(host, monkeypatch):
+    monkeypatch.setattr(sync.random, 'random', lambda: 0.9)
+    verifier = sync.UploadVerifier(sample_rate=0.5, workers=2, timeout=5)
+    assert verifier.verify_all([host + '/missing.png']) == {host + '/missing.png': True}
+    assert ImageHostHandler.seen == []
+
+    assert verifier.verify_all([host + '/missing.png'], force=True) == {host + '/missing.png': False}
+    assert verifier.snapshot() == {'checked': 1, 'failed': 1, 'sampled_out': 1}
+
+
+def test_sampling_rate_controls_how_many_urls_are_checked(host, monkeypatch):
+    draws = iter([0.1, 0.6, 0.3, 0.8])
+    monkeypatch.setattr(sync.random, 'random', lambda: next(draws))
+    verifier = sync.UploadVerifier(sample_rate=0.5, workers=2, timeout=5)
+    for index in range(4):
+        verifier.submit(f'{host}/ok/{index}.png').result()
+    assert verifier.snapshot() == {'checked': 2, 'failed': 0, 'sampled_out': 2}
+
+
+def test_when_verified_calls_back_once_with_all_results(host):
+    verifier = sync.UploadVerifier(sample_rate=1.0, workers=2, timeout=5)
+    results, done = [], threading.Event()
+    verifier.when_verified([host + '/ok/1.png', host + '/bad.png'],
+                           lambda result: (results.append(result), done.set()))
+    assert done.wait(5)
+    assert results == [{host + '/ok/1.png': True, host + '/bad.png': False}]
+
+
+def test_row_write_waits_for_verification(host):
+    verifier = sync.UploadVerifier(sample_rate=1.0, workers=2, timeout=5)
+    commits, rejected = [], []
+    manager = SimpleNamespace(
+        verifier=verifier, reclaimer=None,
+        commit_row=lambda table, row_id, column, images, info: commits.append(list(images)) or True,
+        reject_upload=lambda task, new_url: rejected.append(new_url))
+    images = ['https://a/1.png', 'https://a/2.png']
+    update = sync.RowUpdate(manager, '素材', '图片', 'r1', 'r1', images)
+
+    update.complete(0, host + '/ok/1.png')
+    update.complete(1, host + '/bad.png')
+    assert update.done.wait(5)
+    # 校验失败的图片保留原图，其余回写新链接
+    assert commits == [[host + '/ok/1.png', 'https://a/2.png']]
+    assert rejected == [host + '/bad.png']